@@ -0,0 +1,166 @@
+""" Buffered writer to save the rows of the session tables in batches.
+"""
+
+# django imports
+from django.db import close_old_connections, transaction
+
+# background flush
+import atexit
+import threading
+
+# logging
+import logging
+
+
+class BufferedWriter:
+    """Buffer of model instances saved with bulk_create by a background thread.
+
+    The buffer is flushed when it has max_batch_size instances or every flush_interval seconds, and drained when the process exits.
+    If the database is slower than the inserts and the buffer reaches max_buffer_size, the instance is saved by the caller with the buffer.
+    A batch that fails is requeued for the next flush, after max_retries failures its instances are saved one by one.
+    """
+
+    def __init__(self, using=None, max_batch_size=100, flush_interval=1.0, max_buffer_size=10000, max_retries=3):
+        """Initialize the writer.
+
+        Args:
+            using (str): Database alias. None to use the router.
+            max_batch_size (int): Instances to flush the buffer and max instances of each INSERT.
+            flush_interval (float): Max seconds of an instance on the buffer.
+            max_buffer_size (int): Max instances on the buffer before the callers flush it.
+            max_retries (int): Failed flushes of an instance before it is saved one by one.
+        """
+        self.using = using
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+        self.max_buffer_size = max_buffer_size
+        self.max_retries = max_retries
+        self._buffer = []
+        # instances of the running flush, still pending for is_pending
+        self._flushing = []
+        # failed flushes by id of the requeued instances
+        self._failures = {}
+        self._condition = threading.Condition()
+        # only one flush at the same time to keep the insert order
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._closed = False
+
+    def _start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name="graphbox_writer", daemon=True
+            )
+            self._thread.start()
+            atexit.register(self.close)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                if not self._closed and len(self._buffer) < self.max_batch_size:
+                    self._condition.wait(self.flush_interval)
+                closed = self._closed
+            self.flush()
+            close_old_connections()
+            if closed:
+                return
+
+    def add(self, instance):
+        """Add an unsaved model instance to the buffer."""
+        with self._condition:
+            if self._closed:
+                closed = True
+            else:
+                closed = False
+                self._start()
+                self._buffer.append(instance)
+                buffer_size = len(self._buffer)
+                if buffer_size >= self.max_batch_size:
+                    self._condition.notify()
+        if closed:
+            instance.save(using=self.using)
+        elif buffer_size >= self.max_buffer_size:
+            self.flush()
+
+    def get_pending(self, model, **fields):
+        """Get the instances of a model with the values of fields waiting on the buffer.
+
+        An instance is pending until the end of its flush, so a reader can find it on the buffer and on the database at the same time.
+        """
+        with self._condition:
+            pending = self._buffer + self._flushing
+        return [
+            instance
+            for instance in pending
+            if isinstance(instance, model)
+            and all(getattr(instance, name) == value for name, value in fields.items())
+        ]
+
+    def is_pending(self, model, **fields):
+        """Validate if an instance of a model with the values of fields is waiting on the buffer."""
+        return len(self.get_pending(model, **fields)) > 0
+
+    def _save_rows(self, model, instances):
+        """Save the instances one by one, a row that fails doesn't discard the others."""
+        for instance in instances:
+            try:
+                instance.save(using=self.using)
+            except Exception as e:
+                logging.error(
+                    f"Unable to save a {model.__name__} row of the buffered writer: {e}"
+                )
+
+    def flush(self):
+        """Save the instances of the buffer with a bulk_create by model."""
+        with self._flush_lock:
+            with self._condition:
+                pending = self._buffer
+                self._buffer = []
+                self._flushing = pending
+            instances_by_model = {}
+            for instance in pending:
+                instances_by_model.setdefault(instance.__class__, []).append(instance)
+            requeued = []
+            for model, instances in instances_by_model.items():
+                try:
+                    # all the batches or none, a requeued instance can't be saved twice
+                    with transaction.atomic(using=self.using):
+                        model.objects.using(self.using).bulk_create(
+                            instances, batch_size=self.max_batch_size
+                        )
+                except Exception as e:
+                    retry = []
+                    exhausted = []
+                    for instance in instances:
+                        failures = self._failures.pop(id(instance), 0) + 1
+                        if failures < self.max_retries:
+                            self._failures[id(instance)] = failures
+                            retry.append(instance)
+                        else:
+                            exhausted.append(instance)
+                    logging.warning(
+                        f"WARNING: Unable to save {len(instances)} {model.__name__} rows of the buffered writer, {len(retry)} rows requeued: {e}"
+                    )
+                    requeued += retry
+                    self._save_rows(model, exhausted)
+                else:
+                    for instance in instances:
+                        self._failures.pop(id(instance), None)
+            with self._condition:
+                self._buffer = requeued + self._buffer
+                self._flushing = []
+
+    def close(self):
+        """Stop the background thread and save the instances of the buffer."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+            thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(max(self.flush_interval, 1) * 5)
+        # the requeued instances are saved one by one on the last flush
+        for _ in range(self.max_retries):
+            self.flush()
+            with self._condition:
+                if len(self._buffer) == 0:
+                    return
@@ -12,20 +12,59 @@ from .constants import *
 from .helpers.mutations import *
 from .helpers.queries import *
 from .helpers.sessions import *
+from .helpers.indexes import advise_model_indexes
+from .helpers.relations import build_nested_list_attrs
+from .helpers.cache import get_cache_config, connect_cache_invalidation
+from .cost import QueryCostLimit
+from .execution import build_parallel_execution_context
+from .helpers.async_resolvers import *
+
+# django version for the async ORM
+import django
+
+# builders registry
+import weakref
+
+# logging
+import logging
 
 
 class SchemaBuilder:
     """Class provides the functionality to build a GraphQL schema with basic operations: field_by_id, list_field, create_field, update_field and delete_field."""
 
-    def __init__(self, session_manager=None):
+    _instances = weakref.WeakSet()
+
+    def __init__(
+        self,
+        session_manager=None,
+        index_advisor=False,
+        read_database=None,
+        write_database="default",
+        sticky_primary_seconds=0,
+        async_resolvers=False,
+    ):
         """Initialize the schema builder.
 
         Args:
             session_manager (SessionManager): Session manager to use.
+            index_advisor (bool): If True, build_schema_query logs a warning for each filter or ordering field that will scan the table.
+            read_database (str or callable): Database alias or callable(info, model) returning the alias for the query operations. None to use the django database routers.
+            write_database (str): Database alias used by the query operations of a request after a mutation.
+            sticky_primary_seconds (int): Seconds the client keeps reading from write_database after a mutation. 0 to stick only on the same request.
+            async_resolvers (bool): If True, the resolvers and mutations are async and use the async ORM of Django, for ASGI deployments with AsyncGraphboxGraphQLView. Sync validators and callbacks run on a worker thread.
         """
+        if async_resolvers and django.VERSION < (4, 1):
+            raise Exception("async_resolvers requires Django>=4.1")
         self._models_config = {}
         self._models_by_op_name = {}
+        self._query_op_names = set()
         self._session_manager = session_manager
+        self._index_advisor = index_advisor
+        self._read_database = read_database
+        self._write_database = write_database
+        self._sticky_primary_seconds = sticky_primary_seconds
+        self._async_resolvers = async_resolvers
+        SchemaBuilder._instances.add(self)
 
     def add_model(
         self,
@@ -45,6 +84,15 @@ class SchemaBuilder:
         callbacks_by_operation={},
         custom_attrs_for_type=[],
         ordering_field="id",
+        order_by_fields=[],
+        sync_field=None,
+        sync_margin=5,
+        aggregations={},
+        facets=False,
+        annotations=[],
+        nested_lists=[],
+        cache=None,
+        cost_weight=1,
         operations_to_build=[
             "field_by_id",
             "list_field",
@@ -72,34 +120,97 @@ class SchemaBuilder:
             callbacks_by_operation (dict): Dictionary with the callbacks list to use for the access. {'operation': [callable(info, model_instance, **kwargs)], ...}
             custom_attrs_for_type (list): List of custom attributes to add to the model type. [{'name': 'attr_name', 'value': 'attr_value'}, ...]
             ordering_field (str, tuple or list): Field or fields to use for ordering the list_field operation.
+            order_by_fields (list): Fields the client can use on the order_by argument of the list_field operation. Each item is the field name or a dict {'field_name': str, 'allow_unindexed': bool}. Only indexed fields are allowed unless allow_unindexed is True.
+            sync_field (str): DateTime field updated on every change of the model, like an updated_at field with auto_now=True. If defined, the <model>_changes query is built and deletions are recorded as tombstones.
+            sync_margin (int): Seconds the watermark of the <model>_changes query goes back from the query time, for the rows saved before the query but committed after it. The changes of the margin are returned again on the next sync, so the clients must apply them by id. Defaults to 5.
+            aggregations (dict): Aggregations to build the <model>_aggregate query. {'fields': ['numeric_field', ...], 'functions': ['count', 'sum', 'avg', 'min', 'max'], 'group_by': ['field', ...]}. functions and group_by are optional.
+            facets (bool): If True, the external filters on fields with choices build the <model>_facets query and the facets field of the paginated type with the count of items by option.
+            annotations (list): Computed fields resolved on the database. [{'name': 'field_name', 'expression': Count('related'), 'type': graphene.Int}, ...]. The expressions are applied with annotate on field_by_id and list_field only when the client selects them. type is optional.
+            nested_lists (list): Bounded lists for reverse relations on the model type with first and offset arguments. [{'relation': 'related_name', 'name': 'field_name', 'max_length': 20, 'ordering': 'pk'}, ...]. The lists of all the parents of list_field are loaded in one query with a ROW_NUMBER() window, so they require Django>=4.2. The reverse relation is removed from the model type when the nested list has another name.
+            cache (bool or dict): Cache the results of field_by_id and list_field on a django cache backend. True for defaults or {'timeout': 60, 'cache_alias': 'default', 'depends_on': [RelatedModel, ...]}. The results are invalidated on save and delete of the model or the depends_on models, including the generated mutations.
+            cost_weight (int): Cost of each item of the model type for the query cost limit.
             operations_to_build (list): List of operations to build. Possible values are 'field_by_id', 'list_field', 'create_field', 'update_field' and 'delete_field'.
         """
         # get the model name
         model_name = model.__name__
         # crreate the model type
+        nested_list_attrs, nested_list_configs = build_nested_list_attrs(
+            model, nested_lists, self._async_resolvers
+        )
+        # the unbounded reverse relations of the nested lists with other name are not exposed
+        exclude_fields = tuple(exclude_fields) + tuple(
+            nested_config["accessor_name"]
+            for nested_config in nested_list_configs
+            if nested_config["accessor_name"] != nested_config["name"]
+            and nested_config["accessor_name"] not in exclude_fields
+        )
         model_metaclass = type(
             f"Meta", (), {"model": model, "exclude_fields": exclude_fields}
         )
         type_attrs = {"Meta": model_metaclass}
         for attr in custom_attrs_for_type:
             type_attrs[attr["name"]] = attr["value"]
+        type_attrs.update(
+            build_annotation_attrs(model, annotations, self._async_resolvers)
+        )
+        type_attrs.update(nested_list_attrs)
         model_type = type(f"{model_name}Type", (DjangoObjectType,), type_attrs)
+        # create facets type
+        if facets:
+            facets_type = build_facets_type(
+                model,
+                get_facet_fields(model, external_filters),
+                async_resolvers=self._async_resolvers,
+            )
+        else:
+            facets_type = None
         # create paginated type
         if pagination_length > 0 and pagination_style == "paginated":
+            paginated_attrs = {
+                "items": graphene.List(model_type),
+                "page": graphene.Int(),
+                "has_next_page": graphene.Boolean(),
+                "has_previous_page": graphene.Boolean(),
+                "total_pages": graphene.Int(),
+                "total_items": graphene.Int(),
+            }
+            if facets_type is not None:
+                paginated_attrs["facets"] = graphene.Field(facets_type)
             paginated_type = type(
                 f"{model_name}PageType",
                 (graphene.ObjectType,),
+                paginated_attrs,
+            )
+        else:
+            paginated_type = None
+        # create changes type for delta sync
+        if sync_field is not None:
+            changes_type = type(
+                f"{model_name}ChangesType",
+                (graphene.ObjectType,),
                 {
                     "items": graphene.List(model_type),
-                    "page": graphene.Int(),
-                    "has_next_page": graphene.Boolean(),
-                    "has_previous_page": graphene.Boolean(),
-                    "total_pages": graphene.Int(),
-                    "total_items": graphene.Int(),
+                    "deleted_ids": graphene.List(graphene.ID),
+                    "watermark": graphene.DateTime(),
                 },
             )
         else:
-            paginated_type = None
+            changes_type = None
+        # create aggregate types
+        aggregate_type, aggregate_group_by_enum = build_aggregate_types(
+            model, aggregations
+        )
+        # cache invalidation by signals
+        cache_config = get_cache_config(cache)
+        if cache_config is not None:
+            connect_cache_invalidation(model, cache_config)
+        # compile filters and ordering once for all the requests
+        filter_plan = FilterPlan(external_filters, internal_filters, filters_opeator)
+        if type(ordering_field) in [list, tuple]:
+            ordering_fields = tuple(ordering_field)
+        else:
+            ordering_fields = (ordering_field,)
+        order_by_enum = build_order_by_enum(model, order_by_fields)
         # make a new model config
         config = {
             "model": model,
@@ -111,6 +222,7 @@ class SchemaBuilder:
             "external_filters": external_filters,
             "internal_filters": internal_filters,
             "filters_operator": filters_opeator,
+            "filter_plan": filter_plan,
             "access_group": access_group,
             "access_by_operation": access_by_operation,
             "validators_by_operation": validators_by_operation,
@@ -119,24 +231,97 @@ class SchemaBuilder:
             "save_as_password": save_as_password,
             "callbacks_by_operation": callbacks_by_operation,
             "ordering_field": ordering_field,
+            "ordering_fields": ordering_fields,
+            "order_by_enum": order_by_enum,
+            "sync_field": sync_field,
+            "sync_margin": sync_margin,
+            "changes_type": changes_type,
+            "aggregations": aggregations,
+            "aggregate_type": aggregate_type,
+            "aggregate_group_by_enum": aggregate_group_by_enum,
+            "facets_type": facets_type,
+            "annotations": annotations,
+            "nested_lists": nested_list_configs,
+            "cache": cache_config,
+            "cost_weight": cost_weight,
             "operations_to_build": operations_to_build,
         }
         self._models_config[model_name] = config
 
+    def advise_indexes(self, explain=False):
+        """Inspect the filters and ordering fields of the list_field operations against the model indexes.
+
+        Args:
+            explain (bool): If True, the explain output of the database is used to detect scans.
+
+        Returns:
+            list: Report entries as returned by helpers.indexes.advise_model_indexes.
+        """
+        report = []
+        for model_config in self._models_config.values():
+            if "list_field" in model_config.get("operations_to_build", []):
+                report += advise_model_indexes(model_config, explain=explain)
+        return report
+
+    def build_query_cost_limit(
+        self, max_depth=None, max_cost=None, budgets_by_group={}, default_list_size=100
+    ):
+        """Build the depth and cost limit of the documents for the added models.
+
+        Args:
+            max_depth (int): Max depth of the documents. None for no limit.
+            max_cost (int): Max cost of the documents. None for no limit.
+            budgets_by_group (dict): Budgets by access group. {'group_name': {'max_depth': int, 'max_cost': int}, ...}
+            default_list_size (int): Length of the lists without pagination or max length.
+
+        Returns:
+            QueryCostLimit: Limit to use as query_cost of GraphboxGraphQLView or with its validation_rule() on any GraphQLView.
+        """
+        return QueryCostLimit(
+            self,
+            max_depth=max_depth,
+            max_cost=max_cost,
+            budgets_by_group=budgets_by_group,
+            default_list_size=default_list_size,
+        )
+
+    def build_parallel_execution_context(self, max_workers=4):
+        """Build an execution context class to run the root query fields built by build_schema_query in parallel.
+
+        Args:
+            max_workers (int): Size of the thread pool shared by all the requests.
+
+        Returns:
+            class: ExecutionContext class to use as execution_context_class of GraphQLView or graphene.Schema.execute.
+        """
+        return build_parallel_execution_context(self, max_workers=max_workers)
+
     def build_schema_query(self):
         """Build query class for the schema.
 
         Returns:
             graphene.ObjectType: Query class for the schema.
         """
+        if self._index_advisor:
+            for entry in self.advise_indexes():
+                if entry["scan"]:
+                    logging.warning(
+                        f"all_{entry['model'].lower()} {entry['kind']} '{entry['field_name']}' will scan the table. Suggestion: {entry['suggestion']}"
+                    )
         query_class = type("Query", (graphene.ObjectType,), {})
         for key in self._models_config.keys():
             model_config = self._models_config[key]
             object_name = model_config["name"].lower()
             # build field_by_id query
             if "field_by_id" in model_config["operations_to_build"]:
-                field_by_id_resolver_function = build_field_by_id_resolver(self)
+                if self._async_resolvers:
+                    field_by_id_resolver_function = build_async_field_by_id_resolver(
+                        self
+                    )
+                else:
+                    field_by_id_resolver_function = build_field_by_id_resolver(self)
                 self._models_by_op_name[object_name] = model_config
+                self._query_op_names.add(object_name)
                 setattr(
                     query_class,
                     object_name,
@@ -147,8 +332,12 @@ class SchemaBuilder:
                 )
             # build list_field query
             if "list_field" in model_config["operations_to_build"]:
-                field_list_resolver_function = build_field_list_resolver(self)
+                if self._async_resolvers:
+                    field_list_resolver_function = build_async_field_list_resolver(self)
+                else:
+                    field_list_resolver_function = build_field_list_resolver(self)
                 self._models_by_op_name["all" + object_name] = model_config
+                self._query_op_names.add("all" + object_name)
                 return_object = get_return_object(model_config)
                 setattr(query_class, f"all_{object_name}", return_object)
                 setattr(
@@ -156,6 +345,71 @@ class SchemaBuilder:
                     f"resolve_all_{object_name}",
                     field_list_resolver_function,
                 )
+            # build facets query
+            if model_config.get("facets_type") is not None:
+                facets_resolver_function = build_facets_resolver(self)
+                if self._async_resolvers:
+                    facets_resolver_function = to_async_resolver(
+                        facets_resolver_function
+                    )
+                self._models_by_op_name[object_name + "facets"] = model_config
+                self._query_op_names.add(object_name + "facets")
+                setattr(
+                    query_class,
+                    f"{object_name}_facets",
+                    graphene.Field(
+                        model_config["facets_type"], get_facets_args(model_config)
+                    ),
+                )
+                setattr(
+                    query_class,
+                    f"resolve_{object_name}_facets",
+                    facets_resolver_function,
+                )
+            # build aggregate query
+            if model_config.get("aggregate_type") is not None:
+                aggregate_resolver_function = build_aggregate_resolver(self)
+                if self._async_resolvers:
+                    # the aggregate rows are loaded by the resolver
+                    aggregate_resolver_function = to_async_resolver(
+                        aggregate_resolver_function
+                    )
+                self._models_by_op_name[object_name + "aggregate"] = model_config
+                self._query_op_names.add(object_name + "aggregate")
+                setattr(
+                    query_class,
+                    f"{object_name}_aggregate",
+                    graphene.List(
+                        model_config["aggregate_type"],
+                        get_aggregate_args(model_config),
+                    ),
+                )
+                setattr(
+                    query_class,
+                    f"resolve_{object_name}_aggregate",
+                    aggregate_resolver_function,
+                )
+            # build changes query for delta sync
+            if model_config.get("sync_field") is not None:
+                if self._async_resolvers:
+                    changes_resolver_function = build_async_changes_resolver(self)
+                else:
+                    changes_resolver_function = build_changes_resolver(self)
+                self._models_by_op_name[object_name + "changes"] = model_config
+                self._query_op_names.add(object_name + "changes")
+                setattr(
+                    query_class,
+                    f"{object_name}_changes",
+                    graphene.Field(
+                        model_config["changes_type"],
+                        since=graphene.DateTime(required=True),
+                    ),
+                )
+                setattr(
+                    query_class,
+                    f"resolve_{object_name}_changes",
+                    changes_resolver_function,
+                )
         return query_class
 
     def build_schema_mutation(self):
@@ -169,7 +423,10 @@ class SchemaBuilder:
             model_config = self._models_config[key]
             # create the create mutation
             if "create_field" in model_config["operations_to_build"]:
-                mutate_create_function = build_mutate_for_create(self)
+                if self._async_resolvers:
+                    mutate_create_function = build_async_mutate_for_create(self)
+                else:
+                    mutate_create_function = build_mutate_for_create(self)
                 # get fields to ignore on arguments
                 fields_to_ignore = get_fields_to_ignore(model_config, "create_field")
                 # build argumants class
@@ -199,7 +456,10 @@ class SchemaBuilder:
                 ] = model_config
             # create the update mutation
             if "update_field" in model_config["operations_to_build"]:
-                mutate_update_function = build_mutate_for_update(self)
+                if self._async_resolvers:
+                    mutate_update_function = build_async_mutate_for_update(self)
+                else:
+                    mutate_update_function = build_mutate_for_update(self)
                 # get fields to omit
                 fields_to_ignore = get_fields_to_ignore(model_config, "update_field")
                 # build argumants class
@@ -231,7 +491,10 @@ class SchemaBuilder:
                 ] = model_config
             # create the delete mutation
             if "delete_field" in model_config["operations_to_build"]:
-                mutate_delete_function = build_mutate_for_delete(self)
+                if self._async_resolvers:
+                    mutate_delete_function = build_async_mutate_for_delete(self)
+                else:
+                    mutate_delete_function = build_mutate_for_delete(self)
                 # build argumants class
                 delete_arguments = delete_arguments_class()
                 delete_mutation = type(
@@ -317,7 +580,10 @@ class SchemaBuilder:
                 self._session_manager.password_field_name,
                 graphene.String(required=True),
             )
-            login_mutate_function = build_mutate_for_login(self)
+            if self._async_resolvers:
+                login_mutate_function = build_async_mutate_for_login(self)
+            else:
+                login_mutate_function = build_mutate_for_login(self)
             login_mutation = type(
                 "Login",
                 (graphene.Mutation,),
@@ -346,6 +612,10 @@ class SchemaBuilder:
                     },
                 )
                 social_login_mutate_function = build_mutate_for_social_login(self)
+                if self._async_resolvers:
+                    social_login_mutate_function = to_async_resolver(
+                        social_login_mutate_function
+                    )
                 social_login_mutation = type(
                     "SocialLogin",
                     (graphene.Mutation,),
@@ -363,7 +633,10 @@ class SchemaBuilder:
                 setattr(mutation_class, "social_login", social_login_mutation.Field())
             query_class = type("Query", (graphene.ObjectType,), {})
             # build actual_user query
-            actual_user_function = build_actual_user_resolver(self)
+            if self._async_resolvers:
+                actual_user_function = build_async_actual_user_resolver(self)
+            else:
+                actual_user_function = build_actual_user_resolver(self)
             setattr(
                 query_class, "actual_user", graphene.Field(config_login_model["type"])
             )
@@ -372,6 +645,10 @@ class SchemaBuilder:
             # build generate captcha query
             if self._session_manager.use_captcha:
                 generate_captcha_function = build_captcha_resolver(self)
+                if self._async_resolvers:
+                    generate_captcha_function = to_async_resolver(
+                        generate_captcha_function
+                    )
                 setattr(
                     query_class,
                     "generate_captcha",
@@ -0,0 +1,292 @@
+""" Query depth and cost limits for the generated schemas.
+"""
+
+# graphene imports
+from graphene.utils.str_converters import to_camel_case
+
+# graphql imports
+from graphql import GraphQLError, get_named_type, get_nullable_type, is_list_type
+from graphql.validation import ValidationRule
+
+
+class QueryCostLimit:
+    """Compute the depth and cost of a document before the execution and reject the documents over the budget.
+
+    The cost of a field is the weight of its model type plus the cost of its children, multiplied by the max length of the list when the field returns a list.
+    The max length of the lists is the pagination_length of list_field, the max_length or first argument of the nested lists and default_list_size for the rest of the lists.
+    """
+
+    def __init__(
+        self,
+        builder,
+        max_depth=None,
+        max_cost=None,
+        budgets_by_group={},
+        default_list_size=100,
+    ):
+        """Initialize the cost limit with the models of the builder.
+
+        Args:
+            builder (SchemaBuilder): Builder with the models config.
+            max_depth (int): Max depth of the documents. None for no limit.
+            max_cost (int): Max cost of the documents. None for no limit.
+            budgets_by_group (dict): Budgets by access group of the session manager. {'group_name': {'max_depth': int, 'max_cost': int}, ...}. The first group of the user is used, other users use max_depth and max_cost.
+            default_list_size (int): Length of the lists without pagination or max length.
+        """
+        self.max_depth = max_depth
+        self.max_cost = max_cost
+        self.budgets_by_group = budgets_by_group
+        self.default_list_size = default_list_size
+        self.session_manager = builder._session_manager
+        # weights by model type name
+        self.type_weights = {}
+        # weights of the root fields by name
+        self.root_weights = {}
+        # max length of the lists by (parent type name, field name). parent None for the root fields
+        self.list_sizes = {}
+        for config in builder._models_config.values():
+            weight = config.get("cost_weight", 1)
+            type_name = config["type"]._meta.name
+            object_name = config["name"].lower()
+            self.type_weights[type_name] = weight
+            for field_name in [
+                object_name,
+                f"all_{object_name}",
+                f"{object_name}_facets",
+                f"{object_name}_aggregate",
+                f"{object_name}_changes",
+            ]:
+                self._set_field(self.root_weights, None, field_name, weight)
+            pagination_length = config.get("pagination_length", 0)
+            if pagination_length > 0:
+                if config.get("paginated_type") is not None:
+                    self._set_field(
+                        self.list_sizes,
+                        config["paginated_type"]._meta.name,
+                        "items",
+                        pagination_length,
+                    )
+                else:
+                    self._set_field(
+                        self.list_sizes, None, f"all_{object_name}", pagination_length
+                    )
+            for nested_config in config.get("nested_lists", []):
+                self._set_field(
+                    self.list_sizes,
+                    type_name,
+                    nested_config["name"],
+                    nested_config["max_length"],
+                )
+
+    @staticmethod
+    def _set_field(values, parent_name, field_name, value):
+        # the schema can use the snake or camel case names
+        values[(parent_name, field_name)] = value
+        values[(parent_name, to_camel_case(field_name))] = value
+
+    def get_budget(self, request=None):
+        """Get the (max_depth, max_cost) for the user of the request.
+
+        Args:
+            request (django.http.request.HttpRequest): Request to get the user with the session manager.
+        Returns:
+            tuple: (max_depth (int), max_cost (int))
+        """
+        if request is not None and self.budgets_by_group and self.session_manager is not None:
+            user_instance = None
+            if "Authorization" in request.headers:
+                status, user_instance, error = self.session_manager.validate_access(
+                    request, "all"
+                )
+            for group_name, budget in self.budgets_by_group.items():
+                if group_name == "open" or (
+                    user_instance is not None
+                    and self.session_manager.group_manager.validar_acesso(
+                        user_instance, group_name
+                    )
+                ):
+                    return (
+                        budget.get("max_depth", self.max_depth),
+                        budget.get("max_cost", self.max_cost),
+                    )
+        return self.max_depth, self.max_cost
+
+    def get_first_argument(self, field_node, variables):
+        """Get the value of the first argument of a field node or None."""
+        for argument in field_node.arguments or []:
+            if argument.name.value == "first":
+                value_node = argument.value
+                if value_node.__class__.__name__ in ["VariableNode", "Variable"]:
+                    return (variables or {}).get(value_node.name.value)
+                try:
+                    return int(value_node.value)
+                except (TypeError, ValueError):
+                    return None
+        return None
+
+    def compute_selection_set(
+        self,
+        schema,
+        parent_type,
+        selection_set,
+        fragments,
+        variables,
+        visited_fragments=(),
+    ):
+        """Compute the (depth, cost) of a selection set.
+
+        Args:
+            schema (graphql.GraphQLSchema): Schema of the document.
+            parent_type (graphql.GraphQLObjectType): Type of the selection set.
+            selection_set (graphql.SelectionSetNode): Selection set to compute.
+            fragments (dict): Fragment definitions of the document by name.
+            variables (dict): Variables of the request.
+            visited_fragments (tuple): Fragments on the actual path to ignore cycles.
+        Returns:
+            tuple: (depth (int), cost (int))
+        """
+        depth = 0
+        cost = 0
+        for selection in selection_set.selections:
+            kind = selection.__class__.__name__
+            if kind in ["FieldNode", "Field"]:
+                field_name = selection.name.value
+                if field_name.startswith("__"):
+                    continue
+                fields = getattr(parent_type, "fields", {})
+                if field_name not in fields:
+                    continue
+                field_type = fields[field_name].type
+                named_type = get_named_type(field_type)
+                parent_name = None if parent_type is schema.query_type else parent_type.name
+                if named_type.name in self.type_weights:
+                    weight = self.type_weights[named_type.name]
+                elif parent_name is None:
+                    # root fields of the models with other types like facets or aggregate
+                    weight = self.root_weights.get((None, field_name), 0)
+                else:
+                    weight = 0
+                if is_list_type(get_nullable_type(field_type)):
+                    size = self.list_sizes.get(
+                        (parent_name, field_name), self.default_list_size
+                    )
+                    first = self.get_first_argument(selection, variables)
+                    if first is not None and 0 <= first < size:
+                        size = first
+                else:
+                    size = 1
+                child_depth, child_cost = 0, 0
+                if selection.selection_set is not None:
+                    child_depth, child_cost = self.compute_selection_set(
+                        schema,
+                        named_type,
+                        selection.selection_set,
+                        fragments,
+                        variables,
+                        visited_fragments,
+                    )
+                depth = max(depth, child_depth + 1)
+                cost += size * (weight + child_cost)
+            else:
+                if kind in ["FragmentSpreadNode", "FragmentSpread"]:
+                    fragment_name = selection.name.value
+                    if fragment_name in visited_fragments or fragment_name not in fragments:
+                        continue
+                    fragment = fragments[fragment_name]
+                    visited = visited_fragments + (fragment_name,)
+                else:
+                    fragment = selection
+                    visited = visited_fragments
+                fragment_type = parent_type
+                if fragment.type_condition is not None:
+                    fragment_type = (
+                        schema.get_type(fragment.type_condition.name.value) or parent_type
+                    )
+                fragment_depth, fragment_cost = self.compute_selection_set(
+                    schema, fragment_type, fragment.selection_set, fragments, variables, visited
+                )
+                depth = max(depth, fragment_depth)
+                cost += fragment_cost
+        return depth, cost
+
+    def compute(self, schema, document, operation_name=None, variables=None):
+        """Compute the depth and cost of the operations of a document.
+
+        Args:
+            schema (graphql.GraphQLSchema): Schema of the document.
+            document (graphql.DocumentNode): Parsed document.
+            operation_name (str): Operation to compute. None to compute the most expensive operation.
+            variables (dict): Variables of the request.
+        Returns:
+            dict: {'depth': int, 'cost': int}
+        """
+        fragments = {}
+        operations = []
+        for definition in document.definitions:
+            kind = definition.__class__.__name__
+            if kind in ["FragmentDefinitionNode", "FragmentDefinition"]:
+                fragments[definition.name.value] = definition
+            elif kind in ["OperationDefinitionNode", "OperationDefinition"]:
+                operations.append(definition)
+        depth, cost = 0, 0
+        for operation in operations:
+            if operation_name is not None and (
+                operation.name is None or operation.name.value != operation_name
+            ):
+                continue
+            root_type = {
+                "query": schema.query_type,
+                "mutation": schema.mutation_type,
+                "subscription": schema.subscription_type,
+            }[operation.operation.value]
+            if root_type is None:
+                continue
+            operation_depth, operation_cost = self.compute_selection_set(
+                schema, root_type, operation.selection_set, fragments, variables
+            )
+            depth = max(depth, operation_depth)
+            cost = max(cost, operation_cost)
+        return {"depth": depth, "cost": cost}
+
+    def validate(self, schema, document, operation_name=None, variables=None, request=None):
+        """Compute the depth and cost of a document and validate them against the budget of the request.
+
+        Returns:
+            tuple: (cost_info (dict), errors (list)). cost_info is {'depth': int, 'cost': int, 'max_depth': int, 'max_cost': int}
+        """
+        max_depth, max_cost = self.get_budget(request)
+        cost_info = self.compute(schema, document, operation_name, variables)
+        cost_info["max_depth"] = max_depth
+        cost_info["max_cost"] = max_cost
+        errors = []
+        if max_depth is not None and cost_info["depth"] > max_depth:
+            errors.append(
+                GraphQLError(
+                    f"Query depth {cost_info['depth']} exceeds the maximum depth {max_depth}",
+                    extensions={"code": "QUERY_TOO_DEEP"},
+                )
+            )
+        if max_cost is not None and cost_info["cost"] > max_cost:
+            errors.append(
+                GraphQLError(
+                    f"Query cost {cost_info['cost']} exceeds the maximum cost {max_cost}",
+                    extensions={"code": "QUERY_TOO_COMPLEX"},
+                )
+            )
+        return cost_info, errors
+
+    def validation_rule(self):
+        """Build a validation rule with max_depth and max_cost for the validation_rules of any GraphQLView.
+
+        The budgets by group and the variables are not available on validation rules, use GraphboxGraphQLView with query_cost to apply them.
+        """
+        cost_limit = self
+
+        class QueryCostRule(ValidationRule):
+            def enter_document(self, node, *args):
+                cost_info, errors = cost_limit.validate(self.context.schema, node)
+                for error in errors:
+                    self.report_error(error)
+                return self.SKIP
+
+        return QueryCostRule
@@ -0,0 +1,138 @@
+""" LRU cache of parsed and validated GraphQL documents.
+"""
+
+# ordered dict for the lru
+from collections import OrderedDict
+
+# thread safety
+import threading
+
+# documents by schema
+import weakref
+
+# hashing
+import hashlib
+
+# graphql imports
+from graphql import parse
+from graphql.validation import validate
+
+
+class DocumentCache:
+    """Thread safe LRU of parsed and validated documents keyed by the sha256 hash of the query and the validation rules.
+
+    The documents are kept by schema, so a rebuilt schema never uses documents validated against the old one and the documents of the old schema are released with it.
+    The views with other validation rules sharing a cache get their own validation of the documents.
+    """
+
+    def __init__(self, max_size=500, max_query_length=100000):
+        """Initialize the document cache.
+
+        Args:
+            max_size (int): Max number of documents on the cache by schema.
+            max_query_length (int): Max length of the queries to cache. Longer queries are parsed and validated on every request.
+        """
+        self.max_size = max_size
+        self.max_query_length = max_query_length
+        self._documents = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def hash_query(query):
+        """Get the sha256 hex digest of a query."""
+        return hashlib.sha256(query.encode("utf-8")).hexdigest()
+
+    def clear(self):
+        """Remove all the documents of the cache."""
+        with self._lock:
+            self._documents = weakref.WeakKeyDictionary()
+
+    def stats(self):
+        """Get the metrics of the cache.
+
+        Returns:
+            dict: {'size': int, 'max_size': int, 'hits': int, 'misses': int, 'evictions': int}
+        """
+        return {
+            "size": sum(len(documents) for documents in list(self._documents.values())),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    @staticmethod
+    def get_key(query_hash, validation_rules=None):
+        """Get the key of a document validated with the validation rules."""
+        return (query_hash, tuple(validation_rules or ()))
+
+    def get(self, schema, query_hash, validation_rules=None):
+        """Get a cached document by hash.
+
+        Args:
+            schema (graphql.GraphQLSchema): Schema used to validate the document.
+            query_hash (str): sha256 hash of the query.
+            validation_rules (list): Extra validation rules used to validate the document.
+        Returns:
+            tuple: (document, validation_errors) or None if the document is not cached.
+        """
+        key = self.get_key(query_hash, validation_rules)
+        with self._lock:
+            documents = self._documents.get(schema)
+            if documents is None:
+                return None
+            entry = documents.get(key)
+            if entry is not None:
+                documents.move_to_end(key)
+                self.hits += 1
+            return entry
+
+    def set(self, schema, query_hash, document, validation_errors, validation_rules=None):
+        """Save a validated document.
+
+        Args:
+            schema (graphql.GraphQLSchema): Schema used to validate the document.
+            query_hash (str): sha256 hash of the query.
+            document (graphql.DocumentNode): Parsed document.
+            validation_errors (list): Errors of the validation.
+            validation_rules (list): Extra validation rules used to validate the document.
+        """
+        key = self.get_key(query_hash, validation_rules)
+        with self._lock:
+            documents = self._documents.get(schema)
+            if documents is None:
+                documents = OrderedDict()
+                self._documents[schema] = documents
+            documents[key] = (document, validation_errors)
+            documents.move_to_end(key)
+            while len(documents) > self.max_size:
+                documents.popitem(last=False)
+                self.evictions += 1
+
+    def get_document(self, schema, query, validation_rules=None, max_errors=None):
+        """Get the parsed and validated document of a query from the cache or parse and validate it.
+
+        Args:
+            schema (graphql.GraphQLSchema): Schema to validate the document.
+            query (str): GraphQL query.
+            validation_rules (list): Extra validation rules.
+            max_errors (int): Max number of validation errors.
+        Returns:
+            tuple: (document, validation_errors). Parse errors are raised.
+        """
+        cacheable = len(query) <= self.max_query_length
+        if cacheable:
+            query_hash = self.hash_query(query)
+            entry = self.get(schema, query_hash, validation_rules)
+            if entry is not None:
+                return entry
+        with self._lock:
+            self.misses += 1
+        document = parse(query)
+        validation_errors = validate(schema, document, validation_rules, max_errors)
+        if cacheable:
+            self.set(schema, query_hash, document, validation_errors, validation_rules)
+        return document, validation_errors
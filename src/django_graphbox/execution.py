@@ -0,0 +1,91 @@
+""" Execution context to run the generated root query fields in parallel.
+"""
+
+# django imports
+from django.db import close_old_connections
+
+# thread pool
+from concurrent.futures import ThreadPoolExecutor
+
+# graphql imports
+from graphql import ExecutionContext
+from graphql.pyutils import Path, Undefined
+
+
+class ParallelExecutionContext(ExecutionContext):
+    """ExecutionContext that runs the read only root fields built by build_schema_query on a bounded thread pool.
+
+    Each field runs with the database connection of its worker thread and the same context value, so the request used to validate the access is shared.
+    The rest of the root fields and the mutations run on the request thread.
+    Build it with SchemaBuilder.build_parallel_execution_context.
+    """
+
+    builder = None
+    executor = None
+
+    def is_parallel_field(self, field_name):
+        """Validate if a root field is a read only operation built by build_schema_query."""
+        return field_name.replace("_", "").lower() in self.builder._query_op_names
+
+    def execute_parallel_field(self, parent_type, source_value, field_nodes, path):
+        # the worker keeps its own connection, closed like at the end of a request
+        close_old_connections()
+        try:
+            return self.execute_field(parent_type, source_value, field_nodes, path)
+        finally:
+            close_old_connections()
+
+    def execute_fields(self, parent_type, source_value, path, fields):
+        if path is not None or parent_type is not self.schema.query_type:
+            return super().execute_fields(parent_type, source_value, path, fields)
+        parallel_names = [
+            response_name
+            for response_name, field_nodes in fields.items()
+            if self.is_parallel_field(field_nodes[0].name.value)
+        ]
+        if len(parallel_names) < 2:
+            return super().execute_fields(parent_type, source_value, path, fields)
+        futures = {}
+        for response_name in parallel_names:
+            futures[response_name] = self.executor.submit(
+                self.execute_parallel_field,
+                parent_type,
+                source_value,
+                fields[response_name],
+                Path(path, response_name, parent_type.name),
+            )
+        results = {}
+        for response_name, field_nodes in fields.items():
+            if response_name in futures:
+                result = futures[response_name].result()
+            else:
+                result = self.execute_field(
+                    parent_type,
+                    source_value,
+                    field_nodes,
+                    Path(path, response_name, parent_type.name),
+                )
+            if result is not Undefined:
+                results[response_name] = result
+        return results
+
+
+def build_parallel_execution_context(builder, max_workers=4):
+    """Build a ParallelExecutionContext class for the operations of a builder.
+
+    Args:
+        builder (SchemaBuilder): Builder of the schema.
+        max_workers (int): Max number of root fields running at the same time for all the requests.
+    Returns:
+        class: ParallelExecutionContext subclass with its own thread pool.
+    """
+    return type(
+        "ParallelExecutionContext",
+        (ParallelExecutionContext,),
+        {
+            "builder": builder,
+            "executor": ThreadPoolExecutor(
+                max_workers=max_workers, thread_name_prefix="graphbox"
+            ),
+        },
+    )
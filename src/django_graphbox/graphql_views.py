@@ -0,0 +1,405 @@
+""" GraphQL views with the document cache, the persisted queries and the query cost limits.
+
+They use the execution of graphql-core 3, so they require graphene-django>=3.
+"""
+
+# django imports
+from django.db import DatabaseError, connection, transaction
+from django.http import HttpResponse, HttpResponseNotAllowed
+from django.http.response import HttpResponseBadRequest
+
+# graphene imports
+from graphene_django.views import GraphQLView, HttpError
+from graphene_django.settings import graphene_settings
+from graphene_django.constants import MUTATION_ERRORS_FLAG
+from graphene_django.utils.utils import set_rollback
+
+# graphql imports
+from graphql import ExecutionResult, OperationType, execute, get_operation_ast
+from graphql import GraphQLError, validate_schema
+
+# async execution
+from asgiref.sync import sync_to_async
+import inspect
+
+# logging
+import logging
+
+# document cache and persisted queries
+from .documents import DocumentCache
+from .persisted import (
+    AllowList,
+    CachePersistedQueryStore,
+    PERSISTED_QUERY_NOT_FOUND,
+    get_persisted_query_extension,
+)
+
+
+class GraphboxGraphQLView(GraphQLView):
+    """GraphQLView that keeps an LRU of parsed and validated documents.
+
+    Use document_cache on as_view to set a custom DocumentCache and document_cache.stats() to get the hit metrics.
+    Use persisted_queries=True to accept automatic persisted queries (sha256Hash on the persistedQuery extension) saved on persisted_query_store.
+    Use allow_list_only=True to run only the operations registered with the graphbox_register_operations command, they are validated when as_view is called.
+    Use query_cost with a limit built by SchemaBuilder.build_query_cost_limit to reject the documents over the depth or cost budget, the cost is returned on the cost response extension.
+    """
+
+    # shared by all the requests, as_view creates a view instance by request
+    document_cache = DocumentCache()
+    persisted_queries = False
+    persisted_query_store = CachePersistedQueryStore()
+    allow_list_only = False
+    allow_list = AllowList()
+    query_cost = None
+
+    def __init__(
+        self,
+        *args,
+        document_cache=None,
+        persisted_queries=None,
+        persisted_query_store=None,
+        allow_list_only=None,
+        allow_list=None,
+        query_cost=None,
+        **kwargs,
+    ):
+        super().__init__(*args, **kwargs)
+        if document_cache is not None:
+            self.document_cache = document_cache
+        if persisted_queries is not None:
+            self.persisted_queries = persisted_queries
+        if persisted_query_store is not None:
+            self.persisted_query_store = persisted_query_store
+        if allow_list_only is not None:
+            self.allow_list_only = allow_list_only
+        if allow_list is not None:
+            self.allow_list = allow_list
+        if query_cost is not None:
+            self.query_cost = query_cost
+        # (query_hash, query) of the automatic persisted query, saved after its validation
+        self._query_to_persist = None
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        """Build the view and load the allow-list, an invalid allow-listed operation is logged when the urls are loaded."""
+        view = super().as_view(**initkwargs)
+        instance = cls(**initkwargs)
+        if instance.allow_list_only:
+            try:
+                instance.allow_list.load(
+                    instance.schema.graphql_schema,
+                    instance.document_cache,
+                    instance.validation_rules,
+                )
+            except DatabaseError as e:
+                # like the urls loaded by migrate before the PersistedQuery table exists
+                logging.warning(
+                    f"WARNING: The allow-list will be loaded on the first request, the database is not available: {e}"
+                )
+        return view
+
+    def get_query(self, request, data, query, schema):
+        """Resolve the query of the request with the persisted queries and the allow-list.
+
+        Returns:
+            str: Query to execute. GraphQLError is raised if the query is not found or not allowed.
+        """
+        self._query_to_persist = None
+        persisted_query = None
+        if self.persisted_queries or self.allow_list_only:
+            persisted_query = get_persisted_query_extension(request, data)
+        if persisted_query is not None:
+            query_hash = persisted_query["sha256Hash"]
+            if query and DocumentCache.hash_query(query) != query_hash:
+                raise GraphQLError("provided sha does not match query")
+        elif query:
+            query_hash = DocumentCache.hash_query(query)
+        else:
+            return query
+        if self.allow_list_only:
+            allowed_query = self.allow_list.get(
+                schema, query_hash, self.document_cache, self.validation_rules
+            )
+            if allowed_query is None:
+                raise GraphQLError(
+                    "Operation not allowed", extensions={"code": "OPERATION_NOT_ALLOWED"}
+                )
+            return allowed_query
+        if persisted_query is None:
+            return query
+        if query:
+            # only the valid documents are persisted
+            self._query_to_persist = (query_hash, query)
+            return query
+        query = self.persisted_query_store.get(query_hash)
+        if query is None:
+            raise GraphQLError(
+                PERSISTED_QUERY_NOT_FOUND, extensions={"code": "PERSISTED_QUERY_NOT_FOUND"}
+            )
+        return query
+
+    def get_document(self, schema, query):
+        """Get the parsed and validated document of the query.
+
+        Returns:
+            tuple: (document, validation_errors)
+        """
+        return self.document_cache.get_document(
+            schema,
+            query,
+            self.validation_rules,
+            graphene_settings.MAX_VALIDATION_ERRORS,
+        )
+
+    def prepare_graphql_request(
+        self, request, data, query, variables, operation_name, show_graphiql=False
+    ):
+        """Resolve, parse and validate the query of the request.
+
+        Returns:
+            tuple: (execution_result, prepared). prepared is (schema, document, operation_ast, execute_options, extensions), or None if execution_result must be returned without execution.
+        """
+        schema = self.schema.graphql_schema
+
+        try:
+            query = self.get_query(request, data, query, schema)
+        except GraphQLError as e:
+            return ExecutionResult(errors=[e]), None
+
+        if not query:
+            if show_graphiql:
+                return None, None
+            raise HttpError(HttpResponseBadRequest("Must provide query string."))
+
+        schema_validation_errors = validate_schema(schema)
+        if schema_validation_errors:
+            return ExecutionResult(data=None, errors=schema_validation_errors), None
+
+        try:
+            document, validation_errors = self.get_document(schema, query)
+        except Exception as e:
+            return ExecutionResult(errors=[e]), None
+
+        operation_ast = get_operation_ast(document, operation_name)
+
+        if (
+            request.method.lower() == "get"
+            and operation_ast is not None
+            and operation_ast.operation != OperationType.QUERY
+        ):
+            if show_graphiql:
+                return None, None
+            raise HttpError(
+                HttpResponseNotAllowed(
+                    ["POST"],
+                    "Can only perform a {} operation from a POST request.".format(
+                        operation_ast.operation.value
+                    ),
+                )
+            )
+
+        if validation_errors:
+            return ExecutionResult(data=None, errors=validation_errors), None
+
+        if self._query_to_persist is not None:
+            self.persisted_query_store.set(*self._query_to_persist)
+            self._query_to_persist = None
+
+        extensions = None
+        if self.query_cost is not None:
+            cost_info, cost_errors = self.query_cost.validate(
+                schema, document, operation_name, variables, request
+            )
+            extensions = {"cost": cost_info}
+            if cost_errors:
+                return (
+                    ExecutionResult(data=None, errors=cost_errors, extensions=extensions),
+                    None,
+                )
+
+        try:
+            execute_options = {
+                "root_value": self.get_root_value(request),
+                "context_value": self.get_context(request),
+                "variable_values": variables,
+                "operation_name": operation_name,
+                "middleware": self.get_middleware(request),
+            }
+        except Exception as e:
+            return ExecutionResult(errors=[e], extensions=extensions), None
+        if self.execution_context_class:
+            execute_options["execution_context_class"] = self.execution_context_class
+        return None, (schema, document, operation_ast, execute_options, extensions)
+
+    def execute_graphql_request(
+        self, request, data, query, variables, operation_name, show_graphiql=False
+    ):
+        execution_result, prepared = self.prepare_graphql_request(
+            request, data, query, variables, operation_name, show_graphiql
+        )
+        if prepared is None:
+            return execution_result
+        schema, document, operation_ast, execute_options, extensions = prepared
+
+        try:
+            if (
+                operation_ast is not None
+                and operation_ast.operation == OperationType.MUTATION
+                and (
+                    graphene_settings.ATOMIC_MUTATIONS is True
+                    or connection.settings_dict.get("ATOMIC_MUTATIONS", False) is True
+                )
+            ):
+                with transaction.atomic():
+                    result = execute(schema, document, **execute_options)
+                    if getattr(request, MUTATION_ERRORS_FLAG, False) is True:
+                        transaction.set_rollback(True)
+            else:
+                result = execute(schema, document, **execute_options)
+            if extensions is not None:
+                result.extensions = extensions
+            return result
+        except Exception as e:
+            return ExecutionResult(errors=[e], extensions=extensions)
+
+    def build_response(self, request, execution_result, id=None, show_graphiql=False):
+        """Encode the execution result like the upstream view, including the extensions.
+
+        Returns:
+            tuple: (result (str), status_code (int))
+        """
+        if getattr(request, MUTATION_ERRORS_FLAG, False) is True:
+            set_rollback()
+
+        status_code = 200
+        if execution_result:
+            response = {}
+
+            if execution_result.errors:
+                set_rollback()
+                response["errors"] = [
+                    self.format_error(e) for e in execution_result.errors
+                ]
+
+            if execution_result.errors and any(
+                not getattr(e, "path", None) for e in execution_result.errors
+            ):
+                status_code = 400
+            else:
+                response["data"] = execution_result.data
+
+            # the upstream view drops the extensions of the result
+            if execution_result.extensions:
+                response["extensions"] = execution_result.extensions
+
+            if self.batch:
+                response["id"] = id
+                response["status"] = status_code
+
+            result = self.json_encode(request, response, pretty=show_graphiql)
+        else:
+            result = None
+
+        return result, status_code
+
+    def get_response(self, request, data, show_graphiql=False):
+        query, variables, operation_name, id = self.get_graphql_params(request, data)
+
+        execution_result = self.execute_graphql_request(
+            request, data, query, variables, operation_name, show_graphiql
+        )
+
+        return self.build_response(request, execution_result, id, show_graphiql)
+
+
+class AsyncGraphboxGraphQLView(GraphboxGraphQLView):
+    """GraphboxGraphQLView for ASGI deployments of schemas built with SchemaBuilder(async_resolvers=True).
+
+    The operations are executed on the event loop. The persisted queries, the allow-list and the budgets by group of query_cost use the database, so the preparation of those requests runs on a worker thread.
+    ATOMIC_MUTATIONS is not supported, the transactions of Django are sync only.
+    """
+
+    view_is_async = True
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            if request.method.lower() not in ("get", "post"):
+                raise HttpError(
+                    HttpResponseNotAllowed(
+                        ["GET", "POST"], "GraphQL only supports GET and POST requests."
+                    )
+                )
+
+            data = self.parse_body(request)
+            show_graphiql = self.graphiql and self.can_display_graphiql(request, data)
+
+            if show_graphiql:
+                # graphiql page rendered by the sync view
+                return await sync_to_async(super().dispatch)(request, *args, **kwargs)
+
+            if self.batch:
+                responses = [
+                    await self.get_response_async(request, entry) for entry in data
+                ]
+                result = "[{}]".format(
+                    ",".join([response[0] for response in responses])
+                )
+                status_code = (
+                    responses
+                    and max(responses, key=lambda response: response[1])[1]
+                    or 200
+                )
+            else:
+                result, status_code = await self.get_response_async(
+                    request, data, show_graphiql
+                )
+
+            return HttpResponse(
+                status=status_code, content=result, content_type="application/json"
+            )
+
+        except HttpError as e:
+            response = e.response
+            response["Content-Type"] = "application/json"
+            response.content = self.json_encode(
+                request, {"errors": [self.format_error(e)]}
+            )
+            return response
+
+    async def execute_graphql_request_async(
+        self, request, data, query, variables, operation_name, show_graphiql=False
+    ):
+        if (
+            self.persisted_queries
+            or self.allow_list_only
+            or (self.query_cost is not None and self.query_cost.budgets_by_group)
+        ):
+            execution_result, prepared = await sync_to_async(
+                self.prepare_graphql_request
+            )(request, data, query, variables, operation_name, show_graphiql)
+        else:
+            execution_result, prepared = self.prepare_graphql_request(
+                request, data, query, variables, operation_name, show_graphiql
+            )
+        if prepared is None:
+            return execution_result
+        schema, document, operation_ast, execute_options, extensions = prepared
+
+        try:
+            result = execute(schema, document, **execute_options)
+            if inspect.isawaitable(result):
+                result = await result
+            if extensions is not None:
+                result.extensions = extensions
+            return result
+        except Exception as e:
+            return ExecutionResult(errors=[e], extensions=extensions)
+
+    async def get_response_async(self, request, data, show_graphiql=False):
+        query, variables, operation_name, id = self.get_graphql_params(request, data)
+
+        execution_result = await self.execute_graphql_request_async(
+            request, data, query, variables, operation_name, show_graphiql
+        )
+
+        return self.build_response(request, execution_result, id, show_graphiql)
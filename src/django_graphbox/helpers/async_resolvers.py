@@ -0,0 +1,343 @@
+# graphene imports
+import graphene
+# global constants
+from django_graphbox.constants import *
+# error management
+from django_graphbox.exceptions import ErrorManager, ErrorMsgType
+# hasher import
+from django_graphbox.hasher import HashManager
+# shared helpers
+from django_graphbox.helpers.shared import *
+# query helpers
+from django_graphbox.helpers.queries import FacetsContext, get_selected_annotations
+# relations helpers
+from django_graphbox.helpers.relations import preload_selected_relations
+# cache helpers
+from django_graphbox.helpers.cache import get_queryset_cache_key, get_or_set_cached
+# django imports
+from django.core.files import File
+from django.core.files.images import ImageFile
+from django.contrib.auth.hashers import make_password
+from django.utils import timezone as tz
+# time management
+import datetime
+# async adapters
+from asgiref.sync import sync_to_async
+# pillow import
+from PIL import Image
+# models
+from django_graphbox.models import Tombstone
+
+# async versions of the resolvers for ASGI deployments, built with SchemaBuilder(async_resolvers=True)
+
+async def avalidate_operation_access(self, info, access_group):
+    """Validate the access of the request with the async session manager
+
+    Returns:
+        tuple: (valid (bool), error (ErrorMsgType))
+    """
+    if self._session_manager!=None:
+        valid, actual_user_instance, error=await self._session_manager.avalidate_access(info.context, access_group)
+        return valid, error
+    return True, None
+
+async def get_cached_or_list(config, operation, queryset):
+    """Load the queryset on a list, from the cache of the model if it's configured"""
+    if config.get('cache') is not None:
+        def compute():
+            cache_key=get_queryset_cache_key(config, operation, queryset)
+            return get_or_set_cached(config, cache_key, lambda: list(queryset))
+        return await sync_to_async(compute)()
+    return [item async for item in queryset]
+
+# query resolver builders
+
+def build_async_field_by_id_resolver(self):
+    async def field_resolver_function(parent, info, **kwargs):
+        operation_name=info.field_name.lower()
+        config=self._models_by_op_name[operation_name]
+        valid, error=await avalidate_operation_access(self, info, get_access_group('field_by_id', config))
+        if valid:
+            model=config.get('model')
+            annotations=get_selected_annotations(info, config)
+            database=get_read_database(self, info, model)
+            queryset=model.objects.using(database).annotate(**annotations).filter(id=kwargs.get('id'))
+            queryset=preload_selected_relations(self, queryset, info, config)
+            if config.get('cache') is not None:
+                def compute():
+                    cache_key=get_queryset_cache_key(config, 'field_by_id', queryset)
+                    return get_or_set_cached(config, cache_key, queryset.get)
+                result=await sync_to_async(compute)()
+            else:
+                result=await queryset.aget()
+            valid_operation=True
+            if 'field_by_id' in config['validators_by_operation']:
+                valid_operation=await async_evaluate_result(config['validators_by_operation']['field_by_id'], info, result, **kwargs)
+            if valid_operation:
+                await async_run_callbacks(config, 'field_by_id', info, result, **kwargs)
+                return result
+        return None
+    return field_resolver_function
+
+def build_async_field_list_resolver(self):
+    async def list_resolver_function(parent, info, **kwargs):
+        operation_name=info.field_name.lower()
+        config=self._models_by_op_name[operation_name]
+        valid, error=await avalidate_operation_access(self, info, get_access_group('list_field', config))
+        if valid:
+            pagination_length=config.get('pagination_length')
+            pagination_style=config.get('pagination_style')
+            paginated_type=config.get('paginated_type')
+            ordering_fields=config.get('ordering_fields')
+            order_by=kwargs.get('order_by')
+            if order_by:
+                ordering_fields=tuple(getattr(key, 'value', key) for key in order_by)+ordering_fields
+            query_object, internal_conditions=await config.get('filter_plan').abuild_query_conditions(info, **kwargs)
+            model=config.get('model')
+            nested_field='items' if pagination_length>0 and pagination_style=='paginated' else None
+            annotations=get_selected_annotations(info, config, nested_field)
+            database=get_read_database(self, info, model)
+            queryset=model.objects.using(database).filter(query_object).annotate(**annotations).order_by(*ordering_fields)
+            queryset=preload_selected_relations(self, queryset, info, config, nested_field)
+            if pagination_length == 0:
+                result=await get_cached_or_list(config, 'list_field', queryset)
+                await async_run_callbacks(config, 'list_field', info, result, **kwargs)
+                return result
+            else:
+                pagina=kwargs.get('page')
+                inicio=(pagina*pagination_length)-pagination_length
+                fin=inicio+pagination_length
+                items=await get_cached_or_list(config, 'list_field', queryset[inicio:fin])
+                await async_run_callbacks(config, 'list_field', info, items, **kwargs)
+                if pagination_style=='infinite':
+                    return items
+                else:
+                    count_queryset=model.objects.using(database).filter(query_object)
+                    if config.get('cache') is not None:
+                        def compute_count():
+                            cache_key=get_queryset_cache_key(config, 'list_field_count', count_queryset)
+                            return get_or_set_cached(config, cache_key, count_queryset.count)
+                        total_items=await sync_to_async(compute_count)()
+                    else:
+                        total_items=await count_queryset.acount()
+                    total_pages=total_items//pagination_length
+                    if total_items%pagination_length>0:
+                        total_pages+=1
+                    has_next_page = pagina<total_pages
+                    has_previous_page = pagina>1
+                    page_data={'items':items, 'has_next_page':has_next_page, 'has_previous_page':has_previous_page, 'total_pages':total_pages, 'total_items':total_items}
+                    if config.get('facets_type') is not None:
+                        page_data['facets']=FacetsContext(config, internal_conditions, database, **kwargs)
+                    return paginated_type(**page_data)
+        return None
+    return list_resolver_function
+
+def build_async_changes_resolver(self):
+    async def changes_resolver_function(parent, info, **kwargs):
+        operation_name=info.field_name.lower()
+        config=self._models_by_op_name[operation_name]
+        valid, error=await avalidate_operation_access(self, info, get_access_group('changes_field', config))
+        if valid:
+            model=config.get('model')
+            sync_field=config.get('sync_field')
+            since=kwargs.get('since')
+            # rows saved before the query time can commit after the read, so the watermark goes back sync_margin seconds
+            # and the next sync returns again the changes of the margin
+            query_time=tz.now()
+            watermark=query_time-datetime.timedelta(seconds=config.get('sync_margin'))
+            query_object=await config.get('filter_plan').abuild_query(info, **kwargs)
+            annotations=get_selected_annotations(info, config, 'items')
+            # the changes are read from the primary, a replica lag would skip the rows older than the watermark
+            database=self._write_database
+            items=model.objects.using(database).filter(query_object).filter(**{f'{sync_field}__gt': since, f'{sync_field}__lte': query_time}).annotate(**annotations).order_by(sync_field, 'pk')
+            items=preload_selected_relations(self, items, info, config, 'items')
+            items=[item async for item in items]
+            deleted_ids=Tombstone.objects.using(database).filter(model_label=model._meta.label, deletion_time__gt=since, deletion_time__lte=query_time).values_list('object_id', flat=True)
+            deleted_ids=[object_id async for object_id in deleted_ids]
+            await async_run_callbacks(config, 'changes_field', info, items, **kwargs)
+            return config.get('changes_type')(items=items, deleted_ids=deleted_ids, watermark=watermark)
+        return None
+    return changes_resolver_function
+
+# mutate function builders
+
+async def aset_instance_fields(config, instance, info, kwargs, relation_types, exclude_keys=()):
+    """Set the values of the arguments on the instance like the sync mutations, loading the related instances with the async ORM"""
+    model=config.get('model')
+    for key, value in kwargs.items():
+        if key in exclude_keys:
+            continue
+        field_type=instance._meta.get_field(key).__class__.__name__
+        if callable(value):
+            value=await call_async(value, info, instance, **kwargs)
+        if value!=None:
+            if field_type in relation_types:
+                foreign_model=instance._meta.get_field(key).related_model
+                value=await foreign_model.objects.aget(id=value)
+                setattr(instance, key, value)
+            elif field_type in ['FileField', 'ImageField']:
+                if field_type=='ImageField':
+                    #test if is a valid image
+                    Image.open(value)
+                    file=ImageFile(value)
+                else:
+                    file=File(value)
+                extension=file.name.split('.')[-1]
+                sha1_file=HashManager.getSHA1file(file)
+                await sync_to_async(getattr(instance, key).save)(f'{sha1_file}.{extension}', file, save=False)
+            elif key in config.get('save_as_password'):
+                value=make_password(value)
+                setattr(instance, key, value)
+            else:
+                if model._meta.get_field(key).choices!=None and len(model._meta.get_field(key).choices)>0:
+                    choices=model._meta.get_field(key).choices
+                    valid_options=[c[0] for c in choices]
+                    if value not in valid_options:
+                        raise Exception(f'{value} no es una opción válida para {key}')
+                setattr(instance, key, value)
+
+def build_async_mutate_for_create(self):
+    async def mutate_create_function(parent, info, **kwargs):
+        operation_name=info.field_name.lower()
+        config=self._models_by_op_name[operation_name]
+        valid, session_error=await avalidate_operation_access(self, info, get_access_group('create_field', config))
+        model=config.get('model')
+        return_object=type(info.return_type.name, (graphene.ObjectType,), {'estado':graphene.Boolean(), model.__name__.lower():graphene.Field(config['type']),'error':graphene.Field(ErrorMsgType)})
+        if valid:
+            try:
+                instance=model()
+                internal_field_resolvers=config.get('internal_field_resolvers')
+                if 'create_field' in internal_field_resolvers.keys():
+                    kwargs.update(internal_field_resolvers.get('create_field'))
+                await aset_instance_fields(config, instance, info, kwargs, ['ForeignKey', 'OneToOneField'])
+                valid_operation=True
+                if 'create_field' in config['validators_by_operation']:
+                    valid_operation=await async_evaluate_result(config['validators_by_operation']['create_field'], info, instance, **kwargs)
+                if valid_operation:
+                    await instance.asave()
+                    mark_primary_write(self, info)
+                    await async_run_callbacks(config, 'create_field', info, instance, **kwargs)
+                    return return_object(**{'estado':True, model.__name__.lower():instance, 'error':ErrorManager.get_error_by_code(NO_ERROR)})
+                else:
+                    return return_object(**{'estado':False, 'error':ErrorManager.get_error_by_code(INSUFFICIENT_PERMISSIONS)})
+            except Exception as e:
+                return return_object(**{'estado':False, 'error':ErrorManager.get_error_by_code(error_code=UNKNOWN_ERROR, custom_message="Error Inesperado", custom_description=str(e))})
+        else:
+            return return_object(**{'estado':False, 'error':session_error})
+    return mutate_create_function
+
+def build_async_mutate_for_update(self):
+    async def mutate_update_function(parent, info, **kwargs):
+        operation_name=info.field_name.lower()
+        config=self._models_by_op_name[operation_name]
+        valid, session_error=await avalidate_operation_access(self, info, get_access_group('update_field', config))
+        model=config.get('model')
+        return_object=type(info.return_type.name, (graphene.ObjectType,), {'estado':graphene.Boolean(), model.__name__.lower():graphene.Field(config['type']),'error':graphene.Field(ErrorMsgType)})
+        if valid:
+            try:
+                queryset=preload_selected_relations(self, model.objects.filter(id=kwargs.get('id')), info, config, model.__name__.lower())
+                instance=await queryset.afirst()
+                if instance is not None:
+                    valid_operation=True
+                    if 'update_field' in config['validators_by_operation']:
+                        valid_operation=await async_evaluate_result(config['validators_by_operation']['update_field'], info, instance, **kwargs)
+                    if valid_operation:
+                        internal_field_resolvers=config.get('internal_field_resolvers')
+                        if 'update_field' in internal_field_resolvers.keys():
+                            kwargs.update(internal_field_resolvers.get('update_field'))
+                        await aset_instance_fields(config, instance, info, kwargs, ['ForeignKey'], exclude_keys=('id',))
+                        await instance.asave()
+                        mark_primary_write(self, info)
+                        await async_run_callbacks(config, 'update_field', info, instance, **kwargs)
+                        return return_object(**{'estado':True, model.__name__.lower():instance, 'error':ErrorManager.get_error_by_code(NO_ERROR)})
+                    else:
+                        return return_object(**{'estado':False, 'error':ErrorManager.get_error_by_code(INSUFFICIENT_PERMISSIONS)})
+                else:
+                    return return_object(**{'estado':False, 'error':ErrorManager.get_error_by_code(INSTANCE_NOT_FOUND)})
+            except Exception as e:
+                return return_object(**{'estado':False, 'error':ErrorManager.get_error_by_code(error_code=UNKNOWN_ERROR,custom_message="Error Inesperado", custom_description=str(e))})
+        else:
+            return return_object(**{'estado':False, 'error':session_error})
+    return mutate_update_function
+
+def build_async_mutate_for_delete(self):
+    async def mutate_delete_function(parent, info, **kwargs):
+        operation_name=info.field_name.lower()
+        config=self._models_by_op_name[operation_name]
+        valid, session_error=await avalidate_operation_access(self, info, get_access_group('delete_field', config))
+        model=config.get('model')
+        return_object=type(info.return_type.name, (graphene.ObjectType,), {'estado':graphene.Boolean(), 'error':graphene.Field(ErrorMsgType)})
+        if valid:
+            try:
+                instance=await model.objects.filter(id=kwargs.get('id')).afirst()
+                if instance is not None:
+                    valid_operation=True
+                    if 'delete_field' in config['validators_by_operation']:
+                        valid_operation=await async_evaluate_result(config['validators_by_operation']['delete_field'], info, instance, **kwargs)
+                    if valid_operation:
+                        await instance.adelete()
+                        if config.get('sync_field') is not None:
+                            await Tombstone.objects.acreate(model_label=model._meta.label, object_id=str(kwargs.get('id')))
+                        mark_primary_write(self, info)
+                        await async_run_callbacks(config, 'delete_field', info, instance, **kwargs)
+                        return return_object(**{'estado':True, 'error':ErrorManager.get_error_by_code(NO_ERROR)})
+                    else:
+                        return return_object(**{'estado':False, 'error':ErrorManager.get_error_by_code(INSUFFICIENT_PERMISSIONS)})
+                else:
+                    return return_object(**{'estado':False, 'error':ErrorManager.get_error_by_code(INSTANCE_NOT_FOUND)})
+            except Exception as e:
+                return return_object(**{'estado':False, 'error':ErrorManager.get_error_by_code(error_code=UNKNOWN_ERROR,custom_message="Error Inesperado", custom_description=str(e))})
+        else:
+            return return_object(**{'estado':False, 'error':session_error})
+    return mutate_delete_function
+
+# session builders
+
+def build_async_mutate_for_login(self):
+    async def login_mutate_function(parent, info, **kwargs):
+        config = self._models_by_op_name["login"]
+        (
+            valid,
+            user_instance,
+            token,
+            error,
+            captcha_required,
+        ) = await self._session_manager.astart_session(
+            kwargs.get(self._session_manager.login_id_field_name),
+            kwargs.get(self._session_manager.password_field_name),
+            permanent=kwargs.get("permanent"),
+            captcha_id=kwargs.get("captcha_id"),
+            captcha_value=kwargs.get("captcha_value"),
+            recaptcha_token=kwargs.get("recaptcha_token"),
+        )
+        return_object = type(
+            info.return_type.name,
+            (graphene.ObjectType,),
+            {
+                "estado": graphene.Boolean(),
+                "token": graphene.String(),
+                user_instance.__class__.__name__.lower(): graphene.Field(
+                    config["type"]
+                ),
+                "error": graphene.Field(ErrorMsgType),
+                "captcha_required": graphene.Boolean(),
+            },
+        )
+        return return_object(
+            **{
+                "estado": valid,
+                "token": token,
+                user_instance.__class__.__name__.lower(): user_instance,
+                "error": error,
+                "captcha_required": captcha_required,
+            }
+        )
+    return login_mutate_function
+
+def build_async_actual_user_resolver(self):
+    async def actual_user_function(parent, info, **kwargs):
+        valid, user_instance, error = await self._session_manager.avalidate_access(
+            info.context, "all"
+        )
+        return user_instance
+    return actual_user_function
@@ -0,0 +1,125 @@
+# django imports
+from django.core.cache import caches
+from django.db.models import Prefetch
+from django.db.models.signals import post_save, post_delete
+# hashing
+import hashlib
+# time management
+import time
+# logging
+import logging
+
+# per model query cache with generation counters
+
+def get_cache_config(cache_config):
+    """Normalize the cache option of add_model
+
+    Args:
+        cache_config (bool or dict): True for defaults or {'timeout': int, 'cache_alias': str, 'depends_on': [model, ...]}.
+    Returns:
+        dict: Cache config or None if the cache is disabled.
+    """
+    if not cache_config:
+        return None
+    if cache_config is True:
+        cache_config = {}
+    return {
+        "timeout": cache_config.get("timeout", 60),
+        "cache_alias": cache_config.get("cache_alias", "default"),
+        "depends_on": list(cache_config.get("depends_on", [])),
+    }
+
+def get_generation_key(model):
+    return f"graphbox_generation:{model._meta.label}"
+
+def get_generation(model, cache_alias="default"):
+    """Get the generation counter of the model, every invalidation creates a new generation"""
+    cache = caches[cache_alias]
+    key = get_generation_key(model)
+    generation = cache.get(key)
+    if generation is None:
+        # time based start to not reuse old generations after an eviction
+        cache.add(key, int(time.time() * 1000), None)
+        generation = cache.get(key)
+    return generation
+
+def invalidate_model_cache(model, cache_alias="default"):
+    """Invalidate all the cached results of a model increasing its generation counter"""
+    cache = caches[cache_alias]
+    key = get_generation_key(model)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, int(time.time() * 1000), None)
+
+def connect_cache_invalidation(model, cache_config):
+    """Connect post_save and post_delete signals of the model and its dependencies to invalidate the model cache
+
+    Args:
+        model (object): Django model class with cache.
+        cache_config (dict): Normalized cache config.
+    """
+    cache_alias = cache_config["cache_alias"]
+
+    def invalidate_handler(sender, **kwargs):
+        invalidate_model_cache(model, cache_alias)
+
+    for sender in [model] + cache_config["depends_on"]:
+        dispatch_uid = f"graphbox_cache:{model._meta.label}:{sender._meta.label}"
+        post_save.connect(invalidate_handler, sender=sender, weak=False, dispatch_uid=dispatch_uid)
+        post_delete.connect(invalidate_handler, sender=sender, weak=False, dispatch_uid=dispatch_uid)
+
+def _query_representation(queryset):
+    """Get the SQL of a queryset with the repr of its params"""
+    sql, params = queryset.query.sql_with_params()
+    return f"{sql}\n{params!r}"
+
+def get_queryset_cache_key(config, operation, queryset, *parts):
+    """Build the cache key of a queryset result
+
+    The SQL of the queryset and the repr of its params contains the values of the internal filters, so results of filters that depends on the actual user are cached by user. The repr keeps the type of the params, a filter by '1' and by 1 have different keys.
+
+    Args:
+        config (dict): Model config.
+        operation (str): Operation name.
+        queryset (QuerySet): Queryset to cache.
+        *parts: Extra values for the key.
+    Returns:
+        str: Cache key or None if the queryset can't be represented.
+    """
+    try:
+        representation = [queryset.db, _query_representation(queryset)]
+        for lookup in queryset._prefetch_related_lookups:
+            if isinstance(lookup, Prefetch):
+                prefetch_representation = None
+                if lookup.queryset is not None:
+                    prefetch_representation = _query_representation(lookup.queryset)
+                representation.append(f"{lookup.prefetch_to}:{prefetch_representation}")
+            else:
+                representation.append(str(lookup))
+    except Exception as e:
+        logging.warning(f"Unable to build cache key for {config['name']}: {e}")
+        return None
+    representation += [str(part) for part in parts]
+    digest = hashlib.sha1("\n".join(representation).encode()).hexdigest()
+    generation = get_generation(config["model"], config["cache"]["cache_alias"])
+    return f"graphbox_query:{config['model']._meta.label}:{generation}:{operation}:{digest}"
+
+def get_or_set_cached(config, cache_key, compute):
+    """Get the cached value of the key or compute and save it
+
+    Args:
+        config (dict): Model config.
+        cache_key (str): Key built with get_queryset_cache_key. None to compute without cache.
+        compute (callable): Function to compute the value.
+    Returns:
+        object: Cached or computed value.
+    """
+    if cache_key is None:
+        return compute()
+    cache = caches[config["cache"]["cache_alias"]]
+    value = cache.get(cache_key)
+    if value is None:
+        value = compute()
+        cache.set(cache_key, value, config["cache"]["timeout"])
+    return value
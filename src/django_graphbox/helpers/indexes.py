@@ -0,0 +1,219 @@
+# regex import
+import re
+# logging
+import logging
+# django imports
+from django.core.exceptions import FieldDoesNotExist
+from django.db import connections
+from django.db.models import UniqueConstraint
+from django.utils import timezone as tz
+
+# lookups that can't be resolved with a btree index on the column
+NON_INDEXABLE_LOOKUPS = [
+    "contains",
+    "icontains",
+    "iexact",
+    "endswith",
+    "iendswith",
+    "regex",
+    "iregex",
+    "istartswith",
+]
+
+# patterns on the explain output that means a full scan by vendor
+SCAN_PATTERNS = {
+    "sqlite": re.compile(r"\bSCAN\b(?! \S+ USING (COVERING )?INDEX)"),
+    "postgresql": re.compile(r"Seq Scan"),
+    "mysql": re.compile(r"\bALL\b"),
+}
+
+# patterns on the explain output that means a sort without index by vendor
+SORT_PATTERNS = {
+    "sqlite": re.compile(r"TEMP B-TREE FOR ORDER BY"),
+    "postgresql": re.compile(r"\bSort\b"),
+    "mysql": re.compile(r"Using filesort"),
+}
+
+# index inspection
+
+def get_indexed_fields(model):
+    """Get the names of the fields that are the leading column of an index or constraint on the model.
+
+    Args:
+        model (django.models.Model): Model to inspect.
+    Returns:
+        set: Field names usable by the database to search or sort without a full scan.
+    """
+    indexed_fields = set()
+    for field in model._meta.concrete_fields:
+        if field.primary_key or field.unique or field.db_index:
+            indexed_fields.add(field.name)
+    for index in model._meta.indexes:
+        if len(index.fields) > 0 and getattr(index, "condition", None) is None:
+            indexed_fields.add(index.fields[0].lstrip("-"))
+    for constraint in model._meta.constraints:
+        if (
+            isinstance(constraint, UniqueConstraint)
+            and len(constraint.fields) > 0
+            and constraint.condition is None
+        ):
+            indexed_fields.add(constraint.fields[0])
+    for fields in list(model._meta.unique_together) + list(
+        getattr(model._meta, "index_together", [])
+    ):
+        if len(fields) > 0:
+            indexed_fields.add(fields[0])
+    return indexed_fields
+
+
+def resolve_lookup_path(model, lookup_path):
+    """Resolve a django lookup path to the final model, field and lookup.
+
+    Args:
+        model (django.models.Model): Model where the lookup starts.
+        lookup_path (str): Lookup path like 'category__name__icontains'.
+    Returns:
+        tuple: (model (django.models.Model), field (django.db.models.Field), lookup (str)). field is None if the path can't be resolved.
+    """
+    parts = lookup_path.lstrip("-").split("__")
+    actual_model = model
+    field = None
+    for position, part in enumerate(parts):
+        try:
+            if part == "pk":
+                field = actual_model._meta.pk
+            else:
+                field = actual_model._meta.get_field(part)
+        except FieldDoesNotExist:
+            return actual_model, field, "__".join(parts[position:])
+        if field.is_relation and position < len(parts) - 1:
+            actual_model = field.related_model
+    return actual_model, field, "exact"
+
+
+def is_indexed_lookup(model, lookup_path):
+    """Validate if a lookup path can be resolved with an index.
+
+    Args:
+        model (django.models.Model): Model where the lookup starts.
+        lookup_path (str): Lookup path like 'category__name'.
+    Returns:
+        bool: True if the final field of the path is indexed and the lookup can use the index.
+    """
+    final_model, field, lookup = resolve_lookup_path(model, lookup_path)
+    if field is None or not field.concrete:
+        return False
+    if lookup in NON_INDEXABLE_LOOKUPS:
+        return False
+    return field.name in get_indexed_fields(final_model)
+
+
+def suggest_index(model, lookup_path, ordering_fields=()):
+    """Build a suggested index definition for a lookup path.
+
+    Args:
+        model (django.models.Model): Model where the lookup starts.
+        lookup_path (str): Lookup path like 'category__name'.
+        ordering_fields (tuple): Ordering fields applied with the lookup to add as trailing columns.
+    Returns:
+        str: Suggested index definition to add on the Meta.indexes of the final model.
+    """
+    final_model, field, lookup = resolve_lookup_path(model, lookup_path)
+    if field is None:
+        return None
+    if lookup in NON_INDEXABLE_LOOKUPS:
+        return f"{final_model.__name__}.{field.name}: '{lookup}' lookup can't use a btree index, consider a trigram or full text index"
+    fields = [field.name]
+    if final_model is model:
+        for ordering_field in ordering_fields:
+            if ordering_field.lstrip("-") != field.name:
+                fields.append(ordering_field)
+    return f"{final_model.__name__}.Meta.indexes += [models.Index(fields={fields})]"
+
+# explain output
+
+def sample_value(field, lookup):
+    """Build a value of the field type to explain a lookup."""
+    if lookup == "isnull":
+        return True
+    try:
+        value = field.to_python("1")
+    except Exception:
+        value = tz.now()
+    if lookup in ["in", "range"]:
+        return [value, value]
+    return value
+
+
+def explain_scan(queryset, patterns=SCAN_PATTERNS):
+    """Run the explain of the queryset on the database and validate if it will scan.
+
+    Args:
+        queryset (django.db.models.QuerySet): Queryset to explain.
+        patterns (dict): Patterns by vendor to search on the explain output. SCAN_PATTERNS or SORT_PATTERNS.
+    Returns:
+        tuple: (scan (bool or None), explain_output (str)). scan is None when the vendor is not supported.
+    """
+    output = queryset.explain()
+    pattern = patterns.get(connections[queryset.db].vendor)
+    if pattern is None:
+        return None, output
+    return pattern.search(output) is not None, output
+
+# model config advisor
+
+def advise_model_indexes(model_config, explain=False):
+    """Inspect the filters and ordering of a model config against the indexes of the model.
+
+    Args:
+        model_config (dict): Model config created by SchemaBuilder.add_model.
+        explain (bool): If True, the result of the explain of each generated query is used to detect scans.
+    Returns:
+        list: Report entries. [{'model': str, 'kind': 'filter' or 'ordering', 'field_name': str, 'param_name': str, 'indexed': bool, 'scan': bool, 'explain': str, 'suggestion': str}, ...]
+    """
+    model = model_config["model"]
+    ordering_fields = model_config.get("ordering_fields", ())
+    report = []
+    entries = []
+    for filter_config in model_config.get("external_filters", []):
+        entries.append(("filter", filter_config.get("field_name"), filter_config.get("param_name")))
+    for filter_config in model_config.get("internal_filters", []):
+        entries.append(("filter", filter_config.get("field_name"), None))
+    for ordering_field in ordering_fields:
+        entries.append(("ordering", ordering_field, None))
+    for kind, field_name, param_name in entries:
+        indexed = is_indexed_lookup(model, field_name)
+        scan = not indexed
+        explain_output = None
+        if explain:
+            try:
+                queryset = model.objects.all()
+                if kind == "filter":
+                    final_model, field, lookup = resolve_lookup_path(model, field_name)
+                    queryset = queryset.filter(**{field_name: sample_value(field, lookup)})
+                    patterns = SCAN_PATTERNS
+                else:
+                    queryset = queryset.order_by(field_name)
+                    patterns = SORT_PATTERNS
+                explain_scan_result, explain_output = explain_scan(queryset, patterns)
+                if explain_scan_result is not None:
+                    scan = explain_scan_result
+            except Exception as e:
+                logging.warning(f"Unable to explain {kind} {field_name} on {model.__name__}: {e}")
+        report.append(
+            {
+                "model": model.__name__,
+                "kind": kind,
+                "field_name": field_name,
+                "param_name": param_name,
+                "indexed": indexed,
+                "scan": scan,
+                "explain": explain_output,
+                "suggestion": suggest_index(
+                    model, field_name, ordering_fields if kind == "filter" else ()
+                )
+                if scan
+                else None,
+            }
+        )
+    return report
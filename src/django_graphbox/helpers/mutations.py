@@ -14,6 +14,8 @@ from django.core.files.images import ImageFile
 from django.contrib.auth.hashers import make_password
 # pillow import
 from PIL import Image
+# models
+from django_graphbox.models import Tombstone
 # logging
 import logging
 
@@ -98,7 +100,7 @@ def build_mutate_for_create(self):
             self (object): SchemaBuilder object
     """
     def mutate_create_function(parent, info, **kwargs):
-        operation_name=info.operation.selection_set.selections[0].name.value.lower()
+        operation_name=info.field_name.lower()
         config=self._models_by_op_name[operation_name]
         # get access group for validate access
         access_group=get_access_group('create_field', config)
@@ -153,6 +155,7 @@ def build_mutate_for_create(self):
                     valid_operation=evaluate_result(config['validators_by_operation']['create_field'], info, instance, **kwargs)
                 if valid_operation:
                     instance.save()
+                    mark_primary_write(self, info)
                     callbacks=config.get('callbacks_by_operation').get('create_field')
                     if callbacks is not None:
                         for callback in callbacks:
@@ -169,7 +172,7 @@ def build_mutate_for_create(self):
 
 def build_mutate_for_update(self):
     def mutate_update_function(parent, info, **kwargs):
-        operation_name=info.operation.selection_set.selections[0].name.value.lower()
+        operation_name=info.field_name.lower()
         config=self._models_by_op_name[operation_name]
         # get access group for validate access
         access_group=get_access_group('update_field', config)
@@ -225,6 +228,7 @@ def build_mutate_for_update(self):
                                                 raise Exception(f'{value} no es una opción válida para {key}')
                                         setattr(instance, key, value)
                         instance.save()
+                        mark_primary_write(self, info)
                         callbacks=config.get('callbacks_by_operation').get('update_field')
                         if callbacks is not None:
                             for callback in callbacks:
@@ -243,7 +247,7 @@ def build_mutate_for_update(self):
 
 def build_mutate_for_delete(self):
     def mutate_delete_function(parent, info, **kwargs):
-        operation_name=info.operation.selection_set.selections[0].name.value.lower()
+        operation_name=info.field_name.lower()
         config=self._models_by_op_name[operation_name]
         # get access group for validate access
         access_group=get_access_group('delete_field', config)
@@ -262,6 +266,9 @@ def build_mutate_for_delete(self):
                         valid_operation=evaluate_result(config['validators_by_operation']['delete_field'], info, instance, **kwargs)
                     if valid_operation:
                         instance.delete()
+                        if config.get('sync_field') is not None:
+                            Tombstone.objects.create(model_label=model._meta.label, object_id=str(kwargs.get('id')))
+                        mark_primary_write(self, info)
                         callbacks=config.get('callbacks_by_operation').get('delete_field')
                         if callbacks is not None:
                             for callback in callbacks:
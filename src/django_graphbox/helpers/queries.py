@@ -1,15 +1,29 @@
 # graphene imports
 import graphene
+from graphene.utils.str_converters import to_camel_case
 # shared helpers
 from django_graphbox.helpers.shared import *
+# nested lists helpers
+from django_graphbox.helpers.relations import prefetch_nested_lists
+# cache helpers
+from django_graphbox.helpers.cache import get_queryset_cache_key, get_or_set_cached
+# index helpers
+from django_graphbox.helpers.indexes import is_indexed_lookup, resolve_lookup_path
+# global constants
+from django_graphbox.constants import MODEL_FIELD_TO_GRAPHENE_TYPE
 # django imports
-from django.db.models import Q
+from django.db.models import Q, Count, Sum, Avg, Min, Max
+from django.utils import timezone as tz
+# time management
+import datetime
+# models
+from django_graphbox.models import Tombstone
 
 # query resolver builders
 def build_field_by_id_resolver(self):
     def field_resolver_function(parent, info, **kwargs):
         # get model config by this path
-        operation_name=info.operation.selection_set.selections[0].name.value.lower()
+        operation_name=info.field_name.lower()
         config=self._models_by_op_name[operation_name]
         # get access group for validate access
         access_group=get_access_group('field_by_id', config)
@@ -19,7 +33,14 @@ def build_field_by_id_resolver(self):
             valid=True
         if valid:
             model=config.get('model')
-            result=model.objects.get(id=kwargs.get('id'))
+            annotations=get_selected_annotations(info, config)
+            database=get_read_database(self, info, model)
+            queryset=model.objects.using(database).annotate(**annotations).filter(id=kwargs.get('id'))
+            if config.get('cache') is not None:
+                cache_key=get_queryset_cache_key(config, 'field_by_id', queryset)
+                result=get_or_set_cached(config, cache_key, queryset.get)
+            else:
+                result=queryset.get()
             valid_operation=True
             if 'field_by_id' in config['validators_by_operation']:
                 valid_operation=evaluate_result(config['validators_by_operation']['field_by_id'], info, result, **kwargs)
@@ -35,55 +56,35 @@ def build_field_by_id_resolver(self):
 
 def build_field_list_resolver(self):
     def list_resolver_function(parent, info, **kwargs):
-        operation_name=info.operation.selection_set.selections[0].name.value.lower()
+        operation_name=info.field_name.lower()
         config=self._models_by_op_name[operation_name]
-        pagination_length=config.get('pagination_length')
-        pagination_style=config.get('pagination_style')
-        paginated_type=config.get('paginated_type')
-        external_filters=config.get('external_filters')
-        internal_filters=config.get('internal_filters')
-        filters_operator=config.get('filters_operator')
-        ordering_field=config.get('ordering_field')
-        query_object=None
-        for filter_config in external_filters:
-            param_value=kwargs.get(filter_config.get('param_name'))
-            if param_value is not None:
-                if query_object is None:
-                    query_object=Q(**{filter_config.get('field_name'): param_value})
-                else:
-                    query_object.add(Q(**{filter_config.get('field_name'): param_value}), filters_operator)
-        for filter_config in internal_filters:
-            resolver_filter=filter_config.get('resolver_filter')
-            on_return_none=filter_config.get('on_return_none')
-            value_filter=resolver_filter(info, **kwargs)
-            if value_filter==None:
-                if on_return_none=='skip':
-                    continue
-                elif on_return_none=='set__isnull':
-                    if query_object is None:
-                        query_object=Q(**{f"{filter_config.get('field_name')}__isnull": True})
-                    else:
-                        query_object.add(Q(**{f"{filter_config.get('field_name')}__isnull": True}), filters_operator)
-            else:
-                if query_object is None:
-                    query_object=Q(**{filter_config.get('field_name'): value_filter})
-                else:
-                    query_object.add(Q(**{filter_config.get('field_name'): value_filter}), filters_operator)
-        if query_object is None:
-            query_object=Q()
-        # get access group for validate access
+        # get access group for validate access before resolving any filter
         access_group=get_access_group('list_field', config)
         if self._session_manager!=None:
             valid, actual_user_instance, error=self._session_manager.validate_access(info.context, access_group)
         else:
             valid=True
         if valid:
+            pagination_length=config.get('pagination_length')
+            pagination_style=config.get('pagination_style')
+            paginated_type=config.get('paginated_type')
+            ordering_fields=config.get('ordering_fields')
+            order_by=kwargs.get('order_by')
+            if order_by:
+                # graphene>=3 resolves the enum members, graphene<3 the values
+                ordering_fields=tuple(getattr(key, 'value', key) for key in order_by)+ordering_fields
+            query_object, internal_conditions=config.get('filter_plan').build_query_conditions(info, **kwargs)
             model=config.get('model')
+            nested_field='items' if pagination_length>0 and pagination_style=='paginated' else None
+            annotations=get_selected_annotations(info, config, nested_field)
+            database=get_read_database(self, info, model)
+            queryset=model.objects.using(database).filter(query_object).annotate(**annotations).order_by(*ordering_fields)
+            queryset=prefetch_nested_lists(queryset, info, config, nested_field)
             if pagination_length == 0:
-                if type(ordering_field) in [list, tuple]:
-                    result=model.objects.filter(query_object).order_by(*ordering_field)
-                else:
-                    result=model.objects.filter(query_object).order_by(ordering_field)
+                result=queryset
+                if config.get('cache') is not None:
+                    cache_key=get_queryset_cache_key(config, 'list_field', queryset)
+                    result=get_or_set_cached(config, cache_key, lambda: list(queryset))
                 callbacks=config.get('callbacks_by_operation').get('list_field')
                 if callbacks is not None:
                     for callback in callbacks:
@@ -94,10 +95,10 @@ def build_field_list_resolver(self):
                 pagina=kwargs.get('page')
                 inicio=(pagina*pagination_length)-pagination_length
                 fin=inicio+pagination_length
-                if type(ordering_field) in [list, tuple]:
-                    items=model.objects.filter(query_object).order_by(*ordering_field)[inicio:fin]
-                else:
-                    items=model.objects.filter(query_object).order_by(ordering_field)[inicio:fin]
+                items=queryset[inicio:fin]
+                if config.get('cache') is not None:
+                    cache_key=get_queryset_cache_key(config, 'list_field', items)
+                    items=get_or_set_cached(config, cache_key, lambda: list(queryset[inicio:fin]))
                 callbacks=config.get('callbacks_by_operation').get('list_field')
                 if callbacks is not None:
                     for callback in callbacks:
@@ -106,16 +107,305 @@ def build_field_list_resolver(self):
                 if pagination_style=='infinite':
                     return items
                 else:
-                    total_items=model.objects.filter(query_object).count()
+                    count_queryset=model.objects.using(database).filter(query_object)
+                    if config.get('cache') is not None:
+                        cache_key=get_queryset_cache_key(config, 'list_field_count', count_queryset)
+                        total_items=get_or_set_cached(config, cache_key, count_queryset.count)
+                    else:
+                        total_items=count_queryset.count()
                     total_pages=total_items//pagination_length
                     if total_items%pagination_length>0:
                         total_pages+=1
                     has_next_page = pagina<total_pages
                     has_previous_page = pagina>1
-                    return paginated_type(items=items, has_next_page=has_next_page, has_previous_page=has_previous_page, total_pages=total_pages, total_items=total_items)
+                    page_data={'items':items, 'has_next_page':has_next_page, 'has_previous_page':has_previous_page, 'total_pages':total_pages, 'total_items':total_items}
+                    if config.get('facets_type') is not None:
+                        page_data['facets']=FacetsContext(config, internal_conditions, database, **kwargs)
+                    return paginated_type(**page_data)
         return None
     return list_resolver_function
 
+def build_changes_resolver(self):
+    def changes_resolver_function(parent, info, **kwargs):
+        operation_name=info.field_name.lower()
+        config=self._models_by_op_name[operation_name]
+        # get access group for validate access
+        access_group=get_access_group('changes_field', config)
+        if self._session_manager!=None:
+            valid, actual_user_instance, error=self._session_manager.validate_access(info.context, access_group)
+        else:
+            valid=True
+        if valid:
+            model=config.get('model')
+            sync_field=config.get('sync_field')
+            since=kwargs.get('since')
+            # rows saved before the query time can commit after the read, so the watermark goes back sync_margin seconds
+            # and the next sync returns again the changes of the margin
+            query_time=tz.now()
+            watermark=query_time-datetime.timedelta(seconds=config.get('sync_margin'))
+            query_object=config.get('filter_plan').build_query(info, **kwargs)
+            annotations=get_selected_annotations(info, config, 'items')
+            # the changes are read from the primary, a replica lag would skip the rows older than the watermark
+            database=self._write_database
+            items=model.objects.using(database).filter(query_object).filter(**{f'{sync_field}__gt': since, f'{sync_field}__lte': query_time}).annotate(**annotations).order_by(sync_field, 'pk')
+            items=prefetch_nested_lists(items, info, config, 'items')
+            deleted_ids=Tombstone.objects.using(database).filter(model_label=model._meta.label, deletion_time__gt=since, deletion_time__lte=query_time).values_list('object_id', flat=True)
+            callbacks=config.get('callbacks_by_operation').get('changes_field')
+            if callbacks is not None:
+                for callback in callbacks:
+                    if callable(callback):
+                        callback(info, items, **kwargs)
+            return config.get('changes_type')(items=items, deleted_ids=deleted_ids, watermark=watermark)
+        return None
+    return changes_resolver_function
+
+def build_aggregate_resolver(self):
+    def aggregate_resolver_function(parent, info, **kwargs):
+        operation_name=info.field_name.lower()
+        config=self._models_by_op_name[operation_name]
+        # same access rules of list_field unless aggregate_field is configured
+        operation='aggregate_field' if 'aggregate_field' in config['access_by_operation'] else 'list_field'
+        access_group=get_access_group(operation, config)
+        if self._session_manager!=None:
+            valid, actual_user_instance, error=self._session_manager.validate_access(info.context, access_group)
+        else:
+            valid=True
+        if valid:
+            model=config.get('model')
+            aggregate_type=config.get('aggregate_type')
+            query_object=config.get('filter_plan').build_query(info, **kwargs)
+            annotations=get_aggregate_annotations(config.get('aggregations'))
+            group_by=[getattr(key, 'value', key) for key in (kwargs.get('group_by') or [])]
+            queryset=model.objects.using(get_read_database(self, info, model)).filter(query_object)
+            if len(group_by)>0:
+                rows=queryset.values(*group_by).annotate(**annotations).order_by(*group_by)
+            else:
+                rows=[queryset.aggregate(**annotations)]
+            return [aggregate_type(**row) for row in rows]
+        return None
+    return aggregate_resolver_function
+
+# precompiled filters
+
+class FilterPlan:
+    """Filters of a model config compiled once on add_model.
+
+    The per-request work is reduced to read the arguments, call the internal resolvers and build a single Q object.
+    """
+
+    def __init__(self, external_filters=[], internal_filters=[], filters_operator=Q.AND):
+        """Compile the filters of a model config.
+
+        Args:
+            external_filters (list): External filters config. [{'field_name': str, 'param_name': str, 'param_type': graphene type}, ...]
+            internal_filters (list): Internal filters config. [{'field_name': str, 'resolver_filter': callable(info, **kwargs), 'on_return_none': 'skip' or 'set__isnull'}, ...]
+            filters_operator (Q.AND, Q.OR): Operator used to join the filters.
+        """
+        self.external_filters=tuple(
+            (filter_config.get('param_name'), filter_config.get('field_name'))
+            for filter_config in external_filters
+        )
+        self.internal_filters=tuple(
+            (
+                filter_config.get('field_name'),
+                filter_config.get('resolver_filter'),
+                filter_config.get('on_return_none')=='set__isnull',
+                f"{filter_config.get('field_name')}__isnull",
+            )
+            for filter_config in internal_filters
+        )
+        self.filters_operator=filters_operator
+
+    def external_conditions(self, exclude_params=(), **kwargs):
+        """Get the (lookup, value) conditions of the external filters present on kwargs.
+
+        Args:
+            exclude_params (tuple): Param names to ignore.
+            **kwargs (dict): kwargs input from graphql.
+        Returns:
+            list: [(lookup, value), ...]
+        """
+        conditions=[]
+        for param_name, field_name in self.external_filters:
+            if param_name in exclude_params:
+                continue
+            param_value=kwargs.get(param_name)
+            if param_value is not None:
+                conditions.append((field_name, param_value))
+        return conditions
+
+    def internal_conditions(self, info, **kwargs):
+        """Get the (lookup, value) conditions of the internal filters calling each resolver_filter.
+
+        Args:
+            info (dict): graphql.execution.base.ResolveInfo object.
+            **kwargs (dict): kwargs input from graphql.
+        Returns:
+            list: [(lookup, value), ...]
+        """
+        conditions=[]
+        for field_name, resolver_filter, set_isnull, isnull_lookup in self.internal_filters:
+            value_filter=resolver_filter(info, **kwargs)
+            if value_filter is None:
+                if set_isnull:
+                    conditions.append((isnull_lookup, True))
+            else:
+                conditions.append((field_name, value_filter))
+        return conditions
+
+    def join(self, conditions):
+        """Join the conditions with the filters operator in a single Q object."""
+        if len(conditions)==0:
+            return Q()
+        return Q(*conditions, _connector=self.filters_operator)
+
+    def build_query(self, info, **kwargs):
+        """Build the Q object for the request.
+
+        Args:
+            info (dict): graphql.execution.base.ResolveInfo object.
+            **kwargs (dict): kwargs input from graphql.
+        Returns:
+            Q: Query object with all the filters applied.
+        """
+        return self.build_query_conditions(info, **kwargs)[0]
+
+    def build_query_conditions(self, info, **kwargs):
+        """Build the Q object for the request with the internal conditions, to reuse them on the facets without calling the resolvers again.
+
+        Args:
+            info (dict): graphql.execution.base.ResolveInfo object.
+            **kwargs (dict): kwargs input from graphql.
+        Returns:
+            tuple: (query_object (Q), internal_conditions (list))
+        """
+        internal_conditions=self.internal_conditions(info, **kwargs)
+        return self.join(self.external_conditions(**kwargs)+internal_conditions), internal_conditions
+
+    async def ainternal_conditions(self, info, **kwargs):
+        """Async version of internal_conditions, the resolvers can be sync or async callables."""
+        conditions=[]
+        for field_name, resolver_filter, set_isnull, isnull_lookup in self.internal_filters:
+            value_filter=await call_async(resolver_filter, info, **kwargs)
+            if value_filter is None:
+                if set_isnull:
+                    conditions.append((isnull_lookup, True))
+            else:
+                conditions.append((field_name, value_filter))
+        return conditions
+
+    async def abuild_query(self, info, **kwargs):
+        """Async version of build_query, the resolvers can be sync or async callables."""
+        return (await self.abuild_query_conditions(info, **kwargs))[0]
+
+    async def abuild_query_conditions(self, info, **kwargs):
+        """Async version of build_query_conditions, the resolvers can be sync or async callables."""
+        internal_conditions=await self.ainternal_conditions(info, **kwargs)
+        return self.join(self.external_conditions(**kwargs)+internal_conditions), internal_conditions
+
+# facets
+
+class FacetValueType(graphene.ObjectType):
+    """Count of items for a value of a facet field."""
+
+    value = graphene.String()
+    count = graphene.Int()
+
+class FacetsContext:
+    """Filters of a request used to resolve the facets lazily, only the selected facet fields are queried.
+
+    The internal conditions are the ones of the list query, so the resolver_filter of the internal filters are not called again.
+    """
+
+    def __init__(self, config, internal_conditions, database=None, **kwargs):
+        self.config=config
+        self.database=database
+        self.kwargs=kwargs
+        self.internal_conditions=internal_conditions
+
+def get_facet_fields(model, external_filters=[]):
+    """Get the facet fields of a model from the external filters on fields with choices
+
+    Args:
+        model (object): Django model class.
+        external_filters (list): External filters config.
+    Returns:
+        dict: {'facet_name': {'field_path': str, 'field': django.db.models.Field, 'param_names': [str, ...]}, ...}
+    """
+    facet_fields={}
+    paths={}
+    for filter_config in external_filters:
+        field_name=filter_config.get('field_name')
+        final_model, field, lookup=resolve_lookup_path(model, field_name)
+        if field is None or not field.choices or lookup not in ['exact', 'in']:
+            continue
+        field_path=field_name if lookup=='exact' and not field_name.endswith('__exact') else field_name[:-len(lookup)-2]
+        if field_path not in paths:
+            paths[field_path]=filter_config.get('param_name')
+            facet_fields[filter_config.get('param_name')]={'field_path': field_path, 'field': field, 'param_names': []}
+        facet_fields[paths[field_path]]['param_names'].append(filter_config.get('param_name'))
+    return facet_fields
+
+def build_facet_resolver(facet_config):
+    def facet_resolver_function(parent, info, **kwargs):
+        config=parent.config
+        field_path=facet_config.get('field_path')
+        filter_plan=config.get('filter_plan')
+        # the facet own filter is excluded to count all the options
+        conditions=filter_plan.external_conditions(exclude_params=facet_config.get('param_names'), **parent.kwargs)+parent.internal_conditions
+        rows=config.get('model').objects.using(parent.database).filter(filter_plan.join(conditions)).values(field_path).annotate(count=Count('pk')).order_by()
+        counts={row[field_path]: row['count'] for row in rows}
+        facet_values=[]
+        for value, label in facet_config.get('field').flatchoices:
+            facet_values.append(FacetValueType(value=value, count=counts.pop(value, 0)))
+        for value, count in counts.items():
+            facet_values.append(FacetValueType(value=value, count=count))
+        return facet_values
+    return facet_resolver_function
+
+def build_facets_type(model, facet_fields={}, async_resolvers=False):
+    """Build the graphene type with a list of FacetValueType by facet field
+
+    Args:
+        model (object): Django model class.
+        facet_fields (dict): Facet fields as returned by get_facet_fields.
+        async_resolvers (bool): If True, the facet resolvers run on a worker thread for the async execution.
+    Returns:
+        graphene.ObjectType: Facets type or None if facet_fields is empty.
+    """
+    if len(facet_fields)==0:
+        return None
+    type_attrs={}
+    for facet_name, facet_config in facet_fields.items():
+        type_attrs[facet_name]=graphene.List(FacetValueType)
+        facet_resolver_function=build_facet_resolver(facet_config)
+        if async_resolvers:
+            facet_resolver_function=to_async_resolver(facet_resolver_function)
+        type_attrs[f'resolve_{facet_name}']=facet_resolver_function
+    return type(f'{model.__name__}FacetsType', (graphene.ObjectType,), type_attrs)
+
+def build_facets_resolver(self):
+    def facets_resolver_function(parent, info, **kwargs):
+        operation_name=info.field_name.lower()
+        config=self._models_by_op_name[operation_name]
+        access_group=get_access_group('list_field', config)
+        if self._session_manager!=None:
+            valid, actual_user_instance, error=self._session_manager.validate_access(info.context, access_group)
+        else:
+            valid=True
+        if valid:
+            internal_conditions=config.get('filter_plan').internal_conditions(info, **kwargs)
+            return FacetsContext(config, internal_conditions, get_read_database(self, info, config.get('model')), **kwargs)
+        return None
+    return facets_resolver_function
+
+def get_facets_args(model_config):
+    """Get the arguments of the facets query: the external filters"""
+    facets_args={}
+    for filter_config in model_config.get('external_filters'):
+        facets_args[filter_config.get('param_name')]=filter_config.get('param_type')
+    return facets_args
+
 # filters_args getter
 
 def get_filters_args(model_config):
@@ -123,10 +413,165 @@ def get_filters_args(model_config):
     external_filters=model_config.get('external_filters')
     for filter_config in external_filters:
         filters_args[filter_config.get('param_name')]=filter_config.get('param_type')
+    if model_config.get('order_by_enum') is not None:
+        filters_args['order_by']=graphene.List(graphene.NonNull(model_config.get('order_by_enum')))
     if model_config.get('pagination_length') != 0:
         filters_args['page']=graphene.Int(required=True)
     return filters_args
 
+# aggregate builders
+
+AGGREGATE_FUNCTIONS={
+    'sum': Sum,
+    'avg': Avg,
+    'min': Min,
+    'max': Max,
+}
+
+def get_aggregate_annotations(aggregations):
+    """Build the aggregate expressions of the aggregations config
+
+    Args:
+        aggregations (dict): Aggregations config of the model.
+    Returns:
+        dict: {'count': Count('pk'), 'field_sum': Sum('field'), ...}
+    """
+    functions=aggregations.get('functions', ['count', 'sum', 'avg', 'min', 'max'])
+    annotations={}
+    if 'count' in functions:
+        annotations['count']=Count('pk')
+    for field_name in aggregations.get('fields', []):
+        for function_name in functions:
+            if function_name in AGGREGATE_FUNCTIONS:
+                annotations[f'{field_name}_{function_name}']=AGGREGATE_FUNCTIONS[function_name](field_name)
+    return annotations
+
+def build_aggregate_types(model, aggregations={}):
+    """Build the graphene types for the aggregate query of a model
+
+    Args:
+        model (object): Django model class.
+        aggregations (dict): Aggregations config. {'fields': [...], 'functions': [...], 'group_by': [...]}
+    Returns:
+        tuple: (aggregate_type (graphene.ObjectType), group_by_enum (graphene.Enum)). (None, None) if aggregations is empty.
+    """
+    if len(aggregations)==0:
+        return None, None
+    functions=aggregations.get('functions', ['count', 'sum', 'avg', 'min', 'max'])
+    for function_name in functions:
+        if function_name!='count' and function_name not in AGGREGATE_FUNCTIONS:
+            raise Exception(f'Unknown aggregate function {function_name}')
+    type_attrs={}
+    if 'count' in functions:
+        type_attrs['count']=graphene.Int()
+    for field_name in aggregations.get('fields', []):
+        field_type=MODEL_FIELD_TO_GRAPHENE_TYPE.get(model._meta.get_field(field_name).get_internal_type(), graphene.Float)
+        for function_name in functions:
+            if function_name=='avg':
+                type_attrs[f'{field_name}_avg']=graphene.Float()
+            elif function_name in AGGREGATE_FUNCTIONS:
+                type_attrs[f'{field_name}_{function_name}']=field_type()
+    group_by_enum=None
+    group_by_fields=aggregations.get('group_by', [])
+    if len(group_by_fields)>0:
+        for field_name in group_by_fields:
+            field_type=MODEL_FIELD_TO_GRAPHENE_TYPE.get(model._meta.get_field(field_name).get_internal_type(), graphene.String)
+            type_attrs[field_name]=field_type()
+        group_by_enum=graphene.Enum(f'{model.__name__}AggregateGroupBy', [(field_name.upper(), field_name) for field_name in group_by_fields])
+    aggregate_type=type(f'{model.__name__}AggregateType', (graphene.ObjectType,), type_attrs)
+    return aggregate_type, group_by_enum
+
+def get_aggregate_args(model_config):
+    """Get the arguments of the aggregate query: external filters and group_by"""
+    aggregate_args={}
+    for filter_config in model_config.get('external_filters'):
+        aggregate_args[filter_config.get('param_name')]=filter_config.get('param_type')
+    if model_config.get('aggregate_group_by_enum') is not None:
+        aggregate_args['group_by']=graphene.List(graphene.NonNull(model_config.get('aggregate_group_by_enum')))
+    return aggregate_args
+
+# annotated fields
+
+def get_selected_annotations(info, config, nested_field=None):
+    """Get the annotations of the model config selected by the client
+
+    Args:
+        info (dict): graphql.execution.base.ResolveInfo object.
+        config (dict): Model config.
+        nested_field (str): Name of the field of the resolved type that contains the model type.
+    Returns:
+        dict: {'annotation_name': expression, ...} to apply with queryset.annotate.
+    """
+    annotations=config.get('annotations')
+    if not annotations:
+        return {}
+    selected=get_selected_field_names(info, nested_field)
+    return {
+        annotation['name']: annotation['expression']
+        for annotation in annotations
+        if annotation['name'] in selected or to_camel_case(annotation['name']) in selected
+    }
+
+def build_annotation_resolver(model, name, expression, async_resolvers=False):
+    def annotation_resolver_function(parent, info, **kwargs):
+        if hasattr(parent, name):
+            return getattr(parent, name)
+        # instances not loaded by the list or by id resolvers, like mutation results
+        queryset=model.objects.using(parent._state.db).filter(pk=parent.pk).annotate(**{name: expression}).values_list(name, flat=True)
+        if async_resolvers:
+            # the async execution awaits the query instead of running it on the event loop
+            return queryset.afirst()
+        return queryset.first()
+    return annotation_resolver_function
+
+def build_annotation_attrs(model, annotations=[], async_resolvers=False):
+    """Build the fields and resolvers of the annotations for the model type
+
+    Args:
+        model (object): Django model class.
+        annotations (list): Annotations config. [{'name': str, 'expression': django expression, 'type': graphene type}, ...]. type is optional and is inferred from the output field of the expression.
+        async_resolvers (bool): If True, the annotations of the instances loaded without them are queried with the async ORM.
+    Returns:
+        dict: Attributes to add on the model type.
+    """
+    type_attrs={}
+    for annotation in annotations:
+        name=annotation['name']
+        expression=annotation['expression']
+        field_type=annotation.get('type')
+        if field_type is None:
+            output_field=model.objects.annotate(**{name: expression}).query.annotations[name].output_field
+            field_type=MODEL_FIELD_TO_GRAPHENE_TYPE.get(output_field.get_internal_type(), graphene.String)
+        type_attrs[name]=field_type()
+        type_attrs[f'resolve_{name}']=build_annotation_resolver(model, name, expression, async_resolvers)
+    return type_attrs
+
+# order_by enum builder
+
+def build_order_by_enum(model, order_by_fields=[]):
+    """Build the graphene enum with the orderable keys of a model for the order_by argument
+
+    Args:
+        model (object): Django model class.
+        order_by_fields (list): Orderable fields. Each item is the field name or a dict {'field_name': str, 'allow_unindexed': bool}.
+    Returns:
+        graphene.Enum: Enum with FIELD_ASC and FIELD_DESC values or None if order_by_fields is empty.
+
+    Only fields backed by an index are allowed unless allow_unindexed is True.
+    """
+    if len(order_by_fields)==0:
+        return None
+    values={}
+    for order_config in order_by_fields:
+        if type(order_config)==str:
+            order_config={'field_name': order_config}
+        field_name=order_config.get('field_name')
+        if not order_config.get('allow_unindexed', False) and not is_indexed_lookup(model, field_name):
+            raise Exception(f"{field_name} is not indexed on {model.__name__}, add an index or set allow_unindexed to True for order_by")
+        values[f'{field_name.upper()}_ASC']=field_name
+        values[f'{field_name.upper()}_DESC']=f'-{field_name}'
+    return graphene.Enum(f'{model.__name__}OrderBy', list(values.items()))
+
 # return objects by pagination style
 
 def get_return_object(model_config):
@@ -0,0 +1,263 @@
+# graphene imports
+import graphene
+from graphene_django.registry import get_global_registry
+from graphene.utils.str_converters import to_camel_case
+# shared helpers
+from django_graphbox.helpers.shared import get_selected_field_nodes, collect_selected_field_nodes
+# django imports
+import django
+from django.db.models import F, Prefetch, Q, Window
+from django.db.models.functions import RowNumber
+
+# nested lists of reverse relations
+
+def get_nested_list_config(model, nested_list):
+    """Normalize a nested list config of add_model
+
+    Args:
+        model (object): Django model class.
+        nested_list (dict): {'relation': str, 'name': str, 'max_length': int, 'ordering': str or list}. name defaults to relation, max_length to 20 and ordering to 'pk'.
+    Returns:
+        dict: Nested list config with the related model, the foreign key field name and the prefetch attribute.
+    """
+    relation=nested_list['relation']
+    related_field=model._meta.get_field(relation)
+    if not related_field.one_to_many or related_field.concrete:
+        raise Exception(f"{relation} is not a reverse foreign key relation of {model.__name__}")
+    ordering=nested_list.get('ordering', 'pk')
+    if type(ordering)==str:
+        ordering=(ordering,)
+    name=nested_list.get('name', relation)
+    return {
+        'name': name,
+        'relation': relation,
+        'accessor_name': related_field.get_accessor_name(),
+        'related_model': related_field.related_model,
+        'fk_name': related_field.field.name,
+        'max_length': nested_list.get('max_length', 20),
+        'ordering': tuple(ordering),
+        'to_attr': f'_graphbox_{name}',
+    }
+
+def get_nested_list_bounds(nested_config, first=None, offset=None):
+    """Get the bounded (first, offset) of a nested list."""
+    max_length=nested_config['max_length']
+    if first is None or first>max_length:
+        first=max_length
+    if offset is None or offset<0:
+        offset=0
+    return max(first, 0), offset
+
+def build_nested_list_resolver(nested_config, async_resolvers=False):
+    def nested_list_resolver_function(parent, info, first=None, offset=None, **kwargs):
+        first, offset=get_nested_list_bounds(nested_config, first, offset)
+        if hasattr(parent, nested_config['to_attr']):
+            # the prefetch has the windows of all the aliases of the field, each alias keeps the rows of its own window
+            return [
+                child for child in getattr(parent, nested_config['to_attr'])
+                if offset<child._graphbox_row_number<=offset+first
+            ]
+        # parents not loaded by the list resolvers, like field_by_id or mutation results
+        manager=getattr(parent, nested_config['accessor_name'])
+        queryset=manager.all().order_by(*nested_config['ordering'])[offset:offset+first]
+        if async_resolvers:
+            async def load_children():
+                return [child async for child in queryset]
+            return load_children()
+        return queryset
+    return nested_list_resolver_function
+
+def build_nested_list_attrs(model, nested_lists=[], async_resolvers=False):
+    """Build the bounded fields of the reverse relations for the model type
+
+    Args:
+        model (object): Django model class.
+        nested_lists (list): Nested lists config. [{'relation': str, 'name': str, 'max_length': int, 'ordering': str or list}, ...]
+        async_resolvers (bool): If True, the children of the parents loaded without the prefetch are loaded with the async ORM.
+    Returns:
+        tuple: (type_attrs (dict), nested_configs (list))
+    """
+    if len(nested_lists)>0 and django.VERSION<(4, 2):
+        raise Exception("nested_lists requires Django>=4.2")
+    type_attrs={}
+    nested_configs=[]
+    for nested_list in nested_lists:
+        nested_config=get_nested_list_config(model, nested_list)
+        related_model=nested_config['related_model']
+        type_attrs[nested_config['name']]=graphene.List(
+            lambda related_model=related_model: get_global_registry().get_type_for_model(related_model),
+            first=graphene.Int(),
+            offset=graphene.Int(),
+        )
+        type_attrs[f"resolve_{nested_config['name']}"]=build_nested_list_resolver(nested_config, async_resolvers)
+        nested_configs.append(nested_config)
+    return type_attrs, nested_configs
+
+def get_argument_value(info, field_node, argument_name):
+    """Get the value of a literal or variable argument of a field node"""
+    for argument in field_node.arguments or []:
+        if argument.name.value==argument_name:
+            value_node=argument.value
+            if value_node.__class__.__name__ in ['VariableNode', 'Variable']:
+                return info.variable_values.get(value_node.name.value)
+            return int(value_node.value)
+    return None
+
+def get_nested_list_windows(info, nested_config, field_nodes):
+    """Get the bounded (first, offset) of each alias of a nested list
+
+    Args:
+        info (dict): graphql.execution.base.ResolveInfo object.
+        nested_config (dict): Nested list config.
+        field_nodes (list): Field nodes of the nested list, one by alias.
+    Returns:
+        list: [(first, offset), ...]
+    """
+    return [
+        get_nested_list_bounds(
+            nested_config,
+            get_argument_value(info, field_node, 'first'),
+            get_argument_value(info, field_node, 'offset'),
+        )
+        for field_node in field_nodes
+    ]
+
+def build_nested_prefetch(nested_config, windows, prefix=''):
+    """Build the prefetch of a nested list loading the windows of all the parents in one query
+
+    Args:
+        nested_config (dict): Nested list config.
+        windows (list): (first, offset) of the children by parent, one by alias of the nested list.
+        prefix (str): Lookup path of the parents when they are loaded by another relation.
+    Returns:
+        Prefetch: Prefetch object with the children on the to_attr of the nested config.
+    """
+    related_model=nested_config['related_model']
+    ordering=[
+        F(field_name[1:]).desc() if field_name.startswith('-') else F(field_name).asc()
+        for field_name in nested_config['ordering']
+    ]
+    condition=Q()
+    for first, offset in windows:
+        condition|=Q(_graphbox_row_number__gt=offset, _graphbox_row_number__lte=offset+first)
+    # ROW_NUMBER() OVER (PARTITION BY fk ORDER BY ordering) filtered by the window bounds
+    queryset=related_model.objects.order_by(*nested_config['ordering']).annotate(
+        _graphbox_row_number=Window(
+            expression=RowNumber(),
+            partition_by=[F(nested_config['fk_name'])],
+            order_by=ordering,
+        )
+    ).filter(condition)
+    return Prefetch(prefix+nested_config['accessor_name'], queryset=queryset, to_attr=nested_config['to_attr'])
+
+def prefetch_nested_lists(queryset, info, config, nested_field=None):
+    """Apply the prefetch of the nested lists selected by the client on a queryset
+
+    Args:
+        queryset (QuerySet): Queryset of the parents.
+        info (dict): graphql.execution.base.ResolveInfo object.
+        config (dict): Model config.
+        nested_field (str): Name of the field of the resolved type that contains the model type.
+    Returns:
+        QuerySet: Queryset with the prefetches.
+    """
+    nested_configs=config.get('nested_lists')
+    if not nested_configs:
+        return queryset
+    selected=get_selected_field_nodes(info, nested_field)
+    for nested_config in nested_configs:
+        field_nodes=selected.get(to_camel_case(nested_config['name'])) or selected.get(nested_config['name'])
+        if not field_nodes:
+            continue
+        windows=get_nested_list_windows(info, nested_config, field_nodes)
+        queryset=queryset.prefetch_related(build_nested_prefetch(nested_config, windows))
+    return queryset
+
+# relations of the selection for async resolvers
+
+def get_selected_relation_paths(info, model, selected, nested_configs_by_model={}, prefix='', in_prefetch=False):
+    """Get the select_related and prefetch_related lookups of the relations selected by the client
+
+    Args:
+        info (dict): graphql.execution.base.ResolveInfo object.
+        model (object): Django model class of the selection.
+        selected (dict): Selected field nodes as returned by get_selected_field_nodes.
+        nested_configs_by_model (dict): Nested lists config by model and name. {model: {'name': nested_config, ...}, ...}
+        prefix (str): Lookup path of the model.
+        in_prefetch (bool): If True, the relations are under a prefetch and all the lookups are prefetched.
+    Returns:
+        tuple: (select_related (list), prefetch_related (list of str or Prefetch))
+    """
+    select_paths=[]
+    prefetch_paths=[]
+    nested_configs=nested_configs_by_model.get(model, {})
+    for name, nested_config in nested_configs.items():
+        # bounded window of the nested list with the relations of its children, selected by the name of the nested list
+        field_nodes=selected.get(to_camel_case(name)) or selected.get(name)
+        if not field_nodes:
+            continue
+        child_selected={}
+        for field_node in field_nodes:
+            collect_selected_field_nodes(info, field_node.selection_set, child_selected)
+        windows=get_nested_list_windows(info, nested_config, field_nodes)
+        prefetch=build_nested_prefetch(nested_config, windows, prefix)
+        child_select, child_prefetch=get_selected_relation_paths(
+            info, nested_config['related_model'], child_selected, nested_configs_by_model
+        )
+        if len(child_select)>0:
+            prefetch.queryset=prefetch.queryset.select_related(*child_select)
+        if len(child_prefetch)>0:
+            prefetch.queryset=prefetch.queryset.prefetch_related(*child_prefetch)
+        prefetch_paths.append(prefetch)
+    for field in model._meta.get_fields():
+        if not field.is_relation or field.related_model is None:
+            continue
+        name=field.name if field.concrete else field.get_accessor_name()
+        if name is None or name in nested_configs:
+            continue
+        field_nodes=selected.get(to_camel_case(name)) or selected.get(name)
+        if not field_nodes or field_nodes[0].selection_set is None:
+            continue
+        child_selected={}
+        for field_node in field_nodes:
+            collect_selected_field_nodes(info, field_node.selection_set, child_selected)
+        path=prefix+name
+        single=(field.many_to_one or field.one_to_one) and not in_prefetch
+        if single:
+            select_paths.append(path)
+        else:
+            prefetch_paths.append(path)
+        child_select, child_prefetch=get_selected_relation_paths(
+            info, field.related_model, child_selected, nested_configs_by_model, path+'__', not single
+        )
+        select_paths+=child_select
+        prefetch_paths+=child_prefetch
+    return select_paths, prefetch_paths
+
+def preload_selected_relations(self, queryset, info, config, nested_field=None):
+    """Load the relations and nested lists selected by the client with the queryset
+
+    The async resolvers can't load the relations lazily, so they are joined or prefetched with the results.
+
+    Args:
+        self (object): SchemaBuilder object
+        queryset (QuerySet): Queryset of the model of the config.
+        info (dict): graphql.execution.base.ResolveInfo object.
+        config (dict): Model config.
+        nested_field (str): Name of the field of the resolved type that contains the model type.
+    Returns:
+        QuerySet: Queryset with the select_related and prefetch_related lookups.
+    """
+    nested_configs_by_model={}
+    for model_config in self._models_config.values():
+        nested_configs_by_model[model_config['model']]={
+            nested_config['name']: nested_config for nested_config in model_config.get('nested_lists') or []
+        }
+    select_paths, prefetch_paths=get_selected_relation_paths(
+        info, config['model'], get_selected_field_nodes(info, nested_field), nested_configs_by_model
+    )
+    if len(select_paths)>0:
+        queryset=queryset.select_related(*select_paths)
+    if len(prefetch_paths)>0:
+        queryset=queryset.prefetch_related(*prefetch_paths)
+    return queryset
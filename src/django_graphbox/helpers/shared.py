@@ -1,3 +1,13 @@
+# graphene utils
+from graphene.utils.str_converters import to_camel_case
+# django cache for the sticky primary window
+from django.core.cache import cache
+# hashing
+import hashlib
+# async adapters
+import inspect
+from asgiref.sync import sync_to_async
+
 # Dominant Access Group Getter
 
 def get_access_group(operation, model_config):
@@ -58,3 +68,195 @@ def evaluate_result(operation, info, model_instance, **kwargs):
     else:
         return True
 
+# async adapters
+
+async def call_async(function, *args, **kwargs):
+    """Call a sync or async callable from an async resolver
+
+    Sync callables run on a worker thread, so validators, callbacks and internal resolvers written for the sync resolvers can use the ORM.
+
+    Args:
+        function (callable): Sync or async callable.
+        *args: Positional arguments of the callable.
+        **kwargs: Keyword arguments of the callable.
+    Returns:
+        object: Result of the callable.
+    """
+    if inspect.iscoroutinefunction(function):
+        return await function(*args, **kwargs)
+    result = await sync_to_async(function)(*args, **kwargs)
+    if inspect.isawaitable(result):
+        result = await result
+    return result
+
+def to_async_resolver(resolver_function):
+    """Adapt a sync resolver to run on a worker thread
+
+    Only for resolvers that return loaded values, the lazy querysets can't be evaluated by the async execution.
+
+    Args:
+        resolver_function (callable): Sync resolver.
+    Returns:
+        callable: Async resolver.
+    """
+    async def async_resolver_function(parent, info, **kwargs):
+        return await sync_to_async(resolver_function)(parent, info, **kwargs)
+    return async_resolver_function
+
+async def async_evaluate_result(operation, info, model_instance, **kwargs):
+    """Async version of evaluate_result, the validators can be sync or async callables
+
+    Args:
+        operation (dict): operation validators config.
+        info (dict): graphql.execution.base.ResolveInfo object.
+        model_instance (object): model instance of operation.
+        **kwargs (dict): kwargs input from graphql.
+    Returns:
+        bool: Result of evaluation of validators of operation config.
+    """
+    if 'validators' in operation:
+        validators = operation['validators']
+        connector = operation.get('connector', 'AND')
+        result = connector == 'AND'
+        for validator in validators:
+            if callable(validator):
+                value = await call_async(validator, info, model_instance, **kwargs)
+            elif validator==None:
+                raise Exception('Validator must be a callable or dict with validators and connector')
+            else:
+                value = await async_evaluate_result(validator, info, model_instance, **kwargs)
+            if connector == 'AND':
+                result = result and value
+            else:
+                result = result or value
+        return result
+    else:
+        return True
+
+async def async_run_callbacks(config, operation, info, result, **kwargs):
+    """Run the sync or async callbacks of an operation from an async resolver"""
+    callbacks=config.get('callbacks_by_operation').get(operation)
+    if callbacks is not None:
+        for callback in callbacks:
+            if callable(callback):
+                await call_async(callback, info, result, **kwargs)
+
+# selection set inspection
+
+def collect_selected_fields(info, selection_set, fields):
+    """Collect the field nodes of a selection set, including the fragments, on the fields dict by name"""
+    if selection_set is None:
+        return
+    for selection in selection_set.selections:
+        # node class names of graphql-core>=3 and graphql-core<3
+        kind = selection.__class__.__name__
+        if kind in ['FragmentSpreadNode', 'FragmentSpread']:
+            collect_selected_fields(info, info.fragments[selection.name.value].selection_set, fields)
+        elif kind in ['InlineFragmentNode', 'InlineFragment']:
+            collect_selected_fields(info, selection.selection_set, fields)
+        else:
+            fields[selection.name.value] = selection
+
+def get_selected_fields(info, nested_field=None):
+    """Get the fields selected by the client on the resolved field
+
+    Args:
+        info (dict): graphql.execution.base.ResolveInfo object.
+        nested_field (str): Name of a field of the resolved type whose selection is returned instead, like 'items' on paginated types.
+    Returns:
+        dict: {'selected_field_name': field_node, ...} with the names as written on the document.
+    """
+    fields = {}
+    for field_node in info.field_nodes:
+        collect_selected_fields(info, field_node.selection_set, fields)
+    if nested_field is not None:
+        nested_fields = {}
+        nested_selection = fields.get(to_camel_case(nested_field)) or fields.get(nested_field)
+        if nested_selection is not None:
+            collect_selected_fields(info, nested_selection.selection_set, nested_fields)
+        fields = nested_fields
+    return fields
+
+def collect_selected_field_nodes(info, selection_set, fields):
+    """Collect the field nodes of a selection set, including the fragments, on the fields dict by name with the nodes of all the aliases"""
+    if selection_set is None:
+        return
+    for selection in selection_set.selections:
+        kind = selection.__class__.__name__
+        if kind in ['FragmentSpreadNode', 'FragmentSpread']:
+            collect_selected_field_nodes(info, info.fragments[selection.name.value].selection_set, fields)
+        elif kind in ['InlineFragmentNode', 'InlineFragment']:
+            collect_selected_field_nodes(info, selection.selection_set, fields)
+        else:
+            fields.setdefault(selection.name.value, []).append(selection)
+
+def get_selected_field_nodes(info, nested_field=None):
+    """Get the field nodes selected by the client on the resolved field, with a node by alias of each field
+
+    Args:
+        info (dict): graphql.execution.base.ResolveInfo object.
+        nested_field (str): Name of a field of the resolved type whose selection is returned instead, like 'items' on paginated types.
+    Returns:
+        dict: {'selected_field_name': [field_node, ...], ...} with the names as written on the document.
+    """
+    fields = {}
+    for field_node in info.field_nodes:
+        collect_selected_field_nodes(info, field_node.selection_set, fields)
+    if nested_field is not None:
+        nested_fields = {}
+        for nested_selection in fields.get(to_camel_case(nested_field)) or fields.get(nested_field) or []:
+            collect_selected_field_nodes(info, nested_selection.selection_set, nested_fields)
+        fields = nested_fields
+    return fields
+
+def get_selected_field_names(info, nested_field=None):
+    """Get the names of the fields selected by the client on the resolved field
+
+    Args:
+        info (dict): graphql.execution.base.ResolveInfo object.
+        nested_field (str): Name of a field of the resolved type whose selection is returned instead.
+    Returns:
+        set: Selected field names as written on the document.
+    """
+    return set(get_selected_fields(info, nested_field).keys())
+
+# read database routing
+
+def get_sticky_primary_key(info):
+    """Get the cache key of the sticky primary window for the client of the request"""
+    request = info.context
+    client = request.headers.get("Authorization") or request.META.get("REMOTE_ADDR", "")
+    return "graphbox_sticky_primary:" + hashlib.sha1(client.encode()).hexdigest()
+
+def mark_primary_write(self, info):
+    """Mark the request, and the client for the sticky window, to read from the primary after a write
+
+    Args:
+        self (object): SchemaBuilder object
+        info (dict): graphql.execution.base.ResolveInfo object.
+    """
+    if self._read_database is None:
+        return
+    setattr(info.context, "_graphbox_primary_write", True)
+    if self._sticky_primary_seconds > 0:
+        cache.set(get_sticky_primary_key(info), True, self._sticky_primary_seconds)
+
+def get_read_database(self, info, model):
+    """Get the database alias for the read operations of a model
+
+    Args:
+        self (object): SchemaBuilder object
+        info (dict): graphql.execution.base.ResolveInfo object.
+        model (object): Django model class.
+    Returns:
+        str: Database alias. None to use the django database routers.
+    """
+    if self._read_database is None:
+        return None
+    if getattr(info.context, "_graphbox_primary_write", False):
+        return self._write_database
+    if self._sticky_primary_seconds > 0 and cache.get(get_sticky_primary_key(info)):
+        return self._write_database
+    if callable(self._read_database):
+        return self._read_database(info, model)
+    return self._read_database
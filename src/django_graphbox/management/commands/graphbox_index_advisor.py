@@ -0,0 +1,56 @@
+# django imports
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.module_loading import import_string
+
+# builder
+from django_graphbox.builder import SchemaBuilder
+
+
+class Command(BaseCommand):
+    help = "Report the filters and ordering fields of the generated list operations that will scan the table and suggest index definitions."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--schema",
+            action="append",
+            default=[],
+            help="Dotted path of the schema or module that builds the schema. Defaults to GRAPHENE['SCHEMA'] setting.",
+        )
+        parser.add_argument(
+            "--explain",
+            action="store_true",
+            help="Use the explain output of the database to detect scans.",
+        )
+
+    def handle(self, *args, **options):
+        schema_paths = options["schema"]
+        if len(schema_paths) == 0:
+            schema_path = getattr(settings, "GRAPHENE", {}).get("SCHEMA")
+            if schema_path is None:
+                raise CommandError("Use --schema or define GRAPHENE['SCHEMA'] setting")
+            schema_paths = [schema_path]
+        for schema_path in schema_paths:
+            # importing the schema executes the builders
+            try:
+                import_string(schema_path)
+            except ImportError:
+                __import__(schema_path)
+        scans = 0
+        for builder in list(SchemaBuilder._instances):
+            for entry in builder.advise_indexes(explain=options["explain"]):
+                if entry["scan"]:
+                    scans += 1
+                    self.stdout.write(
+                        self.style.WARNING(
+                            f"SCAN all_{entry['model'].lower()} {entry['kind']} '{entry['field_name']}'"
+                        )
+                    )
+                    self.stdout.write(f"    suggestion: {entry['suggestion']}")
+                else:
+                    self.stdout.write(
+                        f"OK   all_{entry['model'].lower()} {entry['kind']} '{entry['field_name']}'"
+                    )
+                if options["explain"] and entry["explain"] is not None:
+                    self.stdout.write(f"    explain: {entry['explain']}")
+        self.stdout.write(f"{scans} operations will scan the table")
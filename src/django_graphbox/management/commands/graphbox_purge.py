@@ -0,0 +1,137 @@
+# django imports
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+from django.utils import timezone as tz
+
+# time management
+import datetime
+import time
+
+# models
+from django_graphbox.models import FailedLoginAttempt, JsonWebToken, LoginCaptcha, Tombstone
+
+# chunked deletes
+from django_graphbox.purge import delete_in_pk_chunks
+
+
+class Command(BaseCommand):
+    help = "Delete the old rows of the session tables (FailedLoginAttempt, JsonWebToken and LoginCaptcha) and the delta sync tombstones with a retention policy by table."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--attempts-days",
+            type=int,
+            default=30,
+            help="Delete the failed login attempts older than these days. Defaults to 30.",
+        )
+        parser.add_argument(
+            "--inactive-tokens-days",
+            type=int,
+            default=30,
+            help="Delete the inactive persistent tokens older than these days. Defaults to 30.",
+        )
+        parser.add_argument(
+            "--tokens-days",
+            type=int,
+            default=None,
+            help="Delete all the persistent tokens older than these days, active or not. Defaults to keep the active tokens, permanent sessions use them.",
+        )
+        parser.add_argument(
+            "--captchas-minutes",
+            type=int,
+            default=60,
+            help="Delete the captchas older than these minutes. The captchas of the last hour are used to limit the captchas by user. Defaults to 60.",
+        )
+        parser.add_argument(
+            "--tombstones-days",
+            type=int,
+            default=None,
+            help="Delete the tombstones of the deleted rows older than these days. The clients of the <model>_changes queries must sync within these days or reload all the rows, an older since misses the deletions. Defaults to keep the tombstones.",
+        )
+        parser.add_argument(
+            "--table",
+            action="append",
+            choices=["attempts", "tokens", "captchas", "tombstones"],
+            default=[],
+            help="Table to purge, can be repeated. Defaults to all the tables.",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=1000,
+            help="Primary keys by delete query. Defaults to 1000.",
+        )
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=0,
+            help="Seconds to wait between delete queries. Defaults to 0.",
+        )
+        parser.add_argument(
+            "--database",
+            default=None,
+            help="Database alias of the session tables. Defaults to the router.",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Count the rows to delete without deleting them.",
+        )
+
+    def get_policies(self, options):
+        """Get the (name, queryset) of the rows to delete by table."""
+        now = tz.now()
+        policies = []
+        tables = options["table"] or ["attempts", "tokens", "captchas", "tombstones"]
+        if "attempts" in tables:
+            cutoff = now - datetime.timedelta(days=options["attempts_days"])
+            policies.append(
+                ("FailedLoginAttempt", FailedLoginAttempt.objects.filter(timestamp__lt=cutoff))
+            )
+        if "tokens" in tables:
+            cutoff = now - datetime.timedelta(days=options["inactive_tokens_days"])
+            condition = Q(active=False) & (
+                Q(inactive_time__lt=cutoff)
+                | Q(inactive_time__isnull=True, creation_time__lt=cutoff)
+            )
+            if options["tokens_days"] is not None:
+                condition |= Q(
+                    creation_time__lt=now - datetime.timedelta(days=options["tokens_days"])
+                )
+            policies.append(("JsonWebToken", JsonWebToken.objects.filter(condition)))
+        if "captchas" in tables:
+            cutoff = now - datetime.timedelta(minutes=options["captchas_minutes"])
+            policies.append(
+                ("LoginCaptcha", LoginCaptcha.objects.filter(creation_time__lt=cutoff))
+            )
+        if "tombstones" in tables and options["tombstones_days"] is not None:
+            cutoff = now - datetime.timedelta(days=options["tombstones_days"])
+            policies.append(
+                ("Tombstone", Tombstone.objects.filter(deletion_time__lt=cutoff))
+            )
+        return policies
+
+    def handle(self, *args, **options):
+        if options["chunk_size"] < 1:
+            raise CommandError("--chunk-size must be positive")
+        if "tombstones" in options["table"] and options["tombstones_days"] is None:
+            raise CommandError("--table tombstones requires --tombstones-days")
+        total_deleted = 0
+        total_start = time.monotonic()
+        for name, queryset in self.get_policies(options):
+            if options["database"] is not None:
+                queryset = queryset.using(options["database"])
+            start = time.monotonic()
+            deleted = delete_in_pk_chunks(
+                queryset,
+                chunk_size=options["chunk_size"],
+                sleep=options["sleep"],
+                dry_run=options["dry_run"],
+            )
+            total_deleted += deleted
+            self.stdout.write(
+                f"{name}: {deleted} rows {'to delete' if options['dry_run'] else 'deleted'} in {time.monotonic() - start:.2f}s"
+            )
+        self.stdout.write(
+            f"Total: {total_deleted} rows {'to delete' if options['dry_run'] else 'deleted'} in {time.monotonic() - total_start:.2f}s"
+        )
@@ -0,0 +1,53 @@
+# django imports
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone as tz
+
+# time management
+import datetime
+
+# models
+from django_graphbox.models import LoginCaptcha
+
+# chunked deletes
+from django_graphbox.purge import delete_in_pk_chunks
+
+
+class Command(BaseCommand):
+    help = "Delete the expired login captchas in bounded batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--older-than-minutes",
+            type=int,
+            default=60,
+            help="Delete the captchas created before these minutes. The captchas of the last hour are used to limit the captchas by user, so keep at least 60.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Primary keys by delete query.",
+        )
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=0,
+            help="Seconds to wait between batches.",
+        )
+        parser.add_argument(
+            "--database",
+            default=None,
+            help="Database alias of the captcha table. Defaults to the router.",
+        )
+
+    def handle(self, *args, **options):
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be positive")
+        cutoff = tz.now() - datetime.timedelta(minutes=options["older_than_minutes"])
+        queryset = LoginCaptcha.objects.filter(creation_time__lt=cutoff)
+        if options["database"] is not None:
+            queryset = queryset.using(options["database"])
+        deleted = delete_in_pk_chunks(
+            queryset, chunk_size=options["batch_size"], sleep=options["sleep"]
+        )
+        self.stdout.write(f"{deleted} expired captchas deleted")
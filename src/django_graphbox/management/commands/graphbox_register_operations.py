@@ -0,0 +1,94 @@
+# django imports
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.module_loading import import_string
+
+# json parsing
+import json
+
+# models
+from django_graphbox.models import PersistedQuery
+
+# document validation
+from django_graphbox.documents import DocumentCache
+
+
+class Command(BaseCommand):
+    help = "Register the operations of a persisted query manifest on the allow-list."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "manifest",
+            help="Path of the manifest. Apollo persisted query manifest ({'operations': [{'id', 'name', 'body'}, ...]}) or a {sha256Hash: query} object.",
+        )
+        parser.add_argument(
+            "--schema",
+            default=None,
+            help="Dotted path of the schema to validate the operations. Defaults to GRAPHENE['SCHEMA'] setting.",
+        )
+        parser.add_argument(
+            "--replace",
+            action="store_true",
+            help="Remove from the allow-list the operations that are not on the manifest.",
+        )
+
+    def get_operations(self, manifest):
+        """Get the (query_hash, operation_name, query) of the manifest operations."""
+        if isinstance(manifest, dict) and "operations" in manifest:
+            operations = []
+            for operation in manifest["operations"]:
+                operations.append((operation.get("id"), operation.get("name"), operation["body"]))
+            return operations
+        if isinstance(manifest, dict):
+            return [(query_hash, None, query) for query_hash, query in manifest.items()]
+        raise CommandError("Unsupported manifest format")
+
+    def handle(self, *args, **options):
+        try:
+            with open(options["manifest"], encoding="utf-8") as manifest_file:
+                manifest = json.load(manifest_file)
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Unable to read the manifest: {e}")
+        schema_path = options["schema"] or getattr(settings, "GRAPHENE", {}).get("SCHEMA")
+        schema = None
+        if schema_path is not None:
+            schema = import_string(schema_path)
+            schema = getattr(schema, "graphql_schema", schema)
+        else:
+            self.stdout.write(self.style.WARNING("No schema to validate the operations"))
+        document_cache = DocumentCache(0)
+        registered_hashes = []
+        invalid = 0
+        for query_hash, operation_name, query in self.get_operations(manifest):
+            actual_hash = DocumentCache.hash_query(query)
+            if query_hash is not None and query_hash != actual_hash:
+                raise CommandError(
+                    f"The hash of {operation_name or query_hash} doesn't match the sha256 of its body"
+                )
+            if schema is not None:
+                try:
+                    document, validation_errors = document_cache.get_document(schema, query)
+                except Exception as e:
+                    validation_errors = [e]
+                if validation_errors:
+                    invalid += 1
+                    self.stdout.write(
+                        self.style.ERROR(
+                            f"INVALID {operation_name or actual_hash}: {getattr(validation_errors[0], 'message', validation_errors[0])}"
+                        )
+                    )
+                    continue
+            PersistedQuery.objects.update_or_create(
+                query_hash=actual_hash,
+                defaults={"query": query, "operation_name": operation_name, "allow_listed": True},
+            )
+            registered_hashes.append(actual_hash)
+            self.stdout.write(f"OK      {operation_name or actual_hash}")
+        if options["replace"]:
+            removed = (
+                PersistedQuery.objects.filter(allow_listed=True)
+                .exclude(query_hash__in=registered_hashes)
+                .update(allow_listed=False)
+            )
+            self.stdout.write(f"{removed} operations removed from the allow-list")
+        self.stdout.write(f"{len(registered_hashes)} operations registered, {invalid} invalid")
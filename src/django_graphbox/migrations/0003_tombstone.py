@@ -0,0 +1,25 @@
+# Generated by Django 4.2.11 on 2026-10-19 17:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_graphbox', '0002_alter_logincaptcha_user_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tombstone',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('deletion_time', models.DateTimeField(auto_now_add=True)),
+                ('model_label', models.CharField(max_length=255)),
+                ('object_id', models.CharField(max_length=255)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['model_label', 'deletion_time'], name='django_grap_model_l_5706e0_idx')],
+            },
+        ),
+    ]
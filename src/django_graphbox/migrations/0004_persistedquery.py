@@ -0,0 +1,24 @@
+# Generated by Django 4.2.11 on 2026-10-19 17:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_graphbox', '0003_tombstone'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PersistedQuery',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('creation_time', models.DateTimeField(auto_now_add=True)),
+                ('query_hash', models.CharField(max_length=64, unique=True)),
+                ('query', models.TextField()),
+                ('operation_name', models.CharField(max_length=255, null=True)),
+                ('allow_listed', models.BooleanField(default=False)),
+            ],
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.11 on 2026-10-19 17:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_graphbox', '0004_persistedquery'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='logincaptcha',
+            index=models.Index(fields=['session_key', 'user_id', 'creation_time'], name='django_grap_session_7cccdb_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.11 on 2026-10-19 17:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_graphbox', '0005_logincaptcha_session_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='failedloginattempt',
+            index=models.Index(fields=['session_key', 'user_id', 'timestamp'], name='django_grap_session_8da0e0_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='failedloginattempt',
+            index=models.Index(fields=['session_key', 'timestamp'], name='django_grap_session_b360ce_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='jsonwebtoken',
+            index=models.Index(fields=['user_id', 'session_key'], name='django_grap_user_id_a317ef_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='logincaptcha',
+            index=models.Index(fields=['session_key', 'creation_time'], name='django_grap_session_250be1_idx'),
+        ),
+    ]
@@ -11,6 +11,12 @@ class FailedLoginAttempt(models.Model):
     session_key = models.CharField(max_length=255, null=True)
     user_id = models.IntegerField(null=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["session_key", "user_id", "timestamp"]),
+            models.Index(fields=["session_key", "timestamp"]),
+        ]
+
 
 class JsonWebToken(models.Model):
     creation_time = models.DateTimeField(auto_now_add=True)
@@ -21,6 +27,12 @@ class JsonWebToken(models.Model):
     session_key = models.CharField(max_length=255, null=True)
     user_id = models.IntegerField()
 
+    class Meta:
+        indexes = [
+            # the token is a text column, the lookups of validate_access are narrowed to the tokens of the user
+            models.Index(fields=["user_id", "session_key"]),
+        ]
+
 
 class LoginCaptcha(models.Model):
     creation_time = models.DateTimeField(auto_now_add=True)
@@ -30,3 +42,28 @@ class LoginCaptcha(models.Model):
     image_generated = models.BooleanField(default=False)
     session_key = models.CharField(max_length=255, null=True)
     user_id = models.IntegerField(null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["session_key", "user_id", "creation_time"]),
+            models.Index(fields=["session_key", "creation_time"]),
+        ]
+
+
+class Tombstone(models.Model):
+    deletion_time = models.DateTimeField(auto_now_add=True)
+    model_label = models.CharField(max_length=255)
+    object_id = models.CharField(max_length=255)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["model_label", "deletion_time"]),
+        ]
+
+
+class PersistedQuery(models.Model):
+    creation_time = models.DateTimeField(auto_now_add=True)
+    query_hash = models.CharField(max_length=64, unique=True)
+    query = models.TextField()
+    operation_name = models.CharField(max_length=255, null=True)
+    allow_listed = models.BooleanField(default=False)
@@ -0,0 +1,194 @@
+""" Automatic persisted queries and operation allow-list.
+"""
+
+# django imports
+from django.core.cache import caches
+
+# thread safety
+import threading
+
+# allow-list by schema
+import weakref
+
+# json parsing
+import json
+
+# logging
+import logging
+
+# graphql imports
+from graphql import GraphQLError
+
+# models
+from django_graphbox.models import PersistedQuery
+
+# document validation
+from .documents import DocumentCache
+
+
+PERSISTED_QUERY_NOT_FOUND = "PersistedQueryNotFound"
+PERSISTED_QUERY_NOT_SUPPORTED = "PersistedQueryNotSupported"
+
+
+def get_persisted_query_extension(request, data):
+    """Get the persistedQuery extension of the request.
+
+    Args:
+        request (HttpRequest): Django request.
+        data (dict): Parsed body of the request.
+    Returns:
+        dict: {'version': int, 'sha256Hash': str} or None if the request doesn't use a persisted query.
+    """
+    extensions = request.GET.get("extensions") or data.get("extensions")
+    if extensions and isinstance(extensions, str):
+        try:
+            extensions = json.loads(extensions)
+        except Exception:
+            raise GraphQLError("Extensions are invalid JSON.")
+    if not isinstance(extensions, dict):
+        return None
+    persisted_query = extensions.get("persistedQuery")
+    if not isinstance(persisted_query, dict):
+        return None
+    if persisted_query.get("version", 1) != 1:
+        raise GraphQLError(
+            "Unsupported persisted query version.",
+            extensions={"code": PERSISTED_QUERY_NOT_SUPPORTED},
+        )
+    query_hash = persisted_query.get("sha256Hash")
+    if not isinstance(query_hash, str):
+        raise GraphQLError("The persisted query must have a sha256Hash.")
+    return persisted_query
+
+
+class CachePersistedQueryStore:
+    """Store of persisted queries on a Django cache."""
+
+    def __init__(self, cache_alias="default", timeout=None):
+        """Initialize the store.
+
+        Args:
+            cache_alias (str): Alias of the Django cache.
+            timeout (int): Seconds to keep the queries. None to keep them until the cache evicts them.
+        """
+        self.cache_alias = cache_alias
+        self.timeout = timeout
+
+    def get_key(self, query_hash):
+        return f"graphbox_persisted_query:{query_hash}"
+
+    def get(self, query_hash):
+        """Get the query of a hash or None if it isn't persisted."""
+        return caches[self.cache_alias].get(self.get_key(query_hash))
+
+    def set(self, query_hash, query):
+        """Persist the query of a hash."""
+        caches[self.cache_alias].set(self.get_key(query_hash), query, self.timeout)
+
+
+class DatabasePersistedQueryStore:
+    """Store of persisted queries on the PersistedQuery table.
+
+    Any client can register a query, so the table keeps at most max_queries automatic persisted queries. The queries over the limit are executed without being persisted.
+    """
+
+    def __init__(self, using=None, max_queries=10000):
+        """Initialize the store.
+
+        Args:
+            using (str): Database alias. None to use the router.
+            max_queries (int): Max automatic persisted queries on the table, the allow-listed operations are not counted. None to not limit them.
+        """
+        self.using = using
+        self.max_queries = max_queries
+
+    def get_queryset(self):
+        queryset = PersistedQuery.objects.all()
+        if self.using is not None:
+            queryset = queryset.using(self.using)
+        return queryset
+
+    def get(self, query_hash):
+        """Get the query of a hash or None if it isn't persisted."""
+        return (
+            self.get_queryset()
+            .filter(query_hash=query_hash)
+            .values_list("query", flat=True)
+            .first()
+        )
+
+    def set(self, query_hash, query):
+        """Persist the query of a hash if the table is under max_queries."""
+        if (
+            self.max_queries is not None
+            and self.get_queryset().filter(allow_listed=False).count() >= self.max_queries
+        ):
+            logging.warning(
+                f"WARNING: The persisted query {query_hash} is not saved, the store has {self.max_queries} queries"
+            )
+            return
+        self.get_queryset().get_or_create(query_hash=query_hash, defaults={"query": query})
+
+
+class AllowList:
+    """Allow-listed operations of the PersistedQuery table, loaded once by schema and pre-validated."""
+
+    def __init__(self, using=None):
+        """Initialize the allow-list.
+
+        Args:
+            using (str): Database alias. None to use the router.
+        """
+        self.using = using
+        self._operations = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def load(self, schema, document_cache=None, validation_rules=None):
+        """Load and pre-validate the allow-listed operations for a schema.
+
+        Invalid operations are logged and excluded. The valid documents are saved on the document cache.
+
+        Args:
+            schema (graphql.GraphQLSchema): Schema to validate the operations.
+            document_cache (DocumentCache): Cache to save the validated documents.
+            validation_rules (list): Extra validation rules of the view.
+        Returns:
+            dict: {query_hash: query} of the valid operations.
+        """
+        queryset = PersistedQuery.objects.filter(allow_listed=True)
+        if self.using is not None:
+            queryset = queryset.using(self.using)
+        operations = {}
+        for query_hash, query, operation_name in queryset.values_list(
+            "query_hash", "query", "operation_name"
+        ):
+            try:
+                document, validation_errors = (document_cache or DocumentCache(0)).get_document(
+                    schema, query, validation_rules
+                )
+            except Exception as e:
+                validation_errors = [e]
+            if validation_errors:
+                logging.warning(
+                    f"Allow-listed operation {operation_name or query_hash} is not valid: {getattr(validation_errors[0], 'message', validation_errors[0])}"
+                )
+                continue
+            operations[query_hash] = query
+        with self._lock:
+            self._operations[schema] = operations
+        return operations
+
+    def reload(self):
+        """Discard the loaded operations to load them again on the next request, use load to validate them before."""
+        with self._lock:
+            self._operations = weakref.WeakKeyDictionary()
+
+    def get(self, schema, query_hash, document_cache=None, validation_rules=None):
+        """Get the query of an allow-listed hash or None if the operation isn't allowed.
+
+        The views load the operations on as_view, they are loaded here only after a reload or if the database wasn't available.
+        """
+        operations = self._operations.get(schema)
+        if operations is None:
+            operations = self.load(schema, document_cache, validation_rules)
+        return operations.get(query_hash)
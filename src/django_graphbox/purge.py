@@ -0,0 +1,41 @@
+""" Chunked deletes for the retention of the session tables.
+"""
+
+# django imports
+from django.db.models import Max, Min
+
+# throttle
+import time
+
+
+def delete_in_pk_chunks(queryset, chunk_size=1000, sleep=0, dry_run=False):
+    """Delete the rows of a queryset by primary key ranges.
+
+    Each query deletes the rows of a range of chunk_size primary keys, so the locks and the transaction of every delete stay small on a live database.
+    The ranges go from the min to the max primary key of the rows to delete when the purge starts, the rows inserted after are not visited.
+
+    Args:
+        queryset (QuerySet): Rows to delete, with an integer primary key.
+        chunk_size (int): Primary keys by range.
+        sleep (float): Seconds to wait between ranges.
+        dry_run (bool): If True, count the rows instead of deleting them.
+    Returns:
+        int: deleted rows
+    """
+    # bounds of the matching rows, the retention keeps the newest rows of the table out of the ranges
+    bounds = queryset.aggregate(min_pk=Min("pk"), max_pk=Max("pk"))
+    if bounds["min_pk"] is None:
+        return 0
+    deleted = 0
+    start = bounds["min_pk"]
+    while start <= bounds["max_pk"]:
+        chunk = queryset.filter(pk__gte=start, pk__lt=start + chunk_size)
+        if dry_run:
+            deleted += chunk.count()
+        else:
+            # without relations or signals Django deletes the range with a single query
+            deleted += chunk.delete()[0]
+        start += chunk_size
+        if sleep > 0 and start <= bounds["max_pk"]:
+            time.sleep(sleep)
+    return deleted
@@ -7,6 +7,12 @@ import jwt
 # settings import
 from django.conf import settings
 
+# cache of the moodle users
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+import hashlib
+
 # randomic session id generator
 from uuid import uuid4
 
@@ -24,8 +30,6 @@ from .exceptions import ErrorManager
 from .constants import *
 
 # google imports
-from google.oauth2 import id_token
-from google.auth.transport import requests as grq
 import google.oauth2.credentials
 from google.auth.transport.requests import AuthorizedSession
 
@@ -36,8 +40,8 @@ import facebook
 from django.core.files.images import ImageFile
 from django.core.files.temp import tempfile
 
-# Hash manager
-from .hasher import HashManager
+# deferred photo downloads
+from django.db import close_old_connections, transaction
 
 # Logging
 import logging
@@ -45,22 +49,32 @@ import logging
 # Models
 from django_graphbox.models import FailedLoginAttempt, JsonWebToken, LoginCaptcha
 
+# Buffered writes of the session tables
+from .batching import BufferedWriter
+
+# Stateless captcha
+from .signed_captcha import sign_captcha, validate_signed_captcha
+
 # Json
 import json
 
+# async adapters
+from asgiref.sync import sync_to_async
+
 # requests
 import requests
+from requests.adapters import HTTPAdapter
+
+# concurrent moodle authentication
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import threading
+import time
+from email.utils import parsedate_to_datetime
 
 # random string
 import string
 import random
 
-# Moodle
-try:
-    from moodle import Moodle
-except:
-    pass
-
 
 class GroupManager:
     """Manager for allow access to users by groups."""
@@ -98,29 +112,173 @@ class GroupManager:
                 return False
 
 
+# sliding window of the failed login attempts counters, in seconds
+LOGIN_ATTEMPTS_WINDOW = 3600
+LOGIN_ATTEMPTS_BUCKET = 300
+
+
+class CircuitBreaker:
+    """Circuit breaker for an external service, opened after consecutive failures to skip the service until the reset timeout."""
+
+    def __init__(self, failure_threshold=3, reset_timeout=30):
+        """Initialize the CircuitBreaker.
+
+        Args:
+            failure_threshold (int): Consecutive failures to open the circuit. None to never open it.
+            reset_timeout (int): Seconds to wait before trying the service again.
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Validate if a request to the service can be done."""
+        with self._lock:
+            if self._opened_at == None:
+                return True
+            if time.monotonic() - self._opened_at >= self.reset_timeout:
+                # half open, only one request tries the service on each reset timeout
+                self._opened_at = time.monotonic()
+                return True
+            return False
+
+    def record_success(self):
+        """Close the circuit after a response of the service."""
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+
+    def record_failure(self):
+        """Count a failure of the service and open the circuit on the threshold."""
+        with self._lock:
+            self._failures += 1
+            if (
+                self.failure_threshold != None
+                and self._failures >= self.failure_threshold
+            ):
+                self._opened_at = time.monotonic()
+
+
 class GoogleSession:
+    """Validation of Google ID tokens and access tokens.
+
+    The ID tokens are verified locally with the JWKS keys of the discovery document, the access tokens are validated on the userinfo endpoint.
+    The discovery document and the keys are cached in memory with the max-age or Expires headers of their responses.
+    """
+
     client_id = getattr(settings, "GOOGLE_CLIENT_ID", None)
+    discovery_url = getattr(
+        settings,
+        "GOOGLE_DISCOVERY_URL",
+        "https://accounts.google.com/.well-known/openid-configuration",
+    )
+    default_cache_seconds = 300
+    # min seconds between the downloads of a document forced by unknown key ids
+    min_refresh_seconds = 60
+    request_timeout = 10
+    # {url: (expiration time, json data, download time)}
+    _documents = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def get_cache_seconds(cls, response):
+        """Get the seconds to cache a response with its Cache-Control or Expires headers."""
+        cache_control = response.headers.get("Cache-Control", "")
+        for directive in cache_control.split(","):
+            directive = directive.strip().lower()
+            if directive in ["no-cache", "no-store"]:
+                return 0
+            if directive.startswith("max-age="):
+                try:
+                    return max(int(directive[len("max-age=") :]), 0)
+                except ValueError:
+                    pass
+        expires = response.headers.get("Expires")
+        if expires:
+            try:
+                expiration = parsedate_to_datetime(expires)
+                return max(
+                    (expiration - datetime.datetime.now(datetime.timezone.utc)).total_seconds(),
+                    0,
+                )
+            except (TypeError, ValueError):
+                pass
+        return cls.default_cache_seconds
+
+    @classmethod
+    def get_json(cls, url, refresh=False):
+        """Get a json document from the cache or download it.
+
+        Args:
+            url (str): Url of the document.
+            refresh (bool): If True, download the document even if it is cached, at most once every min_refresh_seconds.
+        Returns:
+            dict: json document
+        """
+        now = time.monotonic()
+        with cls._lock:
+            cached = cls._documents.get(url)
+        if cached != None and (
+            now < cached[0] if not refresh else now - cached[2] < cls.min_refresh_seconds
+        ):
+            return cached[1]
+        response = requests.get(url, timeout=cls.request_timeout)
+        response.raise_for_status()
+        data = response.json()
+        with cls._lock:
+            cls._documents[url] = (now + cls.get_cache_seconds(response), data, now)
+        return data
+
+    @classmethod
+    def get_signing_key(cls, token):
+        """Get the key of the JWKS that signed a token, the keys are refreshed once for unknown key ids."""
+        key_id = jwt.get_unverified_header(token).get("kid")
+        jwks_uri = cls.get_json(cls.discovery_url)["jwks_uri"]
+        for refresh in [False, True]:
+            jwks = cls.get_json(jwks_uri, refresh=refresh)
+            for key in jwks.get("keys", []):
+                if key_id == None or key.get("kid") == key_id:
+                    return jwt.PyJWK(key)
+        raise Exception("Unknown signing key")
+
+    @classmethod
+    def verify_id_token(cls, token):
+        """Verify an ID token locally and return its claims."""
+        signing_key = cls.get_signing_key(token)
+        info = jwt.decode(
+            token,
+            signing_key.key,
+            algorithms=["RS256"],
+            audience=cls.client_id,
+            options={"verify_aud": cls.client_id != None},
+        )
+        issuer = cls.get_json(cls.discovery_url).get("issuer", "https://accounts.google.com")
+        if info.get("iss") not in [issuer, issuer.replace("https://", "")]:
+            raise Exception("Invalid issuer")
+        return info
 
     @classmethod
     def validate(cls, token):
         try:
+            if token.count(".") == 2:
+                # ID token
+                return True, cls.verify_id_token(token)
+            # opaque access token
             credentials = google.oauth2.credentials.Credentials(token)
             authed_session = AuthorizedSession(credentials)
-            open_id_configuration = requests.get(
-                "https://accounts.google.com/.well-known/openid-configuration"
-            ).json()
-            userinfo_endpoint = open_id_configuration["userinfo_endpoint"]
+            userinfo_endpoint = cls.get_json(cls.discovery_url)["userinfo_endpoint"]
             # Make an authenticated API request with OPENID scope.
-            response = authed_session.get(userinfo_endpoint, params={"alt": "json"})
+            response = authed_session.get(
+                userinfo_endpoint, params={"alt": "json"}, timeout=cls.request_timeout
+            )
+            response.raise_for_status()
             info = response.json()
             return True, info
         except:
-            try:
-                info = id_token.verify_oauth2_token(token, grq.Request(), cls.client_id)
-                return True, info
-            except:
-                data = []
-                return False, data
+            data = []
+            return False, data
 
 
 class FacebookSession:
@@ -168,6 +326,10 @@ class Manager:
         self.config_moodle(**kwargs)
         # Configuracion de captcha
         self.config_captcha(**kwargs)
+        # Configuracion de bases de datos de las tablas de sesion
+        self.config_database(**kwargs)
+        # Configuracion de descarga de fotos de usuarios nuevos
+        self.config_photo_download(**kwargs)
 
     def config_user_model(
         self,
@@ -300,6 +462,13 @@ class Manager:
         moodle_urls=[],
         moodle_auth_field_name="username",
         moodle_id_field_name="email",
+        auth_order=["moodle", "native"],
+        moodle_timeout=(3.05, 10),
+        moodle_max_workers=4,
+        moodle_failure_threshold=3,
+        moodle_reset_timeout=30,
+        moodle_cache_timeout=300,
+        moodle_cache_alias="default",
         **kwargs,
     ):
         """Configure moodle
@@ -308,6 +477,13 @@ class Manager:
             moodle_urls (list or function, optional): List of moodle urls or function that return a list of moodle urls. Defaults to [].
             moodle_auth_field_name (str, optional): Field name of moodle user model for authentication. Defaults to 'username'.
             moodle_id_field_name (str, optional): Field name of moodle user model for identification. Defaults to 'email'.
+            auth_order (list, optional): Order of the authentication methods, 'moodle' and 'native'. Defaults to ['moodle', 'native'], use ['native', 'moodle'] to skip moodle for native users.
+            moodle_timeout (float or tuple, optional): Timeout in seconds of the requests to moodle, or (connect timeout, read timeout). Defaults to (3.05, 10).
+            moodle_max_workers (int, optional): Max number of moodle urls requested at the same time. Defaults to 4.
+            moodle_failure_threshold (int, optional): Consecutive failures of a moodle url to skip it. None to never skip it. Defaults to 3.
+            moodle_reset_timeout (int, optional): Seconds to skip a failing moodle url. Defaults to 30.
+            moodle_cache_timeout (int, optional): Seconds to cache the moodle user data and the result of moodle_urls function. 0 to disable the cache. Defaults to 300.
+            moodle_cache_alias (str, optional): Alias of the Django cache for the moodle user data. Defaults to 'default'.
         """
         # Validar tipos
         if type(moodle_urls) != list and not callable(moodle_urls):
@@ -316,12 +492,36 @@ class Manager:
             raise Exception("moodle_auth_field_name must be string")
         if type(moodle_id_field_name) != str:
             raise Exception("moodle_id_field_name must be string")
+        if (
+            type(auth_order) != list
+            or len(auth_order) == 0
+            or any(method not in ["moodle", "native"] for method in auth_order)
+        ):
+            raise Exception("auth_order must be a list of 'moodle' and 'native'")
+        if type(moodle_max_workers) != int or moodle_max_workers < 1:
+            raise Exception("moodle_max_workers must be a positive integer")
+        if type(moodle_cache_timeout) != int or moodle_cache_timeout < 0:
+            raise Exception("moodle_cache_timeout must be a non negative integer")
         if self.name_field_name == None:
             raise Exception("name_field_name must be defined")
         # Configuracion de autenticacion con moodle
         self.moodle_urls = moodle_urls
         self.moodle_auth_field_name = moodle_auth_field_name
         self.moodle_id_field_name = moodle_id_field_name
+        self.auth_order = auth_order
+        self.moodle_timeout = moodle_timeout
+        self.moodle_max_workers = moodle_max_workers
+        self.moodle_failure_threshold = moodle_failure_threshold
+        self.moodle_reset_timeout = moodle_reset_timeout
+        self.moodle_cache_timeout = moodle_cache_timeout
+        self.moodle_cache_alias = moodle_cache_alias
+        # (expiration time, moodle urls) of the moodle_urls function
+        self._moodle_urls_cache = (0, None)
+        # pooled http session, thread pool and circuit breakers by url, created on the first login
+        self._moodle_lock = threading.Lock()
+        self._http_session = None
+        self._moodle_executor = None
+        self._moodle_breakers = {}
 
     def config_captcha(
         self,
@@ -333,6 +533,10 @@ class Manager:
         max_captcha_by_user=6,
         expiration_minutes=1,
         captcha_length=6,
+        attempts_counter="database",
+        attempts_cache_alias="default",
+        audit_failed_login_attempts=True,
+        captcha_storage="database",
         **kwargs,
     ):
         """Configure recaptcha
@@ -346,6 +550,10 @@ class Manager:
 
             max_captcha_by_user (int, optional): Max captcha generated in 1 hour for user. Defaults to 3.
             expiration_minutes (int, optional): Expiration time in minutes for captcha. Defaults to 1.
+            attempts_counter (str, optional): 'cache' to count the failed login attempts of the last hour with counters on the Django cache or 'database' to count the rows of FailedLoginAttempt. Defaults to 'database'.
+            attempts_cache_alias (str, optional): Alias of the Django cache for the counters and the used signed captchas, it must be shared by all the processes. Defaults to 'default'.
+            audit_failed_login_attempts (bool, optional): If True, the failed login attempts are saved on FailedLoginAttempt. Required by the 'database' counter. Defaults to True.
+            captcha_storage (str, optional): 'database' to save the classic captchas on LoginCaptcha or 'signed' to return captcha ids signed with the SECRET_KEY, with the used ids and the captchas by hour on the attempts cache. Defaults to 'database'.
         """
         # Validar tipos
         if type(use_captcha) != bool:
@@ -372,6 +580,25 @@ class Manager:
             raise Exception("expiration_minutes must be int")
         if type(captcha_length) != int:
             raise Exception("captcha_length must be int")
+        if attempts_counter not in ["cache", "database"]:
+            raise Exception("attempts_counter must be 'cache' or 'database'")
+        if type(audit_failed_login_attempts) != bool:
+            raise Exception("audit_failed_login_attempts must be boolean")
+        if attempts_counter == "database" and not audit_failed_login_attempts:
+            raise Exception(
+                "audit_failed_login_attempts is required by the database attempts_counter"
+            )
+        if captcha_storage not in ["database", "signed"]:
+            raise Exception("captcha_storage must be 'database' or 'signed'")
+        if captcha_storage == "signed" and captcha_length > 20:
+            raise Exception("captcha_length must be 20 or less for signed captchas")
+        if use_captcha and attempts_counter == "cache":
+            self._validate_shared_cache(attempts_cache_alias, "attempts_counter='cache'")
+        if use_captcha and captcha_storage == "signed":
+            self._validate_shared_cache(attempts_cache_alias, "captcha_storage='signed'")
+            if attempts_cache_alias != "default":
+                # the captcha_image view marks the images of the signed captchas on the default cache
+                self._validate_shared_cache("default", "captcha_storage='signed'")
         self.use_captcha = use_captcha
         self.captcha_style = captcha_style
         if captcha_style == "google_recaptcha_v3":
@@ -385,6 +612,99 @@ class Manager:
         self.max_captcha_by_user = max_captcha_by_user
         self.expiration_minutes = expiration_minutes
         self.captcha_length = captcha_length
+        self.attempts_counter = attempts_counter
+        self.attempts_cache_alias = attempts_cache_alias
+        self.audit_failed_login_attempts = audit_failed_login_attempts
+        self.captcha_storage = captcha_storage
+
+    def _validate_shared_cache(self, cache_alias, option):
+        """Validate that a Django cache used to count or to mark the used captchas is shared by the processes
+
+        Args:
+            cache_alias (str): Alias of the Django cache.
+            option (str): Option that uses the cache, for the messages.
+        """
+        cache = caches[cache_alias]
+        if isinstance(cache, DummyCache):
+            raise Exception(
+                f"{option} requires a cache that stores the values, the '{cache_alias}' cache is a DummyCache"
+            )
+        if isinstance(cache, LocMemCache):
+            logging.warning(
+                f"WARNING: {option} uses the '{cache_alias}' cache, a LocMemCache is not shared by the processes, so each process counts and marks the captchas apart. Use a shared cache like Redis or Memcached."
+            )
+
+    def config_database(
+        self,
+        session_read_database=None,
+        session_write_database=None,
+        buffered_writes=False,
+        buffer_batch_size=100,
+        buffer_flush_interval=1.0,
+        token_durability="sync",
+        **kwargs,
+    ):
+        """Configure the databases of the session tables (FailedLoginAttempt, JsonWebToken and LoginCaptcha)
+
+        Args:
+            session_read_database (str, optional): Database alias for reads on session tables that tolerate the lag of a replica. The tokens, captchas and failed login attempts are read from session_write_database, each request reads the writes of the previous ones. Defaults to None for use django database routers.
+            session_write_database (str, optional): Database alias for writes on session tables. Defaults to None for use django database routers.
+            buffered_writes (bool, optional): If True, the failed login attempts are saved in batches by a background thread. The attempts on the buffer of the process are counted with the saved attempts, the attempts of other processes are counted after their flush. Defaults to False.
+            buffer_batch_size (int, optional): Rows to flush the buffer and max rows by INSERT. Defaults to 100.
+            buffer_flush_interval (float, optional): Max seconds of a row on the buffer. Defaults to 1.0.
+            token_durability (str, optional): 'sync' to save the persistent tokens before returning them or 'buffered' to save them with the buffered writes. The buffered tokens are valid on the same process immediately and on the other processes after the flush, and are lost if the process is killed before the flush. Defaults to 'sync'.
+        """
+        # Validar tipos
+        if session_read_database != None and type(session_read_database) != str:
+            raise Exception("session_read_database must be string")
+        if session_write_database != None and type(session_write_database) != str:
+            raise Exception("session_write_database must be string")
+        if type(buffered_writes) != bool:
+            raise Exception("buffered_writes must be boolean")
+        if token_durability not in ["sync", "buffered"]:
+            raise Exception("token_durability must be 'sync' or 'buffered'")
+        if token_durability == "buffered" and not buffered_writes:
+            raise Exception("token_durability 'buffered' requires buffered_writes")
+        self.session_read_database = session_read_database
+        self.session_write_database = session_write_database
+        self.token_durability = token_durability
+        self._writer = None
+        if buffered_writes:
+            self._writer = BufferedWriter(
+                using=session_write_database,
+                max_batch_size=buffer_batch_size,
+                flush_interval=buffer_flush_interval,
+            )
+
+    def config_photo_download(
+        self,
+        defer_photo_download=True,
+        photo_download_workers=2,
+        photo_download_retries=3,
+        photo_download_timeout=(3.05, 10),
+        **kwargs,
+    ):
+        """Configure the download of the photos of the users created by social and moodle login
+
+        Args:
+            defer_photo_download (bool, optional): If True, the photos are downloaded on background workers after the login. Defaults to True.
+            photo_download_workers (int, optional): Number of background workers. Defaults to 2.
+            photo_download_retries (int, optional): Retries of a failed download. Defaults to 3.
+            photo_download_timeout (float or tuple, optional): Timeout in seconds of the download, or (connect timeout, read timeout). Defaults to (3.05, 10).
+        """
+        # Validar tipos
+        if type(defer_photo_download) != bool:
+            raise Exception("defer_photo_download must be boolean")
+        if type(photo_download_workers) != int or photo_download_workers < 1:
+            raise Exception("photo_download_workers must be a positive integer")
+        if type(photo_download_retries) != int or photo_download_retries < 0:
+            raise Exception("photo_download_retries must be a non negative integer")
+        self.defer_photo_download = defer_photo_download
+        self.photo_download_workers = photo_download_workers
+        self.photo_download_retries = photo_download_retries
+        self.photo_download_timeout = photo_download_timeout
+        self._photo_lock = threading.Lock()
+        self._photo_executor = None
 
     def validate_access(self, request, group_name):
         """Validate access
@@ -408,12 +728,8 @@ class Manager:
                 payload = jwt.decode(token, security_key, algorithms=["HS256"])
                 if (
                     not self.persistent_tokens
-                    or JsonWebToken.objects.filter(
-                        token=token,
-                        active=True,
-                        session_key=self.session_key,
-                        user_id=payload["u_id"],
-                    ).exists()
+                    or self._is_pending_token(token)
+                    or self._get_active_tokens(token, payload["u_id"]).exists()
                 ):
                     if (
                         self.session_key == None
@@ -429,47 +745,7 @@ class Manager:
                                 if self.active_field_name == None or getattr(
                                     user_instance, self.active_field_name
                                 ):
-                                    # import django_auditor_logs if exists
-                                    if "django_auditor_logs" in settings.INSTALLED_APPS:
-                                        try:
-                                            from django_auditor_logs.metadata import (
-                                                MetadataManager,
-                                            )
-
-                                            user_metadata = {}
-                                            for (
-                                                field
-                                            ) in user_instance._meta.get_fields():
-                                                try:
-                                                    if not field.is_relation:
-                                                        if (
-                                                            field.name
-                                                            != self.password_field_name
-                                                        ):
-                                                            user_metadata[
-                                                                field.name
-                                                            ] = str(
-                                                                getattr(
-                                                                    user_instance,
-                                                                    field.name,
-                                                                )
-                                                            )
-                                                    else:
-                                                        user_metadata[
-                                                            field.name + "_id"
-                                                        ] = str(
-                                                            getattr(
-                                                                user_instance,
-                                                                field.name,
-                                                            ).id
-                                                        )
-                                                except:
-                                                    pass
-                                            MetadataManager.set_user_metadata(
-                                                user_metadata
-                                            )
-                                        except Exception as e:
-                                            print(e)
+                                    self._set_auditor_metadata(user_instance)
                                     return (
                                         True,
                                         user_instance,
@@ -506,6 +782,76 @@ class Manager:
         else:
             return False, None, ErrorManager.get_error_by_code(INVALID_TOKEN)
 
+    def _set_auditor_metadata(self, user_instance):
+        """Set the metadata of the user on django_auditor_logs if it's installed"""
+        if "django_auditor_logs" in settings.INSTALLED_APPS:
+            try:
+                from django_auditor_logs.metadata import MetadataManager
+
+                user_metadata = {}
+                for field in user_instance._meta.get_fields():
+                    try:
+                        if not field.is_relation:
+                            if field.name != self.password_field_name:
+                                user_metadata[field.name] = str(
+                                    getattr(user_instance, field.name)
+                                )
+                        else:
+                            user_metadata[field.name + "_id"] = str(
+                                getattr(user_instance, field.name).id
+                            )
+                    except:
+                        pass
+                MetadataManager.set_user_metadata(user_metadata)
+            except Exception as e:
+                print(e)
+
+    async def avalidate_access(self, request, group_name):
+        """Async version of validate_access for ASGI deployments, it uses the async ORM of Django
+
+        Args:
+            request (django.http.request.HttpRequest): request to validate Authorization header as Bearer token
+            group_name (str): group name to validate
+        Returns:
+            tuple:(status (bool), user_instance (UserObject))
+        """
+        if group_name == "open" or group_name == None:
+            return True, None, ErrorManager.get_error_by_code(NO_ERROR)
+        if "Authorization" not in request.headers:
+            return False, None, ErrorManager.get_error_by_code(INVALID_TOKEN)
+        token = request.headers["Authorization"]
+        token = token[7 : len(token)]
+        try:
+            if callable(self._security_key):
+                security_key = self._security_key(token=token)
+            else:
+                security_key = self._security_key
+            payload = jwt.decode(token, security_key, algorithms=["HS256"])
+            if (
+                self.persistent_tokens
+                and not self._is_pending_token(token)
+                and not await self._get_active_tokens(token, payload["u_id"]).aexists()
+            ):
+                return False, None, ErrorManager.get_error_by_code(INVALID_TOKEN)
+            if self.session_key != None and self.session_key != payload["session_key"]:
+                return False, None, ErrorManager.get_error_by_code(INVALID_TOKEN)
+            user_instance = await self.user_model.objects.filter(
+                id=payload["u_id"]
+            ).afirst()
+            if user_instance == None:
+                return False, None, ErrorManager.get_error_by_code(INVALID_CREDENTIALS)
+            if not self.group_manager.validar_acesso(user_instance, group_name):
+                return False, None, ErrorManager.get_error_by_code(ACCESS_DENIED)
+            if self.active_field_name != None and not getattr(
+                user_instance, self.active_field_name
+            ):
+                return False, None, ErrorManager.get_error_by_code(ACCESS_DENIED)
+            if "django_auditor_logs" in settings.INSTALLED_APPS:
+                await sync_to_async(self._set_auditor_metadata)(user_instance)
+            return True, user_instance, ErrorManager.get_error_by_code(NO_ERROR)
+        except:
+            return False, None, ErrorManager.get_error_by_code(INVALID_TOKEN)
+
     def _get_request_metadata(self):
         request_metadata = None
         try:
@@ -552,110 +898,213 @@ class Manager:
                     session_key=self.session_key,
                     user_id=user_instance.id,
                 )
-                persistent_data.save()
+                if self.token_durability == "buffered":
+                    self._writer.add(persistent_data)
+                else:
+                    persistent_data.save(using=self.session_write_database)
             return token
         return None
 
+    def _is_pending_token(self, token):
+        """Validate if a persistent token is waiting on the buffered writes"""
+        return self.token_durability == "buffered" and self._writer.is_pending(
+            JsonWebToken, token=token, session_key=self.session_key
+        )
+
+    def _get_http_session(self):
+        """Get the pooled keep-alive http session for the external services"""
+        if self._http_session == None:
+            with self._moodle_lock:
+                if self._http_session == None:
+                    http_session = requests.Session()
+                    adapter = HTTPAdapter(
+                        pool_connections=10, pool_maxsize=self.moodle_max_workers
+                    )
+                    http_session.mount("https://", adapter)
+                    http_session.mount("http://", adapter)
+                    self._http_session = http_session
+        return self._http_session
+
+    def _get_moodle_executor(self):
+        """Get the thread pool for the concurrent requests to moodle"""
+        if self._moodle_executor == None:
+            with self._moodle_lock:
+                if self._moodle_executor == None:
+                    self._moodle_executor = ThreadPoolExecutor(
+                        max_workers=self.moodle_max_workers,
+                        thread_name_prefix="graphbox_moodle",
+                    )
+        return self._moodle_executor
+
+    def _get_moodle_breaker(self, url):
+        """Get the circuit breaker of a moodle url"""
+        with self._moodle_lock:
+            if url not in self._moodle_breakers:
+                self._moodle_breakers[url] = CircuitBreaker(
+                    self.moodle_failure_threshold, self.moodle_reset_timeout
+                )
+            return self._moodle_breakers[url]
+
+    def _get_moodle_urls(self):
+        """Get the moodle urls and service tokens, the result of moodle_urls function is cached for moodle_cache_timeout"""
+        if not callable(self.moodle_urls):
+            return self.moodle_urls
+        if self.moodle_cache_timeout == 0:
+            return self.moodle_urls()
+        expiration_time, moodle_urls = self._moodle_urls_cache
+        if moodle_urls == None or time.monotonic() >= expiration_time:
+            moodle_urls = self.moodle_urls()
+            self._moodle_urls_cache = (
+                time.monotonic() + self.moodle_cache_timeout,
+                moodle_urls,
+            )
+        return moodle_urls
+
+    def _get_moodle_user_cache_key(self, url, login_id):
+        key = hashlib.sha256(f"{url}\n{login_id}".encode("utf-8")).hexdigest()
+        return f"graphbox_moodle_user:{key}"
+
+    def _moodle_post(self, moodle_data, path, data):
+        """Post to a moodle url with the timeout and circuit breaker of the url
+
+        Returns:
+            dict or list: json response or None if the url is unavailable
+        """
+        breaker = self._get_moodle_breaker(moodle_data["url"])
+        if not breaker.allow():
+            return None
+        try:
+            response = self._get_http_session().post(
+                moodle_data["url"] + path, data=data, timeout=self.moodle_timeout
+            )
+        except requests.RequestException:
+            breaker.record_failure()
+            return None
+        if response.status_code >= 500:
+            breaker.record_failure()
+            return None
+        breaker.record_success()
+        if response.status_code != 200:
+            return None
+        try:
+            return response.json()
+        except ValueError:
+            return None
+
+    def _moodle_login(self, moodle_data, login_id, password):
+        """Validate the credentials on a moodle url and get the user data
+
+        Returns:
+            dict or bool: moodle user data, False if moodle rejects the credentials or None if the url is unavailable
+        """
+        try:
+            return self._request_moodle_user(moodle_data, login_id, password)
+        except:
+            return None
+
+    def _request_moodle_user(self, moodle_data, login_id, password):
+        json_response = self._moodle_post(
+            moodle_data,
+            "/login/token.php",
+            {
+                self.moodle_auth_field_name: login_id,
+                "password": password,
+                "service": "moodle_mobile_app",
+            },
+        )
+        if json_response == None:
+            return None
+        # validate only if token exists
+        if type(json_response) != dict or "token" not in json_response.keys():
+            return False
+        # get user info, cached by url and login id
+        cache_key = self._get_moodle_user_cache_key(moodle_data["url"], login_id)
+        if self.moodle_cache_timeout > 0:
+            data_user = caches[self.moodle_cache_alias].get(cache_key)
+            if data_user != None:
+                return data_user
+        data_user = self._moodle_post(
+            moodle_data,
+            "/webservice/rest/server.php",
+            {
+                "wstoken": moodle_data["token"],
+                "wsfunction": "core_user_get_users_by_field",
+                "moodlewsrestformat": "json",
+                "field": self.moodle_auth_field_name,
+                "values[0]": login_id,
+            },
+        )
+        if type(data_user) == list and len(data_user) > 0:
+            if self.moodle_cache_timeout > 0:
+                caches[self.moodle_cache_alias].set(
+                    cache_key, data_user[0], self.moodle_cache_timeout
+                )
+            return data_user[0]
+        return None
+
     def _auth_with_moodle(self, login_id, password):
         """Validate user with moodle
 
+        The moodle urls are requested at the same time and the first url that accepts the credentials is used.
+
         Args:
             login_id (str): login id
             password (str): password
 
         Returns:
-            tuple:(status (bool), user_instance (UserObject))
+            tuple:(status (bool), user_instance (UserObject), rejected (bool)). rejected is False when moodle is unavailable.
         """
-        final_moodle_urls = self.moodle_urls
-        if type(self.moodle_urls) == list:
-            final_moodle_urls = self.moodle_urls
-        elif callable(self.moodle_urls):
-            final_moodle_urls = self.moodle_urls()
-        for moodle_data in final_moodle_urls:
-            try:
-                response = requests.post(
-                    moodle_data["url"] + "/login/token.php",
-                    data={
-                        self.moodle_auth_field_name: login_id,
-                        "password": password,
-                        "service": "moodle_mobile_app",
-                    },
-                )
-                if response.status_code == 200:
-                    # validate only if token exists
-                    json_response = response.json()
-                    if "token" in json_response.keys():
-                        moodle = Moodle(
-                            moodle_data["url"] + "/webservice/rest/server.php",
-                            moodle_data["token"],
-                        )
-                        # get user info
-                        data_user = moodle(
-                            "core_user_get_users_by_field",
-                            field=self.moodle_auth_field_name,
-                            values=[login_id],
-                        )
-                        if len(data_user) > 0:
-                            data_user = data_user[0]
-                            if self.user_model.objects.filter(
-                                **{
-                                    self.login_id_field_name: data_user[
-                                        self.moodle_id_field_name
-                                    ]
-                                }
-                            ).exists():
-                                user_instance = self.user_model.objects.get(
-                                    **{
-                                        self.login_id_field_name: data_user[
-                                            self.moodle_id_field_name
-                                        ]
-                                    }
-                                )
-                                if self.active_field_name == None or getattr(
-                                    user_instance, self.active_field_name
-                                ):
-                                    return True, user_instance
-                                else:
-                                    self._save_failed_login_attempt(
-                                        login_id, password, user_instance.id
-                                    )
-                                    return False, None
-                            else:
-                                user_instance = self.user_model(
-                                    **{
-                                        self.name_field_name: data_user["fullname"],
-                                        self.login_id_field_name: data_user[
-                                            self.moodle_id_field_name
-                                        ],
-                                    }
-                                )
-                                if self.active_field_name != None:
-                                    setattr(user_instance, self.active_field_name, True)
-                                if (
-                                    self.photo_field_name != None
-                                    and "profileimageurl" in data_user.keys()
-                                    and data_user["profileimageurl"] != ""
-                                    and data_user["profileimageurl"] != None
-                                ):
-                                    try:
-                                        photo = self.download_photo(
-                                            data_user["profileimageurl"]
-                                        )
-                                        fname = HashManager.getSHA1file(photo)
-                                        getattr(
-                                            user_instance, self.photo_field_name
-                                        ).save(f"{fname}.jpg", photo, save=False)
-                                    except:
-                                        pass
-                                user_instance.save()
-                                return True, user_instance
-                    else:
-                        self._save_failed_login_attempt(login_id, password)
-            except:
-                pass
-        return False, None
+        final_moodle_urls = self._get_moodle_urls()
+        if len(final_moodle_urls) == 0:
+            return False, None, False
+        data_user = None
+        rejected = False
+        if len(final_moodle_urls) == 1:
+            results = [self._moodle_login(final_moodle_urls[0], login_id, password)]
+        else:
+            executor = self._get_moodle_executor()
+            futures = [
+                executor.submit(self._moodle_login, moodle_data, login_id, password)
+                for moodle_data in final_moodle_urls
+            ]
+            results = (future.result() for future in as_completed(futures))
+        for result in results:
+            if result == False:
+                rejected = True
+            elif result != None:
+                data_user = result
+                break
+        if data_user == None:
+            return False, None, rejected
+        user_instance = self.user_model.objects.filter(
+            **{self.login_id_field_name: data_user[self.moodle_id_field_name]}
+        ).first()
+        if user_instance != None:
+            if self.active_field_name == None or getattr(
+                user_instance, self.active_field_name
+            ):
+                return True, user_instance, False
+            else:
+                return False, user_instance, True
+        else:
+            user_instance = self.user_model(
+                **{
+                    self.name_field_name: data_user["fullname"],
+                    self.login_id_field_name: data_user[self.moodle_id_field_name],
+                }
+            )
+            if self.active_field_name != None:
+                setattr(user_instance, self.active_field_name, True)
+            user_instance.save()
+            self._save_user_photo(user_instance, data_user.get("profileimageurl"))
+            return True, user_instance, False
 
     def _auth_native(self, login_id_value, password):
+        """Validate user with the password of the user model
+
+        Returns:
+            tuple:(status (bool), user_instance (UserObject), rejected (bool))
+        """
         if self.user_model.objects.filter(
             **{self.login_id_field_name: login_id_value}
         ).exists():
@@ -670,20 +1119,13 @@ class Manager:
                 ) != None and check_password(
                     password, getattr(user_instance, self.password_field_name)
                 ):
-                    return True, user_instance
+                    return True, user_instance, False
                 else:
-                    self._save_failed_login_attempt(
-                        login_id_value, password, user_instance.id
-                    )
-                    return False, user_instance
+                    return False, user_instance, True
             else:
-                self._save_failed_login_attempt(
-                    login_id_value, password, user_instance.id
-                )
-                return False, user_instance
+                return False, user_instance, True
         else:
-            self._save_failed_login_attempt(login_id_value, password)
-            return False, None
+            return False, None, True
 
     def _save_failed_login_attempt(self, login_id_value, password, user_id=None):
         """Save failed login attempt
@@ -692,15 +1134,105 @@ class Manager:
             login_id_value (str): login id value
             password (str): password
         """
-        request_metadata = self._get_request_metadata()
-        failed_login_attempt = FailedLoginAttempt(
-            username=login_id_value,
-            password=password,
-            request_metadata=request_metadata,
+        if self.attempts_counter == "cache":
+            self._increment_attempts_counter()
+            if user_id != None:
+                self._increment_attempts_counter(user_id)
+        if self.audit_failed_login_attempts:
+            request_metadata = self._get_request_metadata()
+            failed_login_attempt = FailedLoginAttempt(
+                username=login_id_value,
+                password=password,
+                request_metadata=request_metadata,
+                session_key=self.session_key,
+                user_id=user_id,
+            )
+            if self._writer != None:
+                self._writer.add(failed_login_attempt)
+            else:
+                failed_login_attempt.save(using=self.session_write_database)
+
+    def _get_attempts_counter_keys(self, user_id=None, counter_name="login_attempts"):
+        """Get the cache keys of the buckets of the sliding window, the last key is the actual bucket
+
+        Args:
+            user_id (int): user id or None for the counter of all the attempts of the session key
+            counter_name (str): 'login_attempts' or 'captchas'
+        Returns:
+            list: cache keys
+        """
+        bucket = int(time.time()) // LOGIN_ATTEMPTS_BUCKET
+        scope = hashlib.sha256(str(self.session_key).encode("utf-8")).hexdigest()[:32]
+        owner = "all" if user_id == None else f"user_{user_id}"
+        return [
+            f"graphbox_{counter_name}:{scope}:{owner}:{bucket_number}"
+            for bucket_number in range(
+                bucket - LOGIN_ATTEMPTS_WINDOW // LOGIN_ATTEMPTS_BUCKET + 1, bucket + 1
+            )
+        ]
+
+    def _increment_attempts_counter(self, user_id=None, counter_name="login_attempts"):
+        cache = caches[self.attempts_cache_alias]
+        key = self._get_attempts_counter_keys(user_id, counter_name)[-1]
+        timeout = LOGIN_ATTEMPTS_WINDOW + LOGIN_ATTEMPTS_BUCKET
+        cache.add(key, 0, timeout)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # evicted between add and incr
+            cache.set(key, 1, timeout)
+
+    def _get_failed_login_attempts(self, user_id=None):
+        """Get the failed login attempts of the last hour
+
+        Args:
+            user_id (int): user id or None to get all the attempts of the session key
+        Returns:
+            QuerySet: failed login attempts
+        """
+        before_one_hour = tz.localtime() - datetime.timedelta(hours=1)
+        # the attempts of the previous requests must be counted, a replica lag would skip them
+        attempts = FailedLoginAttempt.objects.using(self.session_write_database).filter(
+            session_key=self.session_key,
+            timestamp__gte=before_one_hour,
+        )
+        if user_id != None:
+            attempts = attempts.filter(user_id=user_id)
+        return attempts
+
+    def _count_failed_login_attempts(self, user_id=None):
+        """Count the failed login attempts of the last hour
+
+        Args:
+            user_id (int): user id or None to count all the attempts of the session key
+        Returns:
+            int: failed login attempts
+        """
+        if self.attempts_counter == "cache":
+            counters = caches[self.attempts_cache_alias].get_many(
+                self._get_attempts_counter_keys(user_id)
+            )
+            return sum(counters.values())
+        count = self._get_failed_login_attempts(user_id).count()
+        if self._writer != None:
+            # the attempts on the buffer of this process aren't saved yet
+            fields = {"session_key": self.session_key}
+            if user_id != None:
+                fields["user_id"] = user_id
+            count += len(self._writer.get_pending(FailedLoginAttempt, **fields))
+        return count
+
+    def _get_active_tokens(self, token, user_id):
+        """Get the active persistent tokens of the session key with the token and the user id
+
+        The tokens are read from the write database, a token saved or deactivated by the previous request can't be missing on a replica.
+        """
+        return JsonWebToken.objects.using(self.session_write_database).filter(
+            token=token,
+            active=True,
             session_key=self.session_key,
             user_id=user_id,
         )
-        failed_login_attempt.save()
 
     def _is_captcha_required(self, user_instance=None):
         """Validate if captcha is required
@@ -711,31 +1243,16 @@ class Manager:
             bool: True if captcha is required
         """
         if self.use_captcha:
-            before_one_hour = tz.localtime() - datetime.timedelta(hours=1)
-            if user_instance != None:
-                failed_login_attempts = FailedLoginAttempt.objects.filter(
-                    user_id=user_instance.id,
-                    session_key=self.session_key,
-                    timestamp__gte=before_one_hour,
-                ).count()
-            else:
-                failed_login_attempts = FailedLoginAttempt.objects.filter(
-                    session_key=self.session_key,
-                    timestamp__gte=before_one_hour,
-                ).count()
+            failed_login_attempts = self._count_failed_login_attempts(
+                user_instance.id if user_instance != None else None
+            )
             if failed_login_attempts >= self.max_login_attempts:
                 return True
         return False
 
-    def _update_captcha_status(self):
-        """Update captcha status"""
-        expire_captcha = tz.localtime() - datetime.timedelta(
-            minutes=self.expiration_minutes
-        )
-        LoginCaptcha.objects.filter(
-            creation_time__lte=expire_captcha,
-            session_key=self.session_key,
-        ).update(active=False)
+    def _captcha_expiration_time(self):
+        """Get the creation time of the oldest captcha that is not expired"""
+        return tz.localtime() - datetime.timedelta(minutes=self.expiration_minutes)
 
     def _validate_classic_captcha(self, user_instance, captcha_id, captcha_value):
         """Validate classic captcha
@@ -747,35 +1264,64 @@ class Manager:
         Returns:
             bool: True if captcha is valid
         """
-        self._update_captcha_status()
-        if captcha_id != None and captcha_value != None:
-            if user_instance != None:
-                return (
-                    LoginCaptcha.objects.all()
-                    .filter(
-                        captcha_id=captcha_id,
-                        captcha_value=captcha_value,
-                        active=True,
-                        session_key=self.session_key,
-                        user_id=user_instance.id,
-                    )
-                    .exists()
-                )
-            else:
-                return (
-                    LoginCaptcha.objects.all()
-                    .filter(
-                        captcha_id=captcha_id,
-                        captcha_value=captcha_value,
-                        active=True,
-                        session_key=self.session_key,
-                        user_id__isnull=True,
-                    )
-                    .exists()
+        if self.captcha_storage == "signed":
+            return (
+                captcha_id != None
+                and captcha_value != None
+                and validate_signed_captcha(
+                    captcha_id,
+                    captcha_value,
+                    self.session_key,
+                    user_instance.id if user_instance != None else None,
+                    self.attempts_cache_alias,
                 )
+            )
+        if captcha_id != None and captcha_value != None:
+            return self._get_valid_captchas(
+                user_instance, captcha_id, captcha_value
+            ).exists()
         else:
             return False
 
+    def _get_valid_captchas(self, user_instance, captcha_id, captcha_value):
+        """Get the captchas of the database that are not expired with the id and the value
+
+        Args:
+            user_instance (UserObject): user instance or None
+            captcha_id (str): captcha id
+            captcha_value (str): captcha value
+        Returns:
+            QuerySet: valid captchas
+        """
+        # the captcha was saved by a previous request, so it is read from the write database
+        captchas = LoginCaptcha.objects.using(self.session_write_database).filter(
+            captcha_id=captcha_id,
+            captcha_value=captcha_value,
+            active=True,
+            session_key=self.session_key,
+            creation_time__gt=self._captcha_expiration_time(),
+        )
+        if user_instance != None:
+            return captchas.filter(user_id=user_instance.id)
+        return captchas.filter(user_id__isnull=True)
+
+    def _get_recent_captchas(self, user_instance=None):
+        """Get the captchas of the last hour to limit the captchas by user
+
+        Args:
+            user_instance (UserObject): user instance or None to get all the captchas of the session key
+        Returns:
+            QuerySet: captchas of the last hour
+        """
+        before_one_hour = tz.localtime() - datetime.timedelta(hours=1)
+        captchas = LoginCaptcha.objects.using(self.session_write_database).filter(
+            session_key=self.session_key,
+            creation_time__gte=before_one_hour,
+        )
+        if user_instance != None:
+            captchas = captchas.filter(user_id=user_instance.id)
+        return captchas
+
     def _validate_google_recaptcha_v3(self, recaptcha_token):
         """Validate google recaptcha v3
 
@@ -801,6 +1347,7 @@ class Manager:
         captcha_id=None,
         captcha_value=None,
         recaptcha_token=None,
+        captcha_required=None,
     ):
         """Validate captcha
 
@@ -808,11 +1355,14 @@ class Manager:
             captcha_id (str, optional): captcha id. Defaults to None.
             captcha_value (str, optional): captcha value. Defaults to None.
             recaptcha_token (str, optional): recaptcha token. Defaults to None.
+            captcha_required (bool, optional): result of _is_captcha_required if it is known. Defaults to None.
         Returns:
             bool: True if captcha is valid
         """
         if self.use_captcha:
-            if self._is_captcha_required(user_instance=user_instance):
+            if captcha_required == None:
+                captcha_required = self._is_captcha_required(user_instance=user_instance)
+            if captcha_required:
                 if callable(self.captcha_style):
                     captcha_style = self.captcha_style()
                 else:
@@ -847,14 +1397,35 @@ class Manager:
         """
         if self.user_model != None:
             try:
-                valid, user_instance = self._auth_with_moodle(login_id_value, password)
-                if not valid:
-                    valid, user_instance = self._auth_native(login_id_value, password)
+                valid, user_instance, rejected = False, None, False
+                for auth_method in self.auth_order:
+                    if auth_method == "moodle":
+                        valid, method_user, method_rejected = self._auth_with_moodle(
+                            login_id_value, password
+                        )
+                    else:
+                        valid, method_user, method_rejected = self._auth_native(
+                            login_id_value, password
+                        )
+                    if method_user != None:
+                        user_instance = method_user
+                    rejected = rejected or method_rejected
+                    if valid:
+                        break
+                # the attempt fails only when all the methods reject the credentials
+                if not valid and rejected:
+                    self._save_failed_login_attempt(
+                        login_id_value,
+                        password,
+                        user_instance.id if user_instance != None else None,
+                    )
+                captcha_required = self._is_captcha_required(user_instance=user_instance)
                 if self._validate_captcha(
                     user_instance=user_instance,
                     captcha_id=captcha_id,
                     captcha_value=captcha_value,
                     recaptcha_token=recaptcha_token,
+                    captcha_required=captcha_required,
                 ):
                     if valid:
                         token = self._generate_token(
@@ -869,9 +1440,6 @@ class Manager:
                             False,
                         )
                     else:
-                        captcha_required = self._is_captcha_required(
-                            user_instance=user_instance
-                        )
                         return (
                             False,
                             None,
@@ -904,6 +1472,35 @@ class Manager:
                 False,
             )
 
+    async def astart_session(
+        self,
+        login_id_value,
+        password,
+        permanent=False,
+        captcha_id=None,
+        captcha_value=None,
+        recaptcha_token=None,
+    ):
+        """Async version of start_session for ASGI deployments
+
+        The login calls the Moodle web services, the password hasher and the captcha providers, so it runs on a worker thread.
+
+        Args:
+            login_id_value (str): login id value
+            password (str): password
+            permanent (bool, optional): if True, session will be permanent. Defaults to False.
+        Returns:
+            tuple:(status (bool), user_instance (UserObject), token (str), error_message (ErrorMsgType), captcha_required=bool)
+        """
+        return await sync_to_async(self.start_session)(
+            login_id_value,
+            password,
+            permanent=permanent,
+            captcha_id=captcha_id,
+            captcha_value=captcha_value,
+            recaptcha_token=recaptcha_token,
+        )
+
     def _random_captcha_value(self):
         """Generate random captcha value
 
@@ -928,19 +1525,9 @@ class Manager:
                 **{self.login_id_field_name: login_id_value}
             ).first()
             if self._is_captcha_required(user_instance=user_instance):
-                self._update_captcha_status()
-                before_one_hour = tz.localtime() - datetime.timedelta(hours=1)
-                if user_instance != None:
-                    cantidad_captchas = LoginCaptcha.objects.filter(
-                        user_id=user_instance.id,
-                        session_key=self.session_key,
-                        creation_time__gte=before_one_hour,
-                    ).count()
-                else:
-                    cantidad_captchas = LoginCaptcha.objects.filter(
-                        session_key=self.session_key,
-                        creation_time__gte=before_one_hour,
-                    ).count()
+                if self.captcha_storage == "signed":
+                    return self._generate_signed_captcha(user_instance)
+                cantidad_captchas = self._get_recent_captchas(user_instance).count()
                 if cantidad_captchas < self.max_captcha_by_user:
                     captcha_id = str(uuid4())
                     captcha_value = self._random_captcha_value()
@@ -953,17 +1540,125 @@ class Manager:
                         session_key=self.session_key,
                         user_id=user_id,
                     )
-                    login_captcha.save()
+                    login_captcha.save(using=self.session_write_database)
                     return captcha_id
         return None
 
+    def _generate_signed_captcha(self, user_instance=None):
+        """Generate a stateless classic captcha, limited to max_captcha_by_user by hour with counters on the attempts cache
+
+        Args:
+            user_instance (UserObject): user instance
+        Returns:
+            str: signed captcha id or None if the limit is reached
+        """
+        user_id = user_instance.id if user_instance != None else None
+        counters = caches[self.attempts_cache_alias].get_many(
+            self._get_attempts_counter_keys(user_id, "captchas")
+        )
+        if sum(counters.values()) >= self.max_captcha_by_user:
+            return None
+        self._increment_attempts_counter(counter_name="captchas")
+        if user_id != None:
+            self._increment_attempts_counter(user_id, "captchas")
+        return sign_captcha(
+            self._random_captcha_value(),
+            self.expiration_minutes,
+            self.session_key,
+            user_id,
+        )
+
     def download_photo(self, url):
+        photo, fname = self.download_photo_with_hash(url)
+        return photo
+
+    def download_photo_with_hash(self, url):
+        """Download a photo on chunks to a temporary file, hashing it while it is downloaded
+
+        Args:
+            url (str): url of the photo
+        Returns:
+            tuple:(photo (ImageFile), sha1 (str))
+        """
         img_temp = tempfile.TemporaryFile(suffix=".jpg")
-        r = requests.get(url)
-        img_temp.write(r.content)
+        hasher = hashlib.sha1()
+        try:
+            with self._get_http_session().get(
+                url, timeout=self.photo_download_timeout, stream=True
+            ) as r:
+                r.raise_for_status()
+                for chunk in r.iter_content(chunk_size=65536):
+                    hasher.update(chunk)
+                    img_temp.write(chunk)
+        except:
+            img_temp.close()
+            raise
         img_temp.flush()
+        img_temp.seek(0)
         photo = ImageFile(img_temp)
-        return photo
+        return photo, hasher.hexdigest()
+
+    def _get_photo_executor(self):
+        """Get the thread pool for the deferred photo downloads"""
+        if self._photo_executor == None:
+            with self._photo_lock:
+                if self._photo_executor == None:
+                    self._photo_executor = ThreadPoolExecutor(
+                        max_workers=self.photo_download_workers,
+                        thread_name_prefix="graphbox_photo",
+                    )
+        return self._photo_executor
+
+    def _save_user_photo(self, user_instance, url):
+        """Save the photo of a new user, on the background workers after the commit if defer_photo_download is True
+
+        Args:
+            user_instance (UserObject): saved user instance
+            url (str): url of the photo
+        """
+        if self.photo_field_name == None or url == None or url == "":
+            return
+        # the workers get the pk, the instance of the request isn't shared between threads
+        user_id = user_instance.pk
+        if self.defer_photo_download:
+            transaction.on_commit(
+                lambda: self._get_photo_executor().submit(
+                    self._download_user_photo, user_id, url
+                )
+            )
+        elif self._download_user_photo(user_id, url, background=False):
+            user_instance.refresh_from_db(fields=[self.photo_field_name])
+
+    def _download_user_photo(self, user_id, url, background=True):
+        """Download the photo of a user and save only the photo field of a fresh instance, retrying the failed downloads on the background workers"""
+        retries = self.photo_download_retries if background else 0
+        for attempt in range(retries + 1):
+            if background:
+                close_old_connections()
+            photo = None
+            try:
+                user_instance = self.user_model.objects.filter(pk=user_id).first()
+                if user_instance == None:
+                    logging.warning(f"Photo download of user {user_id} skipped, the user was deleted")
+                    return False
+                photo, fname = self.download_photo_with_hash(url)
+                getattr(user_instance, self.photo_field_name).save(
+                    f"{fname}.jpg", photo, save=False
+                )
+                user_instance.save(update_fields=[self.photo_field_name])
+                return True
+            except Exception as e:
+                logging.warning(
+                    f"Photo download of user {user_id} failed (attempt {attempt + 1}): {e}"
+                )
+                if attempt < retries:
+                    time.sleep(min(2**attempt, 30))
+            finally:
+                if photo != None:
+                    photo.close()
+                if background:
+                    close_old_connections()
+        return False
 
     def start_social_session(self, token, origin):
         """Start session from social network
@@ -1089,12 +1784,8 @@ class Manager:
                     )
                     if self.active_field_name != None:
                         setattr(user_instance, self.active_field_name, True)
-                    photo = self.download_photo(urlfoto)
-                    fname = HashManager.getSHA1file(photo)
-                    getattr(user_instance, self.photo_field_name).save(
-                        f"{fname}.jpg", photo, save=True
-                    )
                     user_instance.save()
+                    self._save_user_photo(user_instance, urlfoto)
                     token = self._generate_token(user_instance, 0)
                     if token != None:
                         return (
@@ -0,0 +1,105 @@
+""" Stateless classic captcha challenges signed with the SECRET_KEY.
+"""
+
+# django imports
+from django.core import signing
+from django.core.cache import caches
+from django.utils.crypto import constant_time_compare, salted_hmac
+
+# encoding
+import base64
+import secrets
+import time
+
+SIGNING_SALT = "django_graphbox.signed_captcha"
+
+
+def _value_keystream(nonce):
+    # the image view needs the value, so it is encrypted with a keystream of the nonce instead of hashed
+    return salted_hmac(SIGNING_SALT, nonce).digest()
+
+
+def _xor_value(value, nonce):
+    return bytes(a ^ b for a, b in zip(value, _value_keystream(nonce)))
+
+
+def sign_captcha(captcha_value, expiration_minutes, session_key=None, user_id=None):
+    """Build a signed captcha id with the encrypted value, the expiration and the owner of the captcha.
+
+    Args:
+        captcha_value (str): Value of the captcha, 20 characters max.
+        expiration_minutes (int): Minutes to accept the captcha.
+        session_key (str): Session key of the session manager.
+        user_id (int): Id of the user or None.
+    Returns:
+        str: captcha id
+    """
+    nonce = secrets.token_urlsafe(12)
+    value = _xor_value(captcha_value.encode("utf-8"), nonce)
+    payload = {
+        "n": nonce,
+        "v": base64.urlsafe_b64encode(value).decode("ascii"),
+        "e": int(time.time()) + expiration_minutes * 60,
+        "s": session_key,
+        "u": user_id,
+    }
+    return signing.dumps(payload, salt=SIGNING_SALT, compress=True)
+
+
+def load_captcha(captcha_id):
+    """Load a signed captcha id.
+
+    Returns:
+        dict: {'nonce': str, 'value': str, 'expiration': int, 'session_key': str, 'user_id': int} or None if the id is not valid or expired
+    """
+    try:
+        payload = signing.loads(captcha_id, salt=SIGNING_SALT)
+        if payload["e"] < time.time():
+            return None
+        value = _xor_value(base64.urlsafe_b64decode(payload["v"]), payload["n"])
+        return {
+            "nonce": payload["n"],
+            "value": value.decode("utf-8"),
+            "expiration": payload["e"],
+            "session_key": payload["s"],
+            "user_id": payload["u"],
+        }
+    except Exception:
+        return None
+
+
+def use_captcha_once(captcha, action, cache_alias="default"):
+    """Mark an action of a captcha as used, on a cache key that expires with the captcha.
+
+    Returns:
+        bool: True if it is the first use of the action
+    """
+    timeout = max(int(captcha["expiration"] - time.time()), 1)
+    return caches[cache_alias].add(
+        f"graphbox_captcha_{action}:{captcha['nonce']}", True, timeout
+    )
+
+
+def validate_signed_captcha(
+    captcha_id, captcha_value, session_key=None, user_id=None, cache_alias="default"
+):
+    """Validate a signed captcha, each captcha id is accepted only once.
+
+    Args:
+        captcha_id (str): Signed captcha id.
+        captcha_value (str): Value sent by the user.
+        session_key (str): Session key of the session manager.
+        user_id (int): Id of the user or None.
+        cache_alias (str): Alias of the Django cache for the used captcha ids.
+    Returns:
+        bool: True if the captcha is valid
+    """
+    captcha = load_captcha(captcha_id)
+    if captcha == None:
+        return False
+    if captcha["session_key"] != session_key or captcha["user_id"] != user_id:
+        return False
+    # one validation by captcha id, even with a wrong value, to stop replays and guessing
+    if not use_captcha_once(captcha, "used", cache_alias):
+        return False
+    return constant_time_compare(captcha["value"], captcha_value)
@@ -1,19 +1,52 @@
 # models
 from django_graphbox.models import LoginCaptcha
 
+# stateless captcha
+from .signed_captcha import load_captcha, use_captcha_once
+
 # http response
 from django.http import HttpResponse
 
+# settings import
+from django.conf import settings
+
+# time management import
+from django.utils import timezone as tz
+import datetime
+
 # Create your views here.
 
 
-def captcha_image(request):
+def captcha_image(request, expiration_minutes=None):
+    """Return the image of a classic captcha, only once by captcha
+
+    Args:
+        request (HttpRequest): request with the captcha id on the id param
+        expiration_minutes (int): Minutes to accept the captchas of the database, set it like expiration_minutes of config_captcha. Defaults to the GRAPHBOX_CAPTCHA_EXPIRATION_MINUTES setting or 1.
+    """
     id = request.GET.get("id")
     # get captcha
     try:
         from captcha.image import ImageCaptcha
 
-        captcha = LoginCaptcha.objects.get(captcha_id=id)
+        if id != None and ":" in id:
+            # signed captcha, one image by captcha id
+            signed_captcha = load_captcha(id)
+            if signed_captcha != None and use_captcha_once(signed_captcha, "image"):
+                image = ImageCaptcha(width=280, height=90)
+                image_io = image.generate(signed_captcha["value"])
+                return HttpResponse(image_io, content_type="image/png")
+            return HttpResponse("Captcha no válido", status=400)
+        if expiration_minutes == None:
+            expiration_minutes = getattr(
+                settings, "GRAPHBOX_CAPTCHA_EXPIRATION_MINUTES", 1
+            )
+        # the expired captchas stay active until the purge, they are excluded by creation_time
+        captcha = LoginCaptcha.objects.get(
+            captcha_id=id,
+            creation_time__gt=tz.localtime()
+            - datetime.timedelta(minutes=expiration_minutes),
+        )
         if captcha.active and not captcha.image_generated:
             captcha.image_generated = True
             captcha.save()
@@ -25,3 +58,4 @@ def captcha_image(request):
             return HttpResponse("Captcha no válido", status=400)
     except Exception as e:
         return HttpResponse("Captcha no válido", status=400)
+
@@ -0,0 +1,38 @@
+""" Settings to run the tests of Django Graphbox.
+
+Run from the root of the repository:
+
+    PYTHONPATH=src python -m django test tests --settings=tests.settings
+"""
+
+SECRET_KEY = "django-graphbox-tests-secret-key-with-32-or-more-bytes"
+
+INSTALLED_APPS = [
+    "django.contrib.contenttypes",
+    "django.contrib.auth",
+    "graphene_django",
+    "django_graphbox",
+    "tests.testapp",
+]
+
+DATABASES = {
+    "default": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": ":memory:",
+    },
+    # a replica that never receives the writes, like a replica with lag
+    "replica": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": ":memory:",
+    },
+}
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    }
+}
+
+USE_TZ = True
+
+DEFAULT_AUTO_FIELD = "django.db.models.AutoField"
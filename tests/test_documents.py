@@ -0,0 +1,43 @@
+# django imports
+from django.test import SimpleTestCase
+
+# graphene imports
+import graphene
+
+# graphql imports
+from graphql import GraphQLError, ValidationRule
+
+# package imports
+from django_graphbox.documents import DocumentCache
+
+
+class Query(graphene.ObjectType):
+    hello = graphene.String()
+
+
+class RejectAllRule(ValidationRule):
+    def enter_document(self, node, *args):
+        self.report_error(GraphQLError("Rejected"))
+
+
+class DocumentCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.schema = graphene.Schema(query=Query).graphql_schema
+        self.document_cache = DocumentCache()
+
+    def test_documents_are_cached_by_validation_rules(self):
+        document, errors = self.document_cache.get_document(self.schema, "{ hello }")
+        self.assertEqual(errors, [])
+        document, errors = self.document_cache.get_document(
+            self.schema, "{ hello }", [RejectAllRule]
+        )
+        self.assertEqual([error.message for error in errors], ["Rejected"])
+        self.assertEqual(self.document_cache.stats()["size"], 2)
+
+    def test_hit_with_the_same_validation_rules(self):
+        self.document_cache.get_document(self.schema, "{ hello }", [RejectAllRule])
+        document, errors = self.document_cache.get_document(
+            self.schema, "{ hello }", [RejectAllRule]
+        )
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(self.document_cache.stats()["hits"], 1)
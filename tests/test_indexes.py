@@ -0,0 +1,52 @@
+# django imports
+from django.db import connection
+from django.test import TestCase
+
+# unit tests
+import unittest
+
+# package imports
+from django_graphbox.session import Manager
+
+from tests.testapp.models import User
+
+# plan of the searches on an index, SQLite reports the covering indexes apart
+INDEX_SEARCH = r"SEARCH \w+ USING (COVERING )?INDEX"
+
+
+@unittest.skipUnless(connection.vendor == "sqlite", "The query plans are of SQLite")
+class SessionIndexesTests(TestCase):
+    """The queries of the session tables made on every login and request use an index."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username="user")
+
+    def setUp(self):
+        self.manager = Manager(User)
+        self.manager.config_user_model(login_id_field_name="username")
+        self.manager.config_session_jwt(session_key="tests", persistent_tokens=True)
+
+    def assertUsesIndex(self, queryset):
+        self.assertRegex(queryset.explain(), INDEX_SEARCH)
+
+    def test_failed_login_attempts_of_user(self):
+        self.assertUsesIndex(self.manager._get_failed_login_attempts(self.user.id))
+
+    def test_failed_login_attempts_of_session_key(self):
+        self.assertUsesIndex(self.manager._get_failed_login_attempts())
+
+    def test_recent_captchas_of_user(self):
+        self.assertUsesIndex(self.manager._get_recent_captchas(self.user))
+
+    def test_recent_captchas_of_session_key(self):
+        self.assertUsesIndex(self.manager._get_recent_captchas())
+
+    def test_captcha_validation_of_user(self):
+        self.assertUsesIndex(self.manager._get_valid_captchas(self.user, "id", "value"))
+
+    def test_captcha_validation_without_user(self):
+        self.assertUsesIndex(self.manager._get_valid_captchas(None, "id", "value"))
+
+    def test_active_tokens_of_validate_access(self):
+        self.assertUsesIndex(self.manager._get_active_tokens("token", self.user.id))
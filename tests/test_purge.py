@@ -0,0 +1,72 @@
+# django imports
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone as tz
+
+# time management
+import datetime
+from io import StringIO
+
+# package imports
+from django_graphbox.models import FailedLoginAttempt, Tombstone
+from django_graphbox.purge import delete_in_pk_chunks
+
+
+class DeleteInPkChunksTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        FailedLoginAttempt.objects.bulk_create(
+            FailedLoginAttempt(
+                username=f"user{index}",
+                password="",
+                session_key="old" if index < 5 else "new",
+            )
+            for index in range(50)
+        )
+
+    def test_ranges_cover_only_the_matching_rows(self):
+        queryset = FailedLoginAttempt.objects.filter(session_key="old")
+        with CaptureQueriesContext(connection) as queries:
+            deleted = delete_in_pk_chunks(queryset, chunk_size=2)
+        self.assertEqual(deleted, 5)
+        self.assertEqual(FailedLoginAttempt.objects.count(), 45)
+        # one query for the bounds and one delete by range of the 5 matching rows
+        self.assertEqual(len(queries), 4)
+
+    def test_dry_run_counts_without_deleting(self):
+        queryset = FailedLoginAttempt.objects.filter(session_key="old")
+        self.assertEqual(delete_in_pk_chunks(queryset, chunk_size=2, dry_run=True), 5)
+        self.assertEqual(FailedLoginAttempt.objects.count(), 50)
+
+    def test_no_matching_rows(self):
+        queryset = FailedLoginAttempt.objects.filter(session_key="none")
+        self.assertEqual(delete_in_pk_chunks(queryset), 0)
+
+
+class PurgeTombstonesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Tombstone.objects.bulk_create(
+            Tombstone(model_label="testapp.Item", object_id=str(index)) for index in range(4)
+        )
+        Tombstone.objects.filter(object_id__in=["0", "1"]).update(
+            deletion_time=tz.now() - datetime.timedelta(days=31)
+        )
+
+    def purge(self, *args):
+        call_command("graphbox_purge", *args, stdout=StringIO())
+
+    def test_tombstones_older_than_the_retention_are_deleted(self):
+        self.purge("--table", "tombstones", "--tombstones-days", "30")
+        self.assertEqual(
+            sorted(Tombstone.objects.values_list("object_id", flat=True)), ["2", "3"]
+        )
+
+    def test_tombstones_are_kept_without_retention(self):
+        self.purge()
+        self.assertEqual(Tombstone.objects.count(), 4)
+        with self.assertRaisesMessage(CommandError, "--tombstones-days"):
+            self.purge("--table", "tombstones")
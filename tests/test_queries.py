@@ -0,0 +1,134 @@
+# django imports
+from django.db.models import Prefetch, Value
+from django.test import RequestFactory, TestCase
+from django.utils import timezone as tz
+
+# time management
+import datetime
+
+# graphene imports
+import graphene
+
+# package imports
+from django_graphbox.builder import SchemaBuilder
+from django_graphbox.helpers.cache import get_queryset_cache_key
+
+from tests.testapp.models import Category, Item
+
+
+class FacetsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Item.objects.create(name="a", price=1, status="draft")
+        Item.objects.create(name="b", price=1, status="published")
+        Item.objects.create(name="c", price=2, status="published")
+
+    def setUp(self):
+        self.resolver_calls = 0
+
+        def price_filter(info, **kwargs):
+            self.resolver_calls += 1
+            return 1
+
+        builder = SchemaBuilder()
+        builder.add_model(
+            Item,
+            pagination_length=10,
+            pagination_style="paginated",
+            external_filters=[
+                {"field_name": "status", "param_name": "status", "param_type": graphene.String()}
+            ],
+            internal_filters=[{"field_name": "price", "resolver_filter": price_filter}],
+            facets=True,
+        )
+        Query = builder.build_schema_query()
+        self.schema = graphene.Schema(query=type("Query", (Query, graphene.ObjectType), {}))
+
+    def execute(self, query):
+        result = self.schema.execute(query, context_value=RequestFactory().post("/"))
+        self.assertIsNone(result.errors)
+        return result.data
+
+    def test_facets_reuse_the_internal_conditions_of_the_list(self):
+        data = self.execute(
+            '{ allItem(page: 1, status: "draft") { totalItems facets { status { value count } } } }'
+        )
+        self.assertEqual(data["allItem"]["totalItems"], 1)
+        self.assertEqual(
+            data["allItem"]["facets"]["status"],
+            [{"value": "draft", "count": 1}, {"value": "published", "count": 1}],
+        )
+        self.assertEqual(self.resolver_calls, 1)
+
+    def test_internal_filters_are_resolved_once_without_facets(self):
+        self.execute("{ allItem(page: 1) { totalItems } }")
+        self.assertEqual(self.resolver_calls, 1)
+
+
+class ChangesTests(TestCase):
+    def setUp(self):
+        builder = SchemaBuilder()
+        builder.add_model(Item, sync_field="updated_at", sync_margin=5)
+        Query = builder.build_schema_query()
+        Mutation = builder.build_schema_mutation()
+        self.schema = graphene.Schema(
+            query=type("Query", (Query, graphene.ObjectType), {}),
+            mutation=type("Mutation", (Mutation, graphene.ObjectType), {}),
+        )
+
+    def execute(self, query, variables=None):
+        result = self.schema.execute(
+            query, variable_values=variables, context_value=RequestFactory().post("/")
+        )
+        self.assertIsNone(result.errors)
+        return result.data
+
+    def sync(self, since):
+        return self.execute(
+            "query ($since: DateTime!) { itemChanges(since: $since) { items { name } deletedIds watermark } }",
+            {"since": since.isoformat()},
+        )["itemChanges"]
+
+    def test_watermark_keeps_a_margin_for_late_commits(self):
+        item = Item.objects.create(name="a")
+        since = tz.now() - datetime.timedelta(minutes=1)
+        changes = self.sync(since)
+        self.assertEqual(changes["items"], [{"name": "a"}])
+        watermark = datetime.datetime.fromisoformat(changes["watermark"])
+        self.assertLess(watermark, tz.now() - datetime.timedelta(seconds=4))
+        # the changes of the margin are returned again on the next sync
+        self.assertEqual(self.sync(watermark)["items"], [{"name": "a"}])
+        self.execute(f"mutation {{ deleteItem(id: {item.id}) {{ estado }} }}")
+        changes = self.sync(watermark)
+        self.assertEqual(changes["items"], [])
+        self.assertEqual(changes["deletedIds"], [str(item.id)])
+
+
+class CacheKeyTests(TestCase):
+    config = {"name": "Item", "model": Item, "cache": {"cache_alias": "default"}}
+
+    def get_key(self, queryset):
+        return get_queryset_cache_key(self.config, "list", queryset)
+
+    def test_params_with_the_same_text_have_different_keys(self):
+        self.assertNotEqual(
+            self.get_key(Item.objects.filter(name__in=["a, b"])),
+            self.get_key(Item.objects.filter(name__in=["a", "b"])),
+        )
+        self.assertNotEqual(
+            self.get_key(Item.objects.annotate(value=Value("1"))),
+            self.get_key(Item.objects.annotate(value=Value(1))),
+        )
+        self.assertEqual(
+            self.get_key(Item.objects.filter(name__in=["a", "b"])),
+            self.get_key(Item.objects.filter(name__in=["a", "b"])),
+        )
+
+    def test_prefetch_params_are_part_of_the_key(self):
+        def get_queryset(names):
+            return Category.objects.prefetch_related(
+                Prefetch("item_set", queryset=Item.objects.filter(name__in=names))
+            )
+
+        self.assertNotEqual(self.get_key(get_queryset(["a, b"])), self.get_key(get_queryset(["a", "b"])))
+        self.assertIsNotNone(self.get_key(Category.objects.prefetch_related(Prefetch("item_set"))))
@@ -0,0 +1,100 @@
+# django imports
+from django.db.models import Count
+from django.test import RequestFactory, TestCase
+
+# graphene imports
+import graphene
+
+# package imports
+from django_graphbox.builder import SchemaBuilder
+
+from tests.testapp.models import Category, Item
+
+
+def build_schema(async_resolvers=False):
+    builder = SchemaBuilder(async_resolvers=async_resolvers)
+    builder.add_model(
+        Category,
+        annotations=[{"name": "n_items", "expression": Count("item")}],
+        nested_lists=[{"relation": "item", "name": "products", "max_length": 5}],
+    )
+    builder.add_model(Item)
+    Query = builder.build_schema_query()
+    Mutation = builder.build_schema_mutation()
+    return graphene.Schema(
+        query=type("Query", (Query, graphene.ObjectType), {}),
+        mutation=type("Mutation", (Mutation, graphene.ObjectType), {}),
+    )
+
+
+class NestedListsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name="tools")
+        for index in range(4):
+            Item.objects.create(name=f"item {index}", category=category)
+
+    def execute(self, query):
+        result = build_schema().execute(query, context_value=RequestFactory().post("/"))
+        self.assertIsNone(result.errors)
+        return result.data
+
+    def test_aliases_keep_their_own_window(self):
+        data = self.execute(
+            "{ allCategory { first: products(first: 1) { name } next: products(first: 2, offset: 2) { name } } }"
+        )
+        self.assertEqual(data["allCategory"][0]["first"], [{"name": "item 0"}])
+        self.assertEqual(
+            data["allCategory"][0]["next"], [{"name": "item 2"}, {"name": "item 3"}]
+        )
+
+    def test_unbounded_reverse_relation_is_not_exposed(self):
+        fields = build_schema().graphql_schema.get_type("CategoryType").fields
+        self.assertIn("products", fields)
+        self.assertNotIn("itemSet", fields)
+
+
+class AsyncRelationsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name="tools")
+        for index in range(3):
+            Item.objects.create(name=f"item {index}", category=cls.category)
+
+    def setUp(self):
+        self.schema = build_schema(async_resolvers=True)
+
+    async def execute(self, query):
+        result = await self.schema.execute_async(
+            query, context_value=RequestFactory().post("/")
+        )
+        self.assertIsNone(result.errors)
+        return result.data
+
+    async def test_nested_list_with_custom_name_of_relation_without_related_name(self):
+        data = await self.execute(
+            "{ allCategory { name products(first: 2) { name category { name } } } }"
+        )
+        self.assertEqual(
+            data["allCategory"][0]["products"],
+            [
+                {"name": "item 0", "category": {"name": "tools"}},
+                {"name": "item 1", "category": {"name": "tools"}},
+            ],
+        )
+
+    async def test_aliases_keep_their_own_window(self):
+        data = await self.execute(
+            "{ allCategory { first: products(first: 1) { name } next: products(offset: 1) { name } } }"
+        )
+        self.assertEqual(data["allCategory"][0]["first"], [{"name": "item 0"}])
+        self.assertEqual(
+            data["allCategory"][0]["next"], [{"name": "item 1"}, {"name": "item 2"}]
+        )
+
+    async def test_annotation_of_mutation_result(self):
+        data = await self.execute(
+            f'mutation {{ createItem(name: "item 3", price: 0, status: "draft", category: {self.category.id}) {{ estado item {{ category {{ nItems }} }} }} }}'
+        )
+        self.assertTrue(data["createItem"]["estado"])
+        self.assertEqual(data["createItem"]["item"]["category"]["nItems"], 4)
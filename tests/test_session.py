@@ -0,0 +1,476 @@
+# django imports
+from django.contrib.auth.hashers import make_password
+from django.core.cache import caches
+from django.db.models.query import QuerySet
+from django.test import RequestFactory, TestCase, override_settings
+
+# stub moodle server
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+import json
+import threading
+import time
+
+# mocks of the database errors and the google settings
+from unittest import mock
+
+# locally signed google ID tokens
+from cryptography.hazmat.primitives.asymmetric import rsa
+import jwt
+
+# package imports
+from django_graphbox.batching import BufferedWriter
+from django_graphbox.models import FailedLoginAttempt, LoginCaptcha
+from django_graphbox.session import GoogleSession, Manager
+
+from tests.testapp.models import User
+
+
+class MoodleHandler(BaseHTTPRequestHandler):
+    """Moodle web services that accept the user moodleuser with the password moodlepass."""
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers["Content-Length"])
+        body = parse_qs(self.rfile.read(length).decode())
+        if self.path == "/login/token.php":
+            if body["username"][0] == "moodleuser" and body["password"][0] == "moodlepass":
+                data = {"token": "user-token"}
+            else:
+                data = {"error": "Invalid login"}
+        else:
+            username = body["values[0]"][0]
+            data = [
+                {
+                    "username": username,
+                    "fullname": "Moodle User",
+                    "email": f"{username}@moodle.test",
+                }
+            ]
+        content = json.dumps(data).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+
+class SlowMoodleHandler(MoodleHandler):
+    """Moodle that answers after delay seconds."""
+
+    delay = 2
+
+    def do_POST(self):
+        time.sleep(self.delay)
+        super().do_POST()
+
+
+class DeadMoodleHandler(MoodleHandler):
+    """Moodle that is down, counting the requests received."""
+
+    requests = 0
+
+    def do_POST(self):
+        DeadMoodleHandler.requests += 1
+        self.send_response(503)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+
+class GoogleHandler(BaseHTTPRequestHandler):
+    """Google discovery document and JWKS, counting the requests by path."""
+
+    keys = []
+    jwks_max_age = 3600
+    requests = {}
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        GoogleHandler.requests[self.path] = GoogleHandler.requests.get(self.path, 0) + 1
+        base_url = f"http://127.0.0.1:{self.server.server_port}"
+        if self.path == "/.well-known/openid-configuration":
+            data = {
+                "issuer": base_url,
+                "jwks_uri": f"{base_url}/jwks",
+                "userinfo_endpoint": f"{base_url}/userinfo",
+            }
+            max_age = 3600
+        elif self.path == "/jwks":
+            data = {"keys": GoogleHandler.keys}
+            max_age = GoogleHandler.jwks_max_age
+        else:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        content = json.dumps(data).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Cache-Control", f"public, max-age={max_age}")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+
+class StubServer(ThreadingHTTPServer):
+    # the slow requests don't block the shutdown
+    daemon_threads = True
+    block_on_close = False
+
+    def handle_error(self, request, client_address):
+        # the clients close the connection of the slow requests after their timeout
+        pass
+
+
+def start_stub_server(handler):
+    """Serve the handler on a free port of a background thread."""
+    server = StubServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def stop_stub_server(server):
+    server.shutdown()
+    server.server_close()
+
+
+class MoodleServerTestCase(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = start_stub_server(MoodleHandler)
+        cls.moodle_urls = [
+            {"url": f"http://127.0.0.1:{cls.server.server_port}", "token": "service-token"}
+        ]
+
+    @classmethod
+    def tearDownClass(cls):
+        stop_stub_server(cls.server)
+        super().tearDownClass()
+
+    def setUp(self):
+        caches["default"].clear()
+
+
+class AuthOrderTests(MoodleServerTestCase):
+    def get_manager(self, **kwargs):
+        manager = Manager(User)
+        manager.config_user_model(login_id_field_name="username")
+        manager.config_moodle(
+            moodle_urls=self.moodle_urls,
+            moodle_id_field_name="username",
+            moodle_cache_timeout=0,
+            **kwargs,
+        )
+        manager.config_captcha(use_captcha=True, max_login_attempts=3)
+        return manager
+
+    def test_moodle_login_after_native_is_not_a_failed_attempt(self):
+        manager = self.get_manager(auth_order=["native", "moodle"])
+        for _ in range(4):
+            status, user_instance, _, error, _ = manager.start_session("moodleuser", "moodlepass")
+            self.assertTrue(status, error)
+            self.assertEqual(user_instance.username, "moodleuser")
+        self.assertEqual(FailedLoginAttempt.objects.count(), 0)
+
+    def test_native_login_after_moodle_is_not_a_failed_attempt(self):
+        User.objects.create(username="localuser", password=make_password("localpass"))
+        manager = self.get_manager(auth_order=["moodle", "native"])
+        for _ in range(4):
+            status, user_instance, _, error, _ = manager.start_session("localuser", "localpass")
+            self.assertTrue(status, error)
+        self.assertEqual(FailedLoginAttempt.objects.count(), 0)
+
+    def test_rejected_by_all_methods_is_one_failed_attempt(self):
+        user = User.objects.create(username="localuser", password=make_password("localpass"))
+        manager = self.get_manager(auth_order=["native", "moodle"])
+        status, _, _, _, _ = manager.start_session("localuser", "wrongpass")
+        self.assertFalse(status)
+        self.assertEqual(FailedLoginAttempt.objects.count(), 1)
+        self.assertEqual(FailedLoginAttempt.objects.get().user_id, user.id)
+
+
+class MoodleFanOutTests(MoodleServerTestCase):
+    """Several moodle urls requested at the same time, a healthy url with a slow or dead one."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.slow_server = start_stub_server(SlowMoodleHandler)
+        cls.dead_server = start_stub_server(DeadMoodleHandler)
+        cls.slow_url = {"url": f"http://127.0.0.1:{cls.slow_server.server_port}", "token": "service-token"}
+        cls.dead_url = {"url": f"http://127.0.0.1:{cls.dead_server.server_port}", "token": "service-token"}
+
+    @classmethod
+    def tearDownClass(cls):
+        stop_stub_server(cls.slow_server)
+        stop_stub_server(cls.dead_server)
+        super().tearDownClass()
+
+    def setUp(self):
+        super().setUp()
+        DeadMoodleHandler.requests = 0
+
+    def get_manager(self, moodle_urls, **kwargs):
+        manager = Manager(User)
+        manager.config_user_model(login_id_field_name="username")
+        manager.config_moodle(
+            moodle_urls=moodle_urls,
+            moodle_id_field_name="username",
+            moodle_cache_timeout=0,
+            **kwargs,
+        )
+        return manager
+
+    def wait_dead_requests(self, count):
+        """Wait the request of the url that is still running after the first success."""
+        deadline = time.monotonic() + 2
+        while DeadMoodleHandler.requests < count and time.monotonic() < deadline:
+            time.sleep(0.01)
+        time.sleep(0.1)
+        self.assertEqual(DeadMoodleHandler.requests, count)
+
+    def test_first_success_wins(self):
+        manager = self.get_manager([self.slow_url] + self.moodle_urls)
+        start = time.monotonic()
+        status, user_instance, _, error, _ = manager.start_session("moodleuser", "moodlepass")
+        self.assertTrue(status, error)
+        self.assertEqual(user_instance.username, "moodleuser")
+        self.assertLess(time.monotonic() - start, SlowMoodleHandler.delay)
+
+    def test_timeout_by_url(self):
+        manager = self.get_manager([self.slow_url], moodle_timeout=0.2)
+        start = time.monotonic()
+        status, _, _, _, _ = manager.start_session("moodleuser", "moodlepass")
+        self.assertFalse(status)
+        self.assertLess(time.monotonic() - start, SlowMoodleHandler.delay)
+        self.assertEqual(manager._get_moodle_breaker(self.slow_url["url"])._failures, 1)
+
+    def test_breaker_skips_the_dead_url_until_the_reset_timeout(self):
+        manager = self.get_manager(
+            [self.dead_url] + self.moodle_urls,
+            moodle_failure_threshold=2,
+            moodle_reset_timeout=0.5,
+        )
+        for count in [1, 2, 2, 2]:
+            status, _, _, error, _ = manager.start_session("moodleuser", "moodlepass")
+            self.assertTrue(status, error)
+            self.wait_dead_requests(count)
+        # half open, one request tries the dead url and opens the circuit again
+        time.sleep(0.5)
+        for count in [3, 3]:
+            status, _, _, error, _ = manager.start_session("moodleuser", "moodlepass")
+            self.assertTrue(status, error)
+            self.wait_dead_requests(count)
+
+
+class CaptchaConfigTests(TestCase):
+    def test_failed_login_attempts_are_counted_on_the_database_by_default(self):
+        manager = Manager(User)
+        manager.config_captcha(use_captcha=True)
+        self.assertEqual(manager.attempts_counter, "database")
+
+    def test_local_memory_cache_logs_a_warning(self):
+        manager = Manager(User)
+        with self.assertLogs(level="WARNING") as logs:
+            manager.config_captcha(use_captcha=True, attempts_counter="cache")
+        self.assertIn("LocMemCache", logs.output[0])
+
+    @override_settings(
+        CACHES={"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}}
+    )
+    def test_dummy_cache_is_rejected_for_signed_captchas(self):
+        manager = Manager(User)
+        with self.assertRaisesMessage(Exception, "DummyCache"):
+            manager.config_captcha(use_captcha=True, captcha_storage="signed")
+
+
+class SessionDatabasesTests(TestCase):
+    """The session tables read by the next requests use the write database, the replica lags behind."""
+
+    databases = {"default", "replica"}
+
+    def setUp(self):
+        caches["default"].clear()
+        User.objects.create(username="localuser", password=make_password("localpass"))
+        self.manager = Manager(User)
+        self.manager.config_user_model(login_id_field_name="username")
+        self.manager.config_session_jwt(persistent_tokens=True)
+        self.manager.config_captcha(use_captcha=True, max_login_attempts=1)
+        self.manager.config_database(session_read_database="replica")
+
+    def test_token_is_valid_on_the_next_request(self):
+        status, _, token, error, _ = self.manager.start_session("localuser", "localpass")
+        self.assertTrue(status, error)
+        request = RequestFactory().get("/", HTTP_AUTHORIZATION=f"Bearer {token}")
+        valid, user_instance, error = self.manager.validate_access(request, "all")
+        self.assertTrue(valid, error)
+        self.assertEqual(user_instance.username, "localuser")
+
+    def test_failed_attempts_and_captcha_of_the_previous_requests(self):
+        status, _, _, _, captcha_required = self.manager.start_session("localuser", "wrongpass")
+        self.assertFalse(status)
+        status, _, _, _, captcha_required = self.manager.start_session("localuser", "localpass")
+        self.assertFalse(status)
+        self.assertTrue(captcha_required)
+        captcha_id = self.manager.generate_classic_captcha("localuser")
+        self.assertIsNotNone(captcha_id)
+        captcha_value = LoginCaptcha.objects.get(captcha_id=captcha_id).captcha_value
+        status, _, _, error, _ = self.manager.start_session(
+            "localuser", "localpass", captcha_id=captcha_id, captcha_value=captcha_value
+        )
+        self.assertTrue(status, error)
+
+
+class BufferedWritesTests(TestCase):
+    """The flushes run on the test thread, the interval keeps the background thread waiting."""
+
+    def setUp(self):
+        caches["default"].clear()
+        self.writer = BufferedWriter(flush_interval=3600)
+        self.addCleanup(self.writer.close)
+
+    def add_attempts(self, count):
+        for _ in range(count):
+            self.writer.add(FailedLoginAttempt(session_key="tests", username="localuser"))
+
+    def test_failed_flush_is_requeued(self):
+        bulk_create = QuerySet.bulk_create
+        calls = []
+
+        def failing_bulk_create(queryset, *args, **kwargs):
+            calls.append(1)
+            if len(calls) == 1:
+                raise Exception("database unavailable")
+            return bulk_create(queryset, *args, **kwargs)
+
+        self.add_attempts(2)
+        with mock.patch.object(QuerySet, "bulk_create", autospec=True, side_effect=failing_bulk_create):
+            with self.assertLogs(level="WARNING"):
+                self.writer.flush()
+            self.assertEqual(FailedLoginAttempt.objects.count(), 0)
+            self.assertTrue(self.writer.is_pending(FailedLoginAttempt, session_key="tests"))
+            self.writer.flush()
+        self.assertEqual(FailedLoginAttempt.objects.count(), 2)
+        self.assertFalse(self.writer.is_pending(FailedLoginAttempt, session_key="tests"))
+
+    def test_rows_are_saved_one_by_one_after_the_retries(self):
+        self.add_attempts(2)
+        with mock.patch.object(QuerySet, "bulk_create", side_effect=Exception("bulk insert rejected")):
+            with self.assertLogs(level="WARNING"):
+                for _ in range(self.writer.max_retries):
+                    self.writer.flush()
+        self.assertEqual(FailedLoginAttempt.objects.count(), 2)
+        self.assertFalse(self.writer.is_pending(FailedLoginAttempt))
+
+    def test_buffered_attempts_are_counted(self):
+        User.objects.create(username="localuser", password=make_password("localpass"))
+        manager = Manager(User)
+        manager.config_user_model(login_id_field_name="username")
+        manager.config_captcha(use_captcha=True, max_login_attempts=1)
+        manager.config_database(buffered_writes=True, buffer_flush_interval=3600)
+        self.addCleanup(manager._writer.close)
+        status, _, _, _, _ = manager.start_session("localuser", "wrongpass")
+        self.assertFalse(status)
+        self.assertEqual(FailedLoginAttempt.objects.count(), 0)
+        status, _, _, _, captcha_required = manager.start_session("localuser", "localpass")
+        self.assertFalse(status)
+        self.assertTrue(captcha_required)
+        manager._writer.flush()
+
+
+class GoogleSessionTests(TestCase):
+    """ID tokens signed with local keys, verified with the JWKS of a stub discovery document."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = start_stub_server(GoogleHandler)
+        cls.base_url = f"http://127.0.0.1:{cls.server.server_port}"
+        cls.private_keys = {
+            kid: rsa.generate_private_key(public_exponent=65537, key_size=2048)
+            for kid in ["key-1", "key-2"]
+        }
+
+    @classmethod
+    def tearDownClass(cls):
+        stop_stub_server(cls.server)
+        super().tearDownClass()
+
+    def setUp(self):
+        GoogleHandler.requests = {}
+        GoogleHandler.jwks_max_age = 3600
+        self.publish_keys("key-1")
+        for name, value in [
+            ("discovery_url", f"{self.base_url}/.well-known/openid-configuration"),
+            ("client_id", "tests-client"),
+            ("_documents", {}),
+        ]:
+            patcher = mock.patch.object(GoogleSession, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def publish_keys(self, *kids):
+        GoogleHandler.keys = []
+        for kid in kids:
+            key = jwt.algorithms.RSAAlgorithm.to_jwk(self.private_keys[kid].public_key(), as_dict=True)
+            key.update({"kid": kid, "alg": "RS256", "use": "sig"})
+            GoogleHandler.keys.append(key)
+
+    def get_id_token(self, kid="key-1"):
+        now = int(time.time())
+        claims = {
+            "iss": self.base_url,
+            "aud": "tests-client",
+            "sub": "google-user",
+            "name": "Google User",
+            "email": "user@google.test",
+            "iat": now,
+            "exp": now + 300,
+        }
+        return jwt.encode(claims, self.private_keys[kid], algorithm="RS256", headers={"kid": kid})
+
+    def test_id_token_is_verified_without_userinfo(self):
+        valid, data = GoogleSession.validate(self.get_id_token())
+        self.assertTrue(valid)
+        self.assertEqual(data["sub"], "google-user")
+        self.assertNotIn("/userinfo", GoogleHandler.requests)
+
+    def test_token_of_another_client_is_rejected(self):
+        with mock.patch.object(GoogleSession, "client_id", "another-client"):
+            valid, _ = GoogleSession.validate(self.get_id_token())
+        self.assertFalse(valid)
+
+    def test_keys_are_reused_within_max_age(self):
+        for _ in range(3):
+            valid, _ = GoogleSession.validate(self.get_id_token())
+            self.assertTrue(valid)
+        self.assertEqual(GoogleHandler.requests["/.well-known/openid-configuration"], 1)
+        self.assertEqual(GoogleHandler.requests["/jwks"], 1)
+
+    def test_keys_are_downloaded_after_max_age(self):
+        GoogleHandler.jwks_max_age = 1
+        self.assertTrue(GoogleSession.validate(self.get_id_token())[0])
+        time.sleep(1.1)
+        self.assertTrue(GoogleSession.validate(self.get_id_token())[0])
+        self.assertEqual(GoogleHandler.requests["/jwks"], 2)
+        self.assertEqual(GoogleHandler.requests["/.well-known/openid-configuration"], 1)
+
+    def test_unknown_key_id_downloads_the_keys(self):
+        self.assertTrue(GoogleSession.validate(self.get_id_token("key-1"))[0])
+        # key rotation, the cached keys don't have the new key id
+        self.publish_keys("key-1", "key-2")
+        with mock.patch.object(GoogleSession, "min_refresh_seconds", 0):
+            self.assertTrue(GoogleSession.validate(self.get_id_token("key-2"))[0])
+        self.assertEqual(GoogleHandler.requests["/jwks"], 2)
+
+    def test_unknown_key_ids_download_the_keys_once_by_min_refresh_seconds(self):
+        self.assertTrue(GoogleSession.validate(self.get_id_token("key-1"))[0])
+        self.publish_keys("key-1", "key-2")
+        for _ in range(3):
+            self.assertFalse(GoogleSession.validate(self.get_id_token("key-2"))[0])
+        self.assertEqual(GoogleHandler.requests["/jwks"], 1)
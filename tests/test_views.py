@@ -0,0 +1,109 @@
+# django imports
+from django.test import RequestFactory, TestCase, override_settings
+from django.utils import timezone as tz
+
+# time management
+import datetime
+
+# graphene imports
+import graphene
+
+# request bodies
+import json
+
+# optional image library
+import importlib.util
+import unittest
+
+# package imports
+from django_graphbox.documents import DocumentCache
+from django_graphbox.graphql_views import GraphboxGraphQLView
+from django_graphbox.models import LoginCaptcha, PersistedQuery
+from django_graphbox.persisted import AllowList, DatabasePersistedQueryStore
+from django_graphbox.views import captcha_image
+
+
+class Query(graphene.ObjectType):
+    hello = graphene.String()
+
+    def resolve_hello(self, info):
+        return "world"
+
+
+schema = graphene.Schema(query=Query)
+
+
+@unittest.skipUnless(importlib.util.find_spec("captcha"), "The captcha package is not installed")
+class CaptchaImageTests(TestCase):
+    def get_image(self, captcha, **kwargs):
+        request = RequestFactory().get("/captcha", {"id": captcha.captcha_id})
+        return captcha_image(request, **kwargs)
+
+    def create_captcha(self, minutes_ago=0):
+        captcha = LoginCaptcha.objects.create(captcha_id=f"id-{minutes_ago}", captcha_value="abc123")
+        LoginCaptcha.objects.filter(pk=captcha.pk).update(
+            creation_time=tz.now() - datetime.timedelta(minutes=minutes_ago)
+        )
+        return captcha
+
+    def test_image_is_returned_once(self):
+        captcha = self.create_captcha()
+        self.assertEqual(self.get_image(captcha).status_code, 200)
+        self.assertEqual(self.get_image(captcha).status_code, 400)
+
+    def test_expired_captcha_is_rejected(self):
+        captcha = self.create_captcha(minutes_ago=2)
+        self.assertEqual(self.get_image(captcha).status_code, 400)
+        self.assertEqual(self.get_image(captcha, expiration_minutes=5).status_code, 200)
+
+    @override_settings(GRAPHBOX_CAPTCHA_EXPIRATION_MINUTES=5)
+    def test_expiration_of_the_settings(self):
+        captcha = self.create_captcha(minutes_ago=2)
+        self.assertEqual(self.get_image(captcha).status_code, 200)
+
+
+class PersistedQueriesTests(TestCase):
+    def post(self, view, query):
+        body = {
+            "query": query,
+            "extensions": {
+                "persistedQuery": {"version": 1, "sha256Hash": DocumentCache.hash_query(query)}
+            },
+        }
+        request = RequestFactory().post("/graphql", json.dumps(body), content_type="application/json")
+        return json.loads(view(request).content)
+
+    def test_allow_list_is_validated_by_as_view(self):
+        for query in ["{ hello }", "{ missing }"]:
+            PersistedQuery.objects.create(
+                query_hash=DocumentCache.hash_query(query), query=query, allow_listed=True
+            )
+        allow_list = AllowList()
+        with self.assertLogs(level="WARNING") as logs:
+            view = GraphboxGraphQLView.as_view(
+                schema=schema, allow_list_only=True, allow_list=allow_list, document_cache=DocumentCache()
+            )
+        self.assertIn("is not valid", logs.output[0])
+        self.assertEqual(
+            list(allow_list._operations[schema.graphql_schema]), [DocumentCache.hash_query("{ hello }")]
+        )
+        # the first request uses the loaded operations
+        with self.assertNumQueries(0):
+            self.assertEqual(self.post(view, "{ hello }"), {"data": {"hello": "world"}})
+
+    def test_only_valid_queries_are_persisted(self):
+        view = GraphboxGraphQLView.as_view(
+            schema=schema, persisted_queries=True, persisted_query_store=DatabasePersistedQueryStore()
+        )
+        self.assertIn("errors", self.post(view, "{ missing }"))
+        self.assertEqual(PersistedQuery.objects.count(), 0)
+        self.assertEqual(self.post(view, "{ hello }"), {"data": {"hello": "world"}})
+        self.assertEqual(PersistedQuery.objects.get().query, "{ hello }")
+
+    def test_database_store_is_bounded(self):
+        store = DatabasePersistedQueryStore(max_queries=2)
+        with self.assertLogs(level="WARNING"):
+            for index in range(3):
+                store.set(f"hash-{index}", f"query {index}")
+        self.assertEqual(PersistedQuery.objects.count(), 2)
+        self.assertIsNone(store.get("hash-2"))
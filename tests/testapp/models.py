@@ -0,0 +1,25 @@
+from django.db import models
+
+
+class User(models.Model):
+    username = models.CharField(max_length=50, unique=True)
+    email = models.EmailField(null=True)
+    name = models.CharField(max_length=100, default="")
+    password = models.CharField(max_length=200, null=True)
+    role = models.CharField(max_length=20, default="user")
+    is_active = models.BooleanField(default=True)
+    photo = models.ImageField(upload_to="photos", null=True)
+
+
+class Category(models.Model):
+    name = models.CharField(max_length=50)
+
+
+class Item(models.Model):
+    STATUS_CHOICES = (("draft", "Draft"), ("published", "Published"))
+
+    name = models.CharField(max_length=50)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="draft")
+    price = models.IntegerField(default=0)
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, null=True)
+    updated_at = models.DateTimeField(auto_now=True)